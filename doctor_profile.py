@@ -128,14 +128,21 @@ def fetch_analyses(query: dict):
     return r.json()
 
 
+def fetch_live(streams: list[str]):
+    r = requests.get(f"{API_BASE}/live/snapshot", headers=_auth_headers(), params={"streams": ",".join(streams)}, timeout=10)
+    if r.status_code != 200:
+        return None
+    return r.json()
+
+
 def post_feedback(analysis_id: int, label: str, notes: dict | None):
     r = requests.post(f"{API_BASE}/doctor/feedback/{analysis_id}", headers=_auth_headers() | {"Content-Type": "application/json"}, data=json.dumps({"label": label, "notes": notes or {}}), timeout=20)
     if r.status_code != 200:
         st.error(f"Error al enviar feedback: {r.text}")
 
 
-def export_pdf(analysis_id: int):
-    r = requests.get(f"{API_BASE}/doctor/analysis/{analysis_id}/export-pdf", headers=_auth_headers(), timeout=60)
+def export_pdf(analysis_id: int, plots: bool = False):
+    r = requests.get(f"{API_BASE}/doctor/analysis/{analysis_id}/export-pdf", headers=_auth_headers(), params={"plots": plots}, timeout=60)
     if r.status_code == 200:
         return r.content
     else:
@@ -143,6 +150,16 @@ def export_pdf(analysis_id: int):
         return None
 
 
+def export_pdf_batch(analysis_ids: list[int], plots: bool = False):
+    # Un único ZIP generado en el servidor (en paralelo) en vez de N llamadas
+    r = requests.post(f"{API_BASE}/doctor/reports/batch", headers=_auth_headers() | {"Content-Type": "application/json"},
+                      data=json.dumps({"analysis_ids": analysis_ids, "plots": plots}), timeout=300)
+    if r.status_code == 200:
+        return r.content
+    st.error(f"Error al exportar reportes: {r.text}")
+    return None
+
+
 def get_alert_settings():
     r = requests.get(f"{API_BASE}/doctor/settings/alerts", headers=_auth_headers(), timeout=15)
     if r.status_code == 200:
@@ -237,6 +254,34 @@ with st.expander("Agregar/editar paciente"):
             st.experimental_rerun()
 
 
+# --- Live monitoring ---
+# Resumen liviano (FC, último RR, calidad) por paciente cuyo identificador es el device_id;
+# un tablero externo puede suscribirse a /live/metrics (SSE) o /ws/metrics en lugar de sondear.
+st.subheader("Monitoreo en vivo")
+by_stream = {p["identifier"]: p for p in patients if p.get("identifier")}
+if not by_stream:
+    st.info("Asigne el identificador del dispositivo a los pacientes para verlos en vivo.")
+elif st.button("Actualizar monitoreo"):
+    live = fetch_live(list(by_stream))
+    if live is None:
+        st.warning("Monitoreo en vivo no disponible.")
+    else:
+        rows = [{
+            "Paciente": by_stream[r["stream"]]["name"],
+            "En línea": "sí" if r["online"] else "no",
+            "FC (lpm)": r["hr_bpm"],
+            "Último RR (ms)": r["rr_ms"],
+            "Calidad": r["quality"]["label"],
+            "Alertas": r["alerts"],
+        } for r in live["streams"] if r["stream"] in by_stream]
+        if rows:
+            st.table(rows)
+        else:
+            st.info("Ningún dispositivo de sus pacientes está transmitiendo.")
+        for a in live["recent_alerts"][-5:]:
+            st.warning(f"{by_stream[a['stream']]['name']}: {a['type']} ({a['severity']})")
+
+
 # --- Analyses and Filters ---
 st.subheader("Análisis HRV de pacientes")
 sel_patient = st.selectbox("Paciente", ["Todos"] + [f"{p['id']} - {p['name']}" for p in patients])
@@ -272,10 +317,15 @@ if rows:
                     notes_obj = {"text": notes}
                 post_feedback(sel, label, notes_obj)
         with colB:
+            with_plots = st.checkbox("Incluir gráficas (tacograma y latido)", value=False)
             if st.button("Exportar PDF"):
-                pdf = export_pdf(sel)
+                pdf = export_pdf(sel, with_plots)
                 if pdf:
                     st.download_button("Descargar PDF", data=pdf, file_name=f"hrv_report_{sel}.pdf", mime="application/pdf")
+            if st.button(f"Exportar los {len(ids)} análisis (ZIP)"):
+                zdata = export_pdf_batch(ids, with_plots)
+                if zdata:
+                    st.download_button("Descargar ZIP", data=zdata, file_name="hrv_reports.zip", mime="application/zip")
 else:
     st.info("No hay análisis para mostrar.")
 
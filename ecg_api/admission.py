@@ -0,0 +1,224 @@
+"""
+Control de admisión por clase de ruta (load shedding).
+
+Las rutas pesadas pasan por una compuerta con N cupos y una cola acotada; las
+demás (auth, health, listados) no esperan nunca. Una petición que no consigue
+cupo antes de su plazo, o que encuentra la cola llena, recibe un 503 inmediato
+con Retry-After sin haber leído el cuerpo.
+
+    clase      rutas                                               default
+    analysis   POST /analysis, POST /analysis/jobs                 limit=2*ANALYSIS_WORKERS queue=16 wait=5s
+    report     GET /doctor/analysis/{id}/export-pdf,
+               POST /doctor/reports/batch                          limit=2*REPORT_WORKERS queue=16 wait=10s
+    stream     WS /ws/ecg (conexiones abiertas, sin cola)          limit=32
+    ingest     POST /ingest/{device_id}                            limit=8 queue=32 wait=2s
+
+Cada clase se ajusta con ADMISSION_<CLASE>_LIMIT / _QUEUE / _WAIT_S (LIMIT=0 la
+desactiva). Prioridad de lo barato: el pool de hilos de AnyIO se amplía al
+arrancar para que, aun con todas las clases pesadas saturadas, queden
+ADMISSION_RESERVED_THREADS hilos para las rutas síncronas baratas.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Pattern, Tuple
+
+from ecg_api import metrics
+
+
+ADMISSION_RESERVED_THREADS = int(os.getenv("ADMISSION_RESERVED_THREADS", "16"))
+
+ADMISSION_IN_FLIGHT = metrics.Gauge("ecg_admission_in_flight", "Requests holding an admission slot", ("route_class",))
+ADMISSION_QUEUE = metrics.Gauge("ecg_admission_queue_depth", "Requests waiting for an admission slot", ("route_class",))
+ADMISSION_SHED = metrics.Counter("ecg_admission_shed_total", "Requests rejected with 503 by admission control",
+                                 ("route_class", "reason"))
+ADMISSION_WAIT = metrics.Histogram("ecg_admission_wait_seconds", "Time spent queued before admission", ("route_class",),
+                                   buckets=metrics.STAGE_BUCKETS)
+
+
+def _env(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class Gate:
+    """Semáforo FIFO con cola acotada y espera con plazo (un solo event loop)."""
+
+    def __init__(self, name: str, limit: int, queue: int = 0, wait_s: float = 0.0):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait_s = wait_s
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+        # Duración media de una petición admitida (EWMA), para estimar Retry-After
+        self._hold_s = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+    def _gauges(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self.active, self.name)
+        ADMISSION_QUEUE.set(self.waiting, self.name)
+
+    def retry_after(self) -> int:
+        """Segundos hasta que se libere cupo para lo ya encolado, según la duración media."""
+        ahead = self.waiting + 1
+        return int(min(60, max(1, math.ceil(self._hold_s * ahead / max(1, self.limit)))))
+
+    def _reject(self, reason: str) -> str:
+        self.shed[reason] += 1
+        ADMISSION_SHED.inc(1, self.name, reason)
+        return reason
+
+    async def acquire(self) -> Optional[str]:
+        """None si se obtuvo cupo; si no, el motivo del rechazo ("queue_full" | "timeout")."""
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            self._gauges()
+            return None
+        if self.waiting >= self.queue or self.wait_s <= 0:
+            return self._reject("queue_full")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._gauges()
+        t0 = time.perf_counter()
+        try:
+            # release() transfiere el cupo al waiter (active no baja) al resolver el futuro
+            await asyncio.wait_for(fut, self.wait_s)
+        except asyncio.TimeoutError:
+            if not (fut.done() and not fut.cancelled()):
+                return self._reject("timeout")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+            ADMISSION_WAIT.observe(time.perf_counter() - t0, self.name)
+            self._gauges()
+        self.admitted += 1
+        return None
+
+    def release(self, held_s: float) -> None:
+        if held_s > 0:
+            self._hold_s = 0.8 * self._hold_s + 0.2 * held_s
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self._gauges()
+                return
+        self.active -= 1
+        self._gauges()
+
+    def stats(self) -> Dict[str, object]:
+        return {"limit": self.limit, "queue": self.queue, "wait_s": self.wait_s, "active": self.active,
+                "waiting": self.waiting, "admitted": self.admitted, "shed": dict(self.shed),
+                "avg_hold_ms": round(self._hold_s * 1000.0, 1)}
+
+
+def _default_gates() -> List[Tuple[Gate, str, List[Pattern[str]]]]:
+    from ecg_api.jobs import ANALYSIS_WORKERS
+    from ecg_api.reports import REPORT_WORKERS
+    spec = [
+        ("analysis", max(2, 2 * ANALYSIS_WORKERS), 16, 5.0, "http", ["POST /analysis", "POST /analysis/jobs"]),
+        ("report", max(2, 2 * REPORT_WORKERS), 16, 10.0, "http",
+         [r"GET /doctor/analysis/\d+/export-pdf", "POST /doctor/reports/batch"]),
+        ("stream", 32, 0, 0.0, "websocket", ["/ws/ecg"]),
+        ("ingest", 8, 32, 2.0, "http", ["POST /ingest/[^/]+"]),
+    ]
+    out = []
+    for name, limit, queue, wait_s, kind, routes in spec:
+        env = f"ADMISSION_{name.upper()}"
+        limit = int(_env(f"{env}_LIMIT", limit))
+        if limit <= 0:
+            continue
+        gate = Gate(name, limit, int(_env(f"{env}_QUEUE", queue)), _env(f"{env}_WAIT_S", wait_s))
+        out.append((gate, kind, [re.compile(f"^{r}$") for r in routes]))
+    return out
+
+
+class AdmissionController:
+    def __init__(self, gates: Optional[List[Tuple[Gate, str, List[Pattern[str]]]]] = None):
+        self._gates = gates
+        self.reserved_threads = ADMISSION_RESERVED_THREADS
+
+    @property
+    def gates(self) -> List[Tuple[Gate, str, List[Pattern[str]]]]:
+        if self._gates is None:
+            self._gates = _default_gates()
+        return self._gates
+
+    def classify(self, scope) -> Optional[Gate]:
+        kind = scope["type"]
+        key = scope["path"] if kind == "websocket" else f"{scope['method']} {scope['path']}"
+        for gate, gkind, patterns in self.gates:
+            if gkind == kind and any(p.match(key) for p in patterns):
+                return gate
+        return None
+
+    def reserve_threads(self) -> int:
+        """Amplía el limitador de hilos de AnyIO: cupos pesados + reserva para rutas baratas."""
+        import anyio.to_thread
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        heavy = sum(g.limit for g, kind, _ in self.gates if kind == "http")
+        limiter.total_tokens = max(int(limiter.total_tokens), heavy + self.reserved_threads)
+        return int(limiter.total_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {g.name: g.stats() for g, _, _ in self.gates}
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """ASGI puro: decide antes del routing y sin leer el cuerpo de la petición."""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        gate = self.controller.classify(scope)
+        if gate is None:
+            return await self.app(scope, receive, send)
+        reason = await gate.acquire()
+        if reason is not None:
+            return await self._shed(scope, receive, send, gate, reason)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - t0)
+
+    async def _shed(self, scope, receive, send, gate: Gate, reason: str) -> None:
+        retry = gate.retry_after()
+        if scope["type"] == "websocket":
+            # 1013 = Try Again Later; el motivo lleva el Retry-After
+            await receive()  # websocket.connect
+            await send({"type": "websocket.accept"})
+            await send({"type": "websocket.close", "code": 1013, "reason": f"overloaded, retry after {retry}s"})
+            return
+        body = json.dumps({"detail": "Server busy, retry later", "route_class": gate.name, "reason": reason}).encode()
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry).encode()), (b"x-shed-reason", reason.encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,177 @@
+"""
+Dependencias de autenticación compartidas por main.py y doctor_api.py.
+
+- El JWT se verifica una sola vez por petición (request.state) y el resultado se
+  guarda en un caché LRU/TTL token -> claims (nunca más allá del `exp` del token).
+- uid -> doctor_id se cachea igual, ahorrando el SELECT de Doctor en cada ruta.
+- invalidate_user(uid) se llama al cambiar el perfil o el usuario.
+- Las dependencias son `async def` (sólo CPU y caché): FastAPI las corre en el
+  event loop y una ruta async no pasa por el threadpool sólo para autenticar.
+AUTH_CACHE_TTL_S (default 60) acota lo que un proceso puede quedar desfasado.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import jwt
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ecg_storage.models import Doctor
+
+
+AUTH_SECRET = os.getenv("AUTH_SECRET", "dev-secret-change-me")
+AUTH_ALGO = "HS256"
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+
+
+class TTLCache:
+    """LRU acotado con expiración por entrada; thread-safe."""
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl_s: float = AUTH_CACHE_TTL_S):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        if self.ttl_s <= 0 or self.maxsize <= 0:
+            return
+        exp = time.time() + self.ttl_s
+        if expires_at is not None:
+            exp = min(exp, expires_at)
+        with self._lock:
+            self._data[key] = (exp, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop_where(self, pred: Callable[[Hashable, Any], bool]) -> int:
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if pred(k, v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+_claims_cache = TTLCache()
+_doctor_cache = TTLCache()
+
+
+def decode_token(token: str) -> dict:
+    claims = _claims_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, AUTH_SECRET, algorithms=[AUTH_ALGO])
+        exp = claims.get("exp")
+        _claims_cache.set(token, claims, expires_at=float(exp) if exp is not None else None)
+    return claims
+
+
+def extract_bearer_token(request: Request) -> Optional[str]:
+    auth = request.headers.get("Authorization")
+    if auth and auth.lower().startswith("bearer "):
+        return auth.split(" ", 1)[1].strip()
+    return None
+
+
+async def get_current_claims(request: Request) -> dict:
+    # Una verificación por petición aunque varias dependencias pidan los claims
+    claims = getattr(request.state, "claims", None)
+    if claims is not None:
+        return claims
+    # Allow token via Authorization header or query param ?token=
+    token = extract_bearer_token(request) or request.query_params.get("token")
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing token")
+    try:
+        claims = decode_token(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    request.state.claims = claims
+    return claims
+
+
+def require_roles(*roles: str):
+    async def _dep(claims: dict = Depends(get_current_claims)):
+        role = claims.get("role")
+        if roles and role not in roles:
+            raise HTTPException(status_code=403, detail="Forbidden: insufficient role")
+        return claims
+    return _dep
+
+
+async def require_doctor(claims: dict = Depends(get_current_claims)):
+    if claims.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Forbidden: doctor role required")
+    return claims
+
+
+def doctor_id_for(db: Session, uid: Any) -> Optional[int]:
+    """Id del Doctor del usuario (cacheado; los ausentes no se cachean)."""
+    if uid is None:
+        return None
+    doc_id = _doctor_cache.get(uid)
+    if doc_id is None:
+        doc_id = db.query(Doctor.id).filter(Doctor.user_id == uid).scalar()
+        if doc_id is not None:
+            _doctor_cache.set(uid, doc_id)
+    return doc_id
+
+
+async def doctor_id_for_async(db, uid: Any) -> Optional[int]:
+    """doctor_id_for() con una AsyncSession (mismo caché)."""
+    if uid is None:
+        return None
+    doc_id = _doctor_cache.get(uid)
+    if doc_id is None:
+        doc_id = (await db.execute(select(Doctor.id).where(Doctor.user_id == uid))).scalar()
+        if doc_id is not None:
+            _doctor_cache.set(uid, doc_id)
+    return doc_id
+
+
+def doctor_for(db: Session, uid: Any) -> Optional[Doctor]:
+    """Fila Doctor completa (rutas de perfil/ajustes): lectura por clave primaria."""
+    doc_id = doctor_id_for(db, uid)
+    return db.get(Doctor, doc_id) if doc_id is not None else None
+
+
+def invalidate_user(uid: Any) -> None:
+    """Olvida claims y doctor_id cacheados de un usuario (perfil/rol/contraseña/borrado)."""
+    _doctor_cache.pop_where(lambda k, _: k == uid)
+    _claims_cache.pop_where(lambda _, v: v.get("uid") == uid)
+
+
+def cache_stats() -> dict:
+    return {"claims": _claims_cache.stats(), "doctor_ids": _doctor_cache.stats()}
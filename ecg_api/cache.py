@@ -0,0 +1,195 @@
+"""
+Caché de resultados de /analysis direccionado por contenido.
+
+Clave = sha256(muestras float64, fs, per_beat, PIPELINE_VERSION, FEATURE_VERSION,
+versión en disco del clasificador). Dos niveles:
+  - memoria: LRU acotado por tamaño (ANALYSIS_CACHE_MAX_MB, default 64; 0 = desactivado)
+  - disco (opcional): ANALYSIS_CACHE_DIR, un .npz por clave sin pickle, hasta
+    ANALYSIS_CACHE_DISK_MAX_FILES archivos (se borran los más antiguos)
+El resultado calculado se comparte entre todos los que envían la misma señal. La
+entrada guarda además los analysis_id persistidos por ámbito (dueño + start_time,
+ver persist_scope), para que un hit con persist=True del mismo médico y el mismo
+inicio (o ambos sin start_time) reutilice su AnalysisResult en vez de insertar
+otro; nunca el de otro médico ni uno con eventos fechados desde otro inicio.
+"""
+
+from __future__ import annotations
+
+import datetime
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from ecg_api.pipeline import PIPELINE_VERSION
+from ecg_ml.classifier import model_mtime
+from ecg_ml.features import FEATURE_VERSION
+
+
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "64"))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or None
+ANALYSIS_CACHE_DISK_MAX_FILES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_FILES", "10000"))
+
+
+def _entry_size(out: Dict[str, Any]) -> int:
+    return len(json.dumps(out["result"], default=str)) + out["features"].nbytes + out["r_peaks"].nbytes
+
+
+class AnalysisCache:
+    def __init__(self, max_mb: float = ANALYSIS_CACHE_MAX_MB, disk_dir: Optional[str] = ANALYSIS_CACHE_DIR,
+                 disk_max_files: int = ANALYSIS_CACHE_DISK_MAX_FILES):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self.disk_max_files = disk_max_files
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.metrics = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(sig: np.ndarray, fs: float, per_beat: bool = False) -> str:
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(sig, dtype="<f8").tobytes())
+        params = {"fs": float(fs), "per_beat": bool(per_beat), "pipeline": PIPELINE_VERSION,
+                  "features": FEATURE_VERSION, "model": model_mtime()}
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def persist_scope(owner: Any, start_time: Optional[datetime.datetime]) -> str:
+        """
+        Ámbito en el que un AnalysisResult persistido puede reutilizarse. Sin
+        start_time (el cliente Streamlit no lo envía) la misma señal del mismo
+        médico es un reenvío de la misma ventana: se reutiliza el primer
+        análisis, con los eventos fechados en su llegada.
+        """
+        return f"{owner}|{start_time.isoformat() if start_time is not None else ''}"
+
+    # --- memoria ---
+    def _remember(self, key: str, out: Dict[str, Any]) -> None:
+        if self.max_bytes <= 0:
+            return
+        size = _entry_size(out)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._mem:
+                self._bytes -= self._sizes[key]
+            self._mem[key] = out
+            self._mem.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old, _ = self._mem.popitem(last=False)
+                self._bytes -= self._sizes.pop(old)
+                self.metrics["evictions"] += 1
+
+    # --- disco ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _write_disk(self, key: str, out: Dict[str, Any]) -> None:
+        buf = io.BytesIO()
+        np.savez(buf, features=out["features"], r_peaks=out["r_peaks"],
+                 result=np.array(json.dumps(out["result"])), analysis_ids=np.array(json.dumps(out.get("analysis_ids") or {})))
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp, self._path(key))
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with np.load(self._path(key), allow_pickle=False) as z:
+                # Entradas de versiones previas (un solo analysis_id sin dueño): no se reutilizan
+                aids = json.loads(str(z["analysis_ids"])) if "analysis_ids" in z.files else {}
+                return {"result": json.loads(str(z["result"])), "features": z["features"], "r_peaks": z["r_peaks"],
+                        "analysis_ids": aids}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _prune_disk(self) -> None:
+        files = glob.glob(os.path.join(self.disk_dir, "*.npz"))
+        if len(files) <= self.disk_max_files:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p))
+        for p in files[: len(files) - self.disk_max_files]:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    # --- API ---
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            out = self._mem.get(key)
+            if out is not None:
+                self._mem.move_to_end(key)
+                self.metrics["hits_memory"] += 1
+                return out
+        if self.disk_dir:
+            out = self._read_disk(key)
+            if out is not None:
+                self.metrics["hits_disk"] += 1
+                self._remember(key, out)
+                return out
+        self.metrics["misses"] += 1
+        return None
+
+    def put(self, key: str, out: Dict[str, Any]) -> None:
+        self._remember(key, out)
+        if self.disk_dir:
+            try:
+                self._write_disk(key, out)
+            except OSError:
+                pass
+
+    @staticmethod
+    def analysis_id(out: Dict[str, Any], scope: Optional[str]) -> Optional[int]:
+        """AnalysisResult ya persistido para este ámbito, si lo hay."""
+        return (out.get("analysis_ids") or {}).get(scope) if scope else None
+
+    def set_analysis_id(self, key: str, scope: Optional[str], analysis_id: int) -> None:
+        """Registra el AnalysisResult persistido para esta clave y ámbito (memoria y disco)."""
+        if not scope:
+            return
+        with self._lock:
+            out = self._mem.get(key)
+        if out is None and self.disk_dir:
+            out = self._read_disk(key)
+        if out is None:
+            return
+        with self._lock:
+            out["analysis_ids"] = {**(out.get("analysis_ids") or {}), scope: analysis_id}
+        if self.disk_dir:
+            try:
+                self._write_disk(key, out)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.metrics["hits_memory"] + self.metrics["hits_disk"]
+        total = hits + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "hit_ratio": hits / total if total else None,
+            "entries": len(self._mem),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": self.disk_dir,
+        }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,203 @@
+"""
+Benchmark de la capa de base: ruta síncrona (Session en el threadpool) contra
+ruta async (AsyncSession en el event loop) con la misma consulta de GET /events.
+
+    python -m ecg_api.db_bench --seed 20000 --concurrency 8,32,128 --seconds 10
+    DATABASE_URL=postgresql://ecg_user:...@db:5432/ecg_db python -m ecg_api.db_bench --threads 40
+
+Levanta uvicorn en un subproceso con dos rutas equivalentes, GET /sync/events
+(def + get_session + history.page) y GET /async/events (async def +
+get_async_session + history.page_async), mismo filtro y límite, y las carga con
+N clientes concurrentes (httpx, keep-alive) durante --seconds cada una.
+Reporta peticiones/s y latencias p50/p90/p99 por modo y concurrencia.
+
+--threads fija el threadpool del servidor (anyio usa 40; la API lo amplía en
+admission.reserve_threads). La ruta síncrona ocupa un hilo durante cada viaje a
+la base, así que la diferencia crece con la latencia de red hacia PostgreSQL;
+con SQLite local la consulta es casi sólo CPU y ambas rutas quedan parejas.
+El cliente comparte la máquina con el servidor: con un solo núcleo las cifras
+absolutas son conservadoras, la comparación entre modos sigue valiendo.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+BENCH_SOURCE = "db-bench"
+MODES = ("sync", "async")
+
+
+def build_app(threads: int):
+    import anyio
+    from fastapi import Depends, FastAPI
+
+    from ecg_storage import history
+    from ecg_storage.db import Event, dispose_async_engine, get_async_session, get_session
+
+    app = FastAPI()
+
+    @app.on_event("startup")
+    async def _startup():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = threads
+
+    @app.on_event("shutdown")
+    async def _shutdown():
+        await dispose_async_engine()
+
+    @app.get("/sync/events")
+    def sync_events(limit: int = 50, source: Optional[str] = None, db=Depends(get_session)):
+        return history.page(db, Event, limit=limit, source=source)[0]
+
+    @app.get("/async/events")
+    async def async_events(limit: int = 50, source: Optional[str] = None, db=Depends(get_async_session)):
+        return (await history.page_async(db, Event, limit=limit, source=source))[0]
+
+    return app
+
+
+def seed(n: int) -> int:
+    """Asegura n eventos con source=BENCH_SOURCE; retorna cuántos se insertaron."""
+    from sqlalchemy import func, select
+
+    from ecg_storage.bulk import insert_events
+    from ecg_storage.db import Event, SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        have = db.execute(select(func.count()).select_from(Event).where(Event.source == BENCH_SOURCE)).scalar() or 0
+        missing = n - have
+        if missing <= 0:
+            return 0
+        rr = np.random.default_rng(0).normal(800.0, 50.0, missing)
+        start = datetime.datetime.utcnow() - datetime.timedelta(seconds=float(rr.sum()) / 1000.0)
+        times = start + np.cumsum(rr).astype("timedelta64[ms]").astype(object)
+        rows = [
+            {"timestamp": t, "rr_ms": float(v), "hr_bpm": 60000.0 / float(v), "source": BENCH_SOURCE}
+            for t, v in zip(times, rr)
+        ]
+        insert_events(db, rows)
+        return missing
+    finally:
+        db.close()
+
+
+async def _load(url: str, concurrency: int, seconds: float, params: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    lat: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    ok = (await client.get(url, params=params)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    lat.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    ms = np.asarray(lat) * 1000.0
+    return {
+        "requests": int(ms.size), "errors": errors, "seconds": round(elapsed, 2),
+        "rps": round(ms.size / elapsed, 1),
+        **{f"p{q}_ms": round(float(np.percentile(ms, q)), 2) if ms.size else None for q in (50, 90, 99)},
+        "max_ms": round(float(ms.max()), 2) if ms.size else None,
+    }
+
+
+def _wait_ready(base: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"el servidor terminó con código {proc.returncode}")
+        try:
+            if httpx.get(f"{base}/sync/events", params={"limit": 1}, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("el servidor no respondió a tiempo")
+
+
+def run(args) -> List[Dict[str, Any]]:
+    base = f"http://127.0.0.1:{args.port}"
+    cmd = [sys.executable, "-m", "ecg_api.db_bench", "--serve", "--port", str(args.port), "--threads", str(args.threads)]
+    proc = subprocess.Popen(cmd, env=os.environ.copy())
+    results = []
+    try:
+        _wait_ready(base, proc)
+        params = {"limit": args.limit, "source": BENCH_SOURCE}
+        for mode in MODES:
+            # Conexiones del pool, caché de sentencias y primer import del driver fuera de la medición
+            asyncio.run(_load(f"{base}/{mode}/events", 4, 1.0, params))
+        for c in args.concurrency:
+            for mode in MODES:
+                r = {"mode": mode, "concurrency": c, "threads": args.threads, "limit": args.limit,
+                     **asyncio.run(_load(f"{base}/{mode}/events", c, args.seconds, params))}
+                results.append(r)
+                print(json.dumps(r), flush=True)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", default="8,32,128", help="clientes concurrentes (lista)")
+    ap.add_argument("--seconds", type=float, default=10.0, help="duración de cada corrida")
+    ap.add_argument("--limit", type=int, default=50, help="filas por petición")
+    ap.add_argument("--seed", type=int, default=20000, help="eventos de prueba a asegurar en la base")
+    ap.add_argument("--threads", type=int, default=40, help="tamaño del threadpool del servidor")
+    ap.add_argument("--port", type=int, default=18765)
+    ap.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(build_app(args.threads), host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+        return 0
+    args.concurrency = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    inserted = seed(args.seed)
+    results = run(args)
+    summary = {}
+    for c in args.concurrency:
+        s, a = [next(r for r in results if r["mode"] == m and r["concurrency"] == c) for m in MODES]
+        summary[c] = {
+            "rps_sync": s["rps"], "rps_async": a["rps"],
+            "rps_ratio": round(a["rps"] / s["rps"], 2) if s["rps"] else None,
+            "p99_sync_ms": s["p99_ms"], "p99_async_ms": a["p99_ms"],
+        }
+    print(json.dumps({"seeded": inserted, "summary": summary}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
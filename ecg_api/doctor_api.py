@@ -1,51 +1,22 @@
 from __future__ import annotations
 
 import os
-import io
 import datetime
 from typing import Optional, List
 
-import jwt
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ecg_storage.db import get_session, AnalysisResult
+from ecg_storage.db import get_async_session, get_session, AnalysisResult, METRIC_COLUMNS
 from ecg_storage.models import Doctor, Patient, DoctorAnalysisLink
-from twilio.rest import Client as TwilioClient
-import smtplib
-from email.mime.text import MIMEText
-
-AUTH_SECRET = os.getenv("AUTH_SECRET", "dev-secret-change-me")
-AUTH_ALGO = "HS256"
-
-
-# --- Auth helpers (kept local to avoid circular imports) ---
-def _extract_bearer_token(request: Request) -> Optional[str]:
-    auth = request.headers.get("Authorization")
-    if auth and auth.lower().startswith("bearer "):
-        return auth.split(" ", 1)[1].strip()
-    return None
-
-
-def get_current_claims(request: Request) -> dict:
-    token = _extract_bearer_token(request) or request.query_params.get("token")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing token")
-    try:
-        return jwt.decode(token, AUTH_SECRET, algorithms=[AUTH_ALGO])
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-
-def require_doctor(claims: dict = Depends(get_current_claims)):
-    if claims.get("role") != "doctor":
-        raise HTTPException(status_code=403, detail="Forbidden: doctor role required")
-    return claims
-
+from ecg_storage.feature_store import set_label
+from ecg_notify.dispatcher import Notification, get_dispatcher
+from ecg_api.auth import require_doctor, doctor_id_for, doctor_id_for_async, doctor_for, invalidate_user
+from ecg_api.reports import REPORT_BATCH_MAX, report_payload, report_renderer, report_version, zip_stream
 
 router = APIRouter(prefix="/doctor", tags=["doctor"])
 
@@ -77,7 +48,7 @@ class AlertSettingsIn(BaseModel):
 
 @router.get("/me")
 def get_my_profile(db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
+    doc = doctor_for(db, claims.get("uid"))
     if not doc:
         # Create minimal record derived from auth if missing
         doc = Doctor(user_id=claims.get("uid"), name=claims.get("sub") or "Doctor", email="")
@@ -99,7 +70,7 @@ def get_my_profile(db: Session = Depends(get_session), claims: dict = Depends(re
 
 @router.patch("/me")
 def update_my_profile(payload: DoctorProfileIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
+    doc = doctor_for(db, claims.get("uid"))
     if not doc:
         raise HTTPException(status_code=404, detail="Profile not found")
     doc.name = payload.name
@@ -111,6 +82,7 @@ def update_my_profile(payload: DoctorProfileIn, db: Session = Depends(get_sessio
         doc.profile_image = payload.profile_image_b64
     db.add(doc)
     db.commit()
+    invalidate_user(claims.get("uid"))
     return {"ok": True}
 
 
@@ -121,23 +93,23 @@ class LinkAnalysisIn(BaseModel):
 
 @router.post("/link-analysis")
 def link_analysis(body: LinkAnalysisIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    if not doc:
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    if doc_id is None:
         raise HTTPException(status_code=404, detail="Profile not found")
     # Validate existence
     ar = db.query(AnalysisResult).filter(AnalysisResult.id == body.analysis_id).first()
-    p = db.query(Patient).filter(Patient.id == body.patient_id, Patient.doctor_id == doc.id).first()
+    p = db.query(Patient).filter(Patient.id == body.patient_id, Patient.doctor_id == doc_id).first()
     if not ar or not p:
         raise HTTPException(status_code=404, detail="Analysis or patient not found")
     # Check existing
-    exists = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == body.analysis_id, DoctorAnalysisLink.doctor_id == doc.id).first()
+    exists = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == body.analysis_id, DoctorAnalysisLink.doctor_id == doc_id).first()
     if exists:
         # Update patient association if different
         exists.patient_id = body.patient_id
         db.add(exists)
         db.commit()
         return {"ok": True, "link_id": exists.id}
-    link = DoctorAnalysisLink(doctor_id=doc.id, patient_id=body.patient_id, analysis_id=body.analysis_id)
+    link = DoctorAnalysisLink(doctor_id=doc_id, patient_id=body.patient_id, analysis_id=body.analysis_id)
     db.add(link)
     db.commit()
     db.refresh(link)
@@ -145,11 +117,14 @@ def link_analysis(body: LinkAnalysisIn, db: Session = Depends(get_session), clai
 
 
 @router.get("/patients")
-def list_patients(db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    if not doc:
+async def list_patients(db: AsyncSession = Depends(get_async_session), claims: dict = Depends(require_doctor)):
+    doc_id = await doctor_id_for_async(db, claims.get("uid"))
+    if doc_id is None:
         return []
-    rows = db.query(Patient).filter(Patient.doctor_id == doc.id).order_by(Patient.id.asc()).all()
+    rows = (await db.execute(
+        select(Patient.id, Patient.name, Patient.email, Patient.identifier, Patient.dob)
+        .where(Patient.doctor_id == doc_id).order_by(Patient.id.asc())
+    )).all()
     return [
         {"id": r.id, "name": r.name, "email": r.email, "identifier": r.identifier, "dob": r.dob}
         for r in rows
@@ -158,10 +133,10 @@ def list_patients(db: Session = Depends(get_session), claims: dict = Depends(req
 
 @router.post("/patients")
 def create_patient(body: PatientIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    if not doc:
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    if doc_id is None:
         raise HTTPException(status_code=404, detail="Profile not found")
-    p = Patient(doctor_id=doc.id, name=body.name, email=body.email, identifier=body.identifier, dob=body.dob)
+    p = Patient(doctor_id=doc_id, name=body.name, email=body.email, identifier=body.identifier, dob=body.dob)
     db.add(p)
     db.commit()
     db.refresh(p)
@@ -170,8 +145,8 @@ def create_patient(body: PatientIn, db: Session = Depends(get_session), claims:
 
 @router.patch("/patients/{patient_id}")
 def patch_patient(patient_id: int, body: PatientIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    p = db.query(Patient).filter(Patient.id == patient_id, Patient.doctor_id == doc.id).first()
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    p = db.query(Patient).filter(Patient.id == patient_id, Patient.doctor_id == doc_id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Patient not found")
     p.name = body.name or p.name
@@ -185,8 +160,8 @@ def patch_patient(patient_id: int, body: PatientIn, db: Session = Depends(get_se
 
 @router.delete("/patients/{patient_id}")
 def delete_patient(patient_id: int, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    p = db.query(Patient).filter(Patient.id == patient_id, Patient.doctor_id == doc.id).first()
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    p = db.query(Patient).filter(Patient.id == patient_id, Patient.doctor_id == doc_id).first()
     if not p:
         raise HTTPException(status_code=404, detail="Patient not found")
     db.delete(p)
@@ -197,52 +172,51 @@ def delete_patient(patient_id: int, db: Session = Depends(get_session), claims:
 class AnalysisQuery(BaseModel):
     patient_id: Optional[int] = None
     abnormal: Optional[bool] = None
-    metric: Optional[str] = "SDNN"
+    metric: Optional[str] = "SDNN"  # SDNN / RMSSD / pNN50 / LF_HF / SNR
     op: Optional[str] = "lt"  # lt/gt
     threshold: Optional[float] = 50.0
+    top_label: Optional[str] = None
     limit: Optional[int] = 200
 
 
 @router.post("/analyses")
-def list_analyses(q: AnalysisQuery, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    if not doc:
+async def list_analyses(q: AnalysisQuery, db: AsyncSession = Depends(get_async_session), claims: dict = Depends(require_doctor)):
+    doc_id = await doctor_id_for_async(db, claims.get("uid"))
+    if doc_id is None:
         return []
-    # Join via link table
+    # Sólo columnas denormalizadas: el filtro va en SQL (antes del LIMIT) y no se lee el JSON de HRV
+    cols = [AnalysisResult.id, AnalysisResult.timestamp, DoctorAnalysisLink.patient_id,
+            *(getattr(AnalysisResult, c) for c in (*METRIC_COLUMNS.values(), "top_label"))]
     query = (
-        db.query(AnalysisResult, DoctorAnalysisLink)
+        select(*cols)
         .join(DoctorAnalysisLink, DoctorAnalysisLink.analysis_id == AnalysisResult.id)
-        .filter(DoctorAnalysisLink.doctor_id == doc.id)
+        .where(DoctorAnalysisLink.doctor_id == doc_id)
     )
     if q.patient_id:
-        query = query.filter(DoctorAnalysisLink.patient_id == q.patient_id)
-    rows = query.order_by(AnalysisResult.id.desc()).limit(q.limit or 200).all()
-
-    results = []
-    for ar, link in rows:
-        hrv = ar.hrv or {}
-        ok = True
-        if q.abnormal:
-            # Simple filter based on time metrics
-            t = hrv.get("time", {})
-            val = t.get(q.metric or "SDNN")
-            if val is None:
-                ok = False
-            else:
-                if (q.op or "lt") == "lt":
-                    ok = val < (q.threshold or 0)
-                else:
-                    ok = val > (q.threshold or 0)
-        if ok:
-            results.append({
-                "analysis_id": ar.id,
-                "timestamp": ar.timestamp.isoformat() if ar.timestamp else None,
-                "hrv": hrv,
-                "quality": ar.quality,
-                "ml": ar.ml,
-                "patient_id": link.patient_id,
-            })
-    return results
+        query = query.where(DoctorAnalysisLink.patient_id == q.patient_id)
+    if q.top_label:
+        query = query.where(AnalysisResult.top_label == q.top_label)
+    if q.abnormal:
+        col_name = METRIC_COLUMNS.get(q.metric or "SDNN")
+        if col_name is None:
+            raise HTTPException(status_code=422, detail=f"metric must be one of {sorted(METRIC_COLUMNS)}")
+        col = getattr(AnalysisResult, col_name)
+        thr = q.threshold or 0
+        # NULL (métrica no calculable) nunca cumple la condición
+        query = query.where(col < thr if (q.op or "lt") == "lt" else col > thr)
+    rows = (await db.execute(query.order_by(DoctorAnalysisLink.analysis_id.desc()).limit(q.limit or 200))).all()
+
+    return [
+        {
+            "analysis_id": r.id,
+            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+            "hrv": {"time": {"SDNN": r.sdnn, "RMSSD": r.rmssd, "pNN50": r.pnn50}, "freq": {"LF_HF": r.lf_hf}},
+            "quality": {"snr_db": r.snr_db},
+            "ml": {"top_label": r.top_label},
+            "patient_id": r.patient_id,
+        }
+        for r in rows
+    ]
 
 
 class FeedbackIn(BaseModel):
@@ -253,8 +227,8 @@ class FeedbackIn(BaseModel):
 @router.post("/feedback/{analysis_id}")
 def add_feedback(analysis_id: int, body: FeedbackIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
     # Ensure the analysis belongs to this doctor via link table
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    link = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == analysis_id, DoctorAnalysisLink.doctor_id == doc.id).first()
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    link = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == analysis_id, DoctorAnalysisLink.doctor_id == doc_id).first()
     if not link:
         raise HTTPException(status_code=404, detail="Analysis not found for this doctor")
     row = db.query(AnalysisResult).filter(AnalysisResult.id == analysis_id).first()
@@ -263,19 +237,20 @@ def add_feedback(analysis_id: int, body: FeedbackIn, db: Session = Depends(get_s
     fb = {"label": body.label, "notes": body.notes or {}, "by_uid": claims.get("uid"), "ts": datetime.datetime.utcnow().isoformat()}
     row.feedback = fb
     db.add(row)
+    set_label(db, analysis_id, body.label)
     db.commit()
     return {"ok": True}
 
 
 @router.get("/settings/alerts")
 def get_alert_settings(db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
+    doc = doctor_for(db, claims.get("uid"))
     return (doc.settings or {}).get("alerts", {}) if doc else {}
 
 
 @router.post("/settings/alerts")
 def set_alert_settings(body: AlertSettingsIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
+    doc = doctor_for(db, claims.get("uid"))
     if not doc:
         raise HTTPException(status_code=404, detail="Profile not found")
     s = doc.settings or {}
@@ -299,116 +274,151 @@ def set_alert_settings(body: AlertSettingsIn, db: Session = Depends(get_session)
 
 @router.post("/notifications/test")
 def test_notification(db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
+    doc = doctor_for(db, claims.get("uid"))
     s = (doc.settings or {}).get("alerts", {}) if doc else {}
     to = s.get("whatsapp_to")
     enabled = s.get("whatsapp_enabled")
     result = {"ok": True}
+    # Envío síncrono (es una prueba) con los clientes reutilizados del despachador
+    dispatcher = get_dispatcher()
     # WhatsApp
     if to and enabled:
-        from_num = os.getenv("TWILIO_WHATSAPP_FROM")
-        sid = os.getenv("TWILIO_SID")
-        token = os.getenv("TWILIO_TOKEN")
-        key_sid = os.getenv("TWILIO_API_KEY_SID")
-        key_secret = os.getenv("TWILIO_API_KEY_SECRET")
-        if from_num:
+        if not os.getenv("TWILIO_WHATSAPP_FROM"):
+            result["whatsapp"] = "TWILIO_WHATSAPP_FROM no configurado"
+        elif not dispatcher.configured("whatsapp"):
+            result["whatsapp"] = "Credenciales Twilio no configuradas"
+        else:
             try:
-                if key_sid and key_secret:
-                    client = TwilioClient(key_sid, key_secret)
-                elif sid and token:
-                    client = TwilioClient(sid, token)
-                else:
-                    result["whatsapp"] = "Credenciales Twilio no configuradas"
-                if 'client' in locals():
-                    res = client.messages.create(
-                        from_=from_num,
-                        to=to,
-                        body=f"[TEST] Notificación WhatsApp para {doc.name} ({datetime.datetime.utcnow().isoformat()})"
-                    )
-                    result["whatsapp_sid"] = res.sid
+                result["whatsapp_sid"] = dispatcher.send_now(Notification(
+                    "whatsapp", to, f"[TEST] Notificación WhatsApp para {doc.name} ({datetime.datetime.utcnow().isoformat()})"))
             except Exception as e:
                 result["whatsapp_error"] = str(e)
-        else:
-            result["whatsapp"] = "TWILIO_WHATSAPP_FROM no configurado"
     else:
         result["whatsapp"] = "deshabilitado"
     # Email (optional)
     e_enabled = s.get("email_enabled")
     e_to = s.get("email_to")
     if e_enabled and e_to:
-        try:
-            host = os.getenv("SMTP_HOST")
-            port = int(os.getenv("SMTP_PORT", "587"))
-            user = os.getenv("SMTP_USER")
-            pwd = os.getenv("SMTP_PASS")
-            sender = os.getenv("SMTP_FROM", user or "noreply@example.com")
-            if not host:
-                result["email"] = "SMTP_HOST no configurado"
-            else:
-                msg = MIMEText(f"Prueba de notificación para {doc.name} a las {datetime.datetime.utcnow().isoformat()}.")
-                msg["Subject"] = "ECG - Prueba de notificación"
-                msg["From"] = sender
-                msg["To"] = e_to
-                with smtplib.SMTP(host, port, timeout=20) as server:
-                    server.starttls()
-                    if user and pwd:
-                        server.login(user, pwd)
-                    server.sendmail(sender, [e_to], msg.as_string())
+        if not dispatcher.configured("email"):
+            result["email"] = "SMTP_HOST no configurado"
+        else:
+            try:
+                dispatcher.send_now(Notification(
+                    "email", e_to, f"Prueba de notificación para {doc.name} a las {datetime.datetime.utcnow().isoformat()}.",
+                    subject="ECG - Prueba de notificación"))
                 result["email"] = "enviado"
-        except Exception as e:
-            result["email_error"] = str(e)
+            except Exception as e:
+                result["email_error"] = str(e)
     else:
         result["email"] = "deshabilitado"
     return result
 
 
+@router.get("/similar/{analysis_id}")
+def similar_cases(analysis_id: int, k: int = 10, beat: Optional[int] = None, backend: Optional[str] = None, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
+    """
+    Latidos con morfología más parecida al del análisis (latido mediano o `beat`),
+    buscando en los análisis almacenados y en la referencia ECG5000.
+    """
+    from ecg_ml.similarity import get_index, BACKEND, BACKENDS
+
+    if backend is not None and backend not in BACKENDS:
+        raise HTTPException(status_code=422, detail=f"backend must be one of {', '.join(BACKENDS)}")
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    link = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == analysis_id, DoctorAnalysisLink.doctor_id == doc_id).first() if doc_id is not None else None
+    if not link:
+        raise HTTPException(status_code=404, detail="Analysis not found for this doctor")
+    index = get_index()
+    if beat is not None and index.has_beats(analysis_id) is False:
+        # Indexado desde lo guardado (backfill): sólo existe el latido mediano
+        raise HTTPException(status_code=422, detail="Only the median beat is indexed for this analysis; omit `beat`")
+    q = index.query_vector(analysis_id, beat)
+    if q is None:
+        raise HTTPException(status_code=404, detail="No indexed beats for this analysis")
+    backend = backend or BACKEND
+    hits = index.search(q, k=max(1, min(k, 100)), backend=backend, exclude_ref=analysis_id)
+    # Veredictos médicos de los análisis encontrados (una sola consulta)
+    ids = {h["analysis_id"] for h in hits if h["analysis_id"] is not None}
+    labels = {}
+    if ids:
+        for aid, fb in db.query(AnalysisResult.id, AnalysisResult.feedback).filter(AnalysisResult.id.in_(ids)).all():
+            labels[aid] = (fb or {}).get("label")
+    for h in hits:
+        if h["analysis_id"] is not None:
+            h["feedback_label"] = labels.get(h["analysis_id"])
+    # "ivf" sin centroides entrenados se resuelve por fuerza bruta: informar el backend real
+    return {"analysis_id": analysis_id, "beat": beat, "backend": index.effective_backend(backend),
+            "backend_requested": backend, "results": hits}
+
+
 # --- Export PDF ---
-def _render_pdf(ar: AnalysisResult, patient: Optional[Patient]) -> bytes:
-    # Minimal PDF via reportlab (no external binaries)
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    width, height = A4
-    y = height - 50
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y, "ECG HRV Report")
-    y -= 24
-    c.setFont("Helvetica", 10)
-    if patient:
-        c.drawString(50, y, f"Paciente: {patient.name}  ID: {patient.identifier or '-'}  Email: {patient.email or '-'}")
-        y -= 18
-    ts = ar.timestamp.isoformat() if ar.timestamp else "-"
-    c.drawString(50, y, f"Análisis ID: {ar.id}  Fecha: {ts}")
-    y -= 18
-    # HRV summary
-    t = (ar.hrv or {}).get("time", {})
-    f = (ar.hrv or {}).get("freq", {})
-    c.drawString(50, y, f"SDNN: {t.get('SDNN')}  RMSSD: {t.get('RMSSD')}  pNN50: {t.get('pNN50')}")
-    y -= 16
-    c.drawString(50, y, f"LF: {f.get('LF')}  HF: {f.get('HF')}  LF/HF: {f.get('LF_HF')}")
-    y -= 16
-    q = ar.quality or {}
-    c.drawString(50, y, f"Calidad: SNR: {q.get('snr_db')} dB  Artefactos: {q.get('artifact_ratio')}")
-    y -= 18
-    if ar.feedback:
-        c.drawString(50, y, f"Diagnóstico: {ar.feedback.get('label')}  Notas: {ar.feedback.get('notes')}")
-        y -= 18
-    c.showPage()
-    c.save()
-    return buf.getvalue()
+def _report_jobs(db: Session, doc_id: int, analysis_ids: Optional[List[int]] = None, patient_id: Optional[int] = None,
+                 plots: bool = False) -> List[tuple]:
+    """
+    [(nombre, clave, PDF cacheado o payload)] de los análisis del médico. La clave se
+    calcula con columnas livianas; el JSON de HRV sólo se lee para los que faltan en caché.
+    """
+    query = (
+        db.query(AnalysisResult.id, AnalysisResult.feedback, DoctorAnalysisLink.patient_id)
+        .join(DoctorAnalysisLink, DoctorAnalysisLink.analysis_id == AnalysisResult.id)
+        .filter(DoctorAnalysisLink.doctor_id == doc_id)
+    )
+    if analysis_ids is not None:
+        query = query.filter(AnalysisResult.id.in_(analysis_ids))
+    if patient_id is not None:
+        query = query.filter(DoctorAnalysisLink.patient_id == patient_id)
+    rows = query.order_by(AnalysisResult.id.desc()).limit(REPORT_BATCH_MAX).all()
+    pids = {r.patient_id for r in rows}
+    patients = {p.id: p for p in db.query(Patient).filter(Patient.id.in_(pids))} if pids else {}
+    jobs, missing = [], {}
+    for r in rows:
+        patient = patients.get(r.patient_id)
+        key = (r.id, report_version(r.feedback, patient, plots))
+        name = f"hrv_report_{r.id}.pdf"
+        pdf = report_renderer.get(key)
+        if pdf is not None:
+            jobs.append((name, key, pdf))
+        else:
+            missing[r.id] = (name, key, patient)
+    if missing:
+        for ar in db.query(AnalysisResult).filter(AnalysisResult.id.in_(list(missing))):
+            name, key, patient = missing[ar.id]
+            jobs.append((name, key, report_payload(ar, patient, plots)))
+    return jobs
 
 
 @router.get("/analysis/{analysis_id}/export-pdf")
-def export_pdf(analysis_id: int, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
+def export_pdf(analysis_id: int, plots: bool = False, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
     # Ensure ownership
-    doc = db.query(Doctor).filter(Doctor.user_id == claims.get("uid")).first()
-    link = db.query(DoctorAnalysisLink).filter(DoctorAnalysisLink.analysis_id == analysis_id, DoctorAnalysisLink.doctor_id == doc.id).first()
-    if not link:
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    jobs = _report_jobs(db, doc_id, [analysis_id], plots=plots) if doc_id is not None else []
+    if not jobs:
         raise HTTPException(status_code=404, detail="Analysis not found for this doctor")
-    ar = db.query(AnalysisResult).filter(AnalysisResult.id == analysis_id).first()
-    patient = db.query(Patient).filter(Patient.id == link.patient_id).first() if link else None
-    pdf_bytes = _render_pdf(ar, patient)
+    _, key, payload = jobs[0]
+    hit = isinstance(payload, bytes)
+    pdf_bytes = payload if hit else report_renderer.render(key, payload, check_cache=False)
     filename = f"hrv_report_{analysis_id}.pdf"
-    return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return Response(pdf_bytes, media_type="application/pdf",
+                    headers={"Content-Disposition": f"attachment; filename={filename}", "X-Report-Cache": "hit" if hit else "miss"})
+
+
+class ReportBatchIn(BaseModel):
+    analysis_ids: Optional[List[int]] = None
+    patient_id: Optional[int] = None
+    plots: bool = False
+
+
+@router.post("/reports/batch")
+def export_reports_batch(body: ReportBatchIn, db: Session = Depends(get_session), claims: dict = Depends(require_doctor)):
+    """ZIP con los reportes pedidos (por ids y/o paciente), emitido a medida que se generan."""
+    if body.analysis_ids is None and body.patient_id is None:
+        raise HTTPException(status_code=422, detail="analysis_ids or patient_id required")
+    if body.analysis_ids is not None and len(body.analysis_ids) > REPORT_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"At most {REPORT_BATCH_MAX} analyses per batch")
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    jobs = _report_jobs(db, doc_id, body.analysis_ids, body.patient_id, body.plots) if doc_id is not None else []
+    if not jobs:
+        raise HTTPException(status_code=404, detail="No analyses found for this doctor")
+    filename = f"hrv_reports_{body.patient_id or 'batch'}.zip"
+    return StreamingResponse(zip_stream(report_renderer, jobs), media_type="application/zip",
+                             headers={"Content-Disposition": f"attachment; filename={filename}", "X-Report-Count": str(len(jobs))})
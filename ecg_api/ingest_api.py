@@ -0,0 +1,204 @@
+"""
+Ingesta HTTP por tramas para dispositivos sin MQTT (ESP32/Arduino con ArduinoHttpClient).
+
+    POST /ingest/{device_id}          Authorization: Bearer <token de /auth/login>
+        application/octet-stream  una o varias tramas ECG1 concatenadas
+                                  (ecg_ingest/codec.py; dtype 3 = delta ~1 byte/muestra)
+        application/json          {"seq", "t0", "fs", "v", "scale"} o una lista de ellas
+    GET  /ingest/{device_id}/samples?since=&until=&width=|points_per_second=&decimation=
+
+El dispositivo acumula tramas (p. ej. 1 minuto a 250 Hz en 6 tramas de 2500
+muestras = ~18 KB en delta) y las envía en un solo POST; todas las tramas del
+cuerpo se guardan con una única escritura. Reintentar el mismo cuerpo tras un
+timeout es seguro: la clave (device_id, t0, seq) descarta lo ya guardado y la
+respuesta lo informa en "duplicates". Por eso t0 es obligatorio aquí: la hora
+de llegada cambiaría en cada reintento.
+
+Un usuario con rol "device" sólo puede enviar a su propio device_id (= username);
+admin puede enviar a cualquiera.
+
+Monitoreo en vivo (STREAMS_LIVE=1): las tramas nuevas también pasan al
+StreamManager de este nodo (ecg_ingest/streams.py: pipeline, HR/HRV y alertas
+por dispositivo; RR y alertas se guardan en events/alerts). Con STREAMS_MQTT=1
+la API además se suscribe al broker (MQTT_HOST) y alimenta el mismo gestor, sin
+un gateway aparte. GET /ingest/streams resume el estado de cada stream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import os
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from ecg_api import metrics
+from ecg_api.auth import require_roles
+from ecg_ingest.codec import DecodeError, decode_many
+from ecg_ingest.streams import StorageWriter, StreamManager
+from ecg_processing.decimate import decimate, target_points
+from ecg_storage.db import SessionLocal, get_session
+from ecg_storage.samples import chunk_row, insert_chunks, read_segments
+
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+INGEST_MAX_BODY_MB = float(os.getenv("INGEST_MAX_BODY_MB", "4"))
+INGEST_MAX_FRAMES = int(os.getenv("INGEST_MAX_FRAMES", "512"))
+INGEST_READ_MAX_S = float(os.getenv("INGEST_READ_MAX_S", "21600"))
+INGEST_READ_MAX_POINTS = int(os.getenv("INGEST_READ_MAX_POINTS", "20000"))
+STREAMS_LIVE = os.getenv("STREAMS_LIVE", "1") == "1"
+STREAMS_MQTT = os.getenv("STREAMS_MQTT", "0") == "1"
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "2"))
+DEVICE_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+HTTP_INGEST_FRAMES = metrics.Counter("ecg_http_ingest_frames_total", "Frames received by POST /ingest", ("result",))
+HTTP_INGEST_BYTES = metrics.Counter("ecg_http_ingest_bytes_total", "Request body bytes received by POST /ingest")
+HTTP_INGEST_SAMPLES = metrics.Counter("ecg_http_ingest_samples_total", "Samples received by POST /ingest")
+
+
+live_streams = StreamManager(workers=STREAM_WORKERS, storage=StorageWriter(init_db=False), queue_size=max(64, INGEST_MAX_FRAMES))
+_gateway = None
+
+
+def start_live() -> None:
+    global _gateway
+    if not STREAMS_LIVE:
+        return
+    live_streams.start()
+    if STREAMS_MQTT and _gateway is None:
+        from ecg_ingest.gateway import Gateway
+        _gateway = Gateway(manager=live_streams, client_id=f"ecg-api-{os.getpid()}")
+        _gateway.start()
+
+
+def stop_live() -> None:
+    if _gateway is not None:
+        _gateway.stop()
+    live_streams.stop()
+
+
+def _check_device(device_id: str, claims: dict) -> None:
+    if not DEVICE_ID.match(device_id):
+        raise HTTPException(status_code=422, detail="device_id inválido")
+    if claims.get("role") == "device" and claims.get("sub") != device_id:
+        raise HTTPException(status_code=403, detail="Forbidden: token de otro dispositivo")
+
+
+def _store(rows) -> int:
+    db = SessionLocal()
+    try:
+        return insert_chunks(db, rows)
+    finally:
+        db.close()
+
+
+@router.post("/{device_id}")
+async def ingest_chunks(device_id: str, request: Request, claims: dict = Depends(require_roles("device", "admin"))):
+    _check_device(device_id, claims)
+    limit = int(INGEST_MAX_BODY_MB * 1024 * 1024)
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise HTTPException(status_code=413, detail=f"Cuerpo mayor a {INGEST_MAX_BODY_MB} MB")
+    body = await request.body()
+    if len(body) > limit:
+        raise HTTPException(status_code=413, detail=f"Cuerpo mayor a {INGEST_MAX_BODY_MB} MB")
+    HTTP_INGEST_BYTES.inc(len(body))
+    try:
+        chunks = decode_many(body, max_frames=INGEST_MAX_FRAMES)
+    except DecodeError as e:
+        HTTP_INGEST_FRAMES.inc(1, "invalid")
+        raise HTTPException(status_code=400, detail=str(e))
+    if any(c.t0 is None for c in chunks):
+        HTTP_INGEST_FRAMES.inc(1, "invalid")
+        raise HTTPException(status_code=422, detail="t0 (epoch de la primera muestra) es obligatorio en /ingest")
+    rows = [chunk_row(device_id, c.seq, c.t0, c.fs, c.dtype, c.scale, c.data, c.n) for c in chunks]
+    stored = await asyncio.to_thread(_store, rows)
+    if STREAMS_LIVE and stored:
+        # Un reintento completo no se vuelve a procesar; uno parcial lo filtra el gestor por seq/t0
+        live_streams.submit_many(device_id, chunks, persisted=True)
+    duplicates = len(rows) - stored
+    HTTP_INGEST_FRAMES.inc(stored, "stored")
+    HTTP_INGEST_FRAMES.inc(duplicates, "duplicate")
+    samples = sum(c.n for c in chunks)
+    HTTP_INGEST_SAMPLES.inc(samples)
+    last = max(chunks, key=lambda c: (c.t0, c.seq))
+    return {
+        "device_id": device_id,
+        "frames": len(rows),
+        "stored": stored,
+        "duplicates": duplicates,
+        "samples": samples,
+        "last_seq": last.seq,
+        "t_end": last.t0 + last.n / last.fs,
+    }
+
+
+@router.get("/streams")
+def list_streams(alerts: int = Query(50, ge=0, le=500), claims: dict = Depends(require_roles("doctor", "admin"))):
+    """Estado de los streams en vivo de este nodo y las últimas alertas."""
+    out = live_streams.stats()
+    out["mqtt"] = _gateway.connected.is_set() if _gateway is not None else None
+    out["recent_alerts"] = list(live_streams.alerts)[-alerts:] if alerts else []
+    return out
+
+
+def _epoch(ts: Optional[datetime.datetime], default: float) -> float:
+    if ts is None:
+        return default
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts.timestamp()
+
+
+@router.get("/{device_id}/samples")
+def get_samples(
+    device_id: str,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    points_per_second: Optional[float] = Query(None, gt=0),
+    width: Optional[int] = Query(None, gt=0, le=20000),
+    decimation: str = "minmax",
+    db=Depends(get_session),
+    claims: dict = Depends(require_roles("doctor", "admin")),
+):
+    """
+    Muestras guardadas (mV) en [since, until), por tramos continuos. Por defecto
+    el último minuto; se decima (minmax conserva los picos R) si se pide width o
+    points_per_second, o si el rango supera INGEST_READ_MAX_POINTS. Sin decimar,
+    la muestra i de un tramo está en t0 + i/fs; decimado, "t" trae los offsets (s).
+    """
+    if not DEVICE_ID.match(device_id):
+        raise HTTPException(status_code=422, detail="device_id inválido")
+    if decimation not in ("minmax", "lttb"):
+        raise HTTPException(status_code=422, detail=f"decimation no soportada: {decimation}")
+    t_until = _epoch(until, datetime.datetime.now(datetime.timezone.utc).timestamp())
+    t_since = _epoch(since, t_until - 60.0)
+    span = t_until - t_since
+    if span <= 0 or span > INGEST_READ_MAX_S:
+        raise HTTPException(status_code=422, detail=f"rango inválido (máximo {INGEST_READ_MAX_S:.0f} s)")
+    segments = read_segments(db, device_id, t_since, t_until)
+    total = sum(x.size for _, _, x in segments)
+    pps = points_per_second
+    if width:
+        pps = 2.0 * width / span
+    if pps is None and total > INGEST_READ_MAX_POINTS:
+        pps = INGEST_READ_MAX_POINTS / span
+    out = []
+    for t0, fs, x in segments:
+        seg = {"t0": t0, "fs": fs, "n_raw": int(x.size)}
+        n_points = target_points(x.size, fs, pps)
+        if n_points:
+            idx = decimate(x, n_points, decimation)
+            seg["t"] = (idx / fs).round(4).tolist()
+            x = x[idx]
+        seg["v"] = x.round(4).tolist()
+        out.append(seg)
+    return {
+        "device_id": device_id,
+        "since": t_since,
+        "until": t_until,
+        "samples_raw": total,
+        "decimation": {"method": decimation, "points_per_second": pps} if pps else None,
+        "segments": out,
+    }
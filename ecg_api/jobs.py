@@ -0,0 +1,187 @@
+"""
+Ejecución del análisis en un pool de procesos con control de admisión.
+
+- ANALYSIS_WORKERS      procesos del pool (default min(4, CPUs); 0 = hilo del proceso API)
+- ANALYSIS_MAX_PENDING  análisis en vuelo (corriendo + en cola) antes de responder 503
+- ANALYSIS_JOB_TTL_S    tiempo que se conserva el resultado de un job terminado
+
+Así el trabajo de SciPy/ML no retiene el GIL del proceso que atiende HTTP y
+los médicos concurrentes se reparten los workers en orden de llegada.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from ecg_api.metrics import ANALYSIS_STAGE, observe_stages
+from ecg_api.pipeline import run_analysis, warm_up
+from ecg_api.profiling import run_profiled
+
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", str(max(1, ANALYSIS_WORKERS) * 4)))
+ANALYSIS_JOB_TTL_S = float(os.getenv("ANALYSIS_JOB_TTL_S", "3600"))
+
+
+def _noop() -> None:
+    pass
+
+
+class Busy(Exception):
+    """No hay cupo para otro análisis; el cliente debe reintentar."""
+
+    def __init__(self, retry_after: int = 2):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    owner: Any = None
+    status: str = "queued"  # queued | running | done | error
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"job_id": self.id, "status": self.status, "created": self.created, "finished": self.finished}
+        if self.status == "done":
+            out["result"] = self.result
+        elif self.status == "error":
+            out["error"] = self.error
+        return out
+
+
+class AnalysisJobs:
+    def __init__(self, workers: int = ANALYSIS_WORKERS, max_pending: int = ANALYSIS_MAX_PENDING, ttl_s: float = ANALYSIS_JOB_TTL_S):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_s = ttl_s
+        self.pending = 0
+        self.jobs: Dict[str, Job] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # spawn: los workers no heredan hilos/conexiones del proceso uvicorn
+            ctx = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=warm_up)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def warm(self) -> None:
+        """Arranca los workers (cada uno corre warm_up) antes de la primera petición."""
+        pool = self._get_pool()
+        if pool is None:
+            warm_up()
+            return
+        for fut in [pool.submit(_noop) for _ in range(self.workers)]:
+            fut.result()
+
+    def _admit(self) -> None:
+        if self.pending >= self.max_pending:
+            raise Busy(retry_after=max(1, self.pending // max(1, self.workers)))
+        self.pending += 1
+
+    async def _execute(self, sig: np.ndarray, fs: float, per_beat: bool,
+                       profile: Optional[Tuple[str, float]] = None) -> Dict[str, Any]:
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        # Con profile=(modo, intervalo_ms) el worker perfila el pipeline (ecg_api/profiling.py)
+        fn, args = (run_analysis, (sig, fs, per_beat)) if profile is None else (run_profiled, (run_analysis, (sig, fs, per_beat), *profile))
+        t0 = time.perf_counter()
+        if pool is None:
+            out = await asyncio.to_thread(fn, *args)
+        else:
+            try:
+                out = await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # Un worker murió (OOM, segfault): recrear el pool para los siguientes
+                self._pool = None
+                raise
+        total = time.perf_counter() - t0
+        if profile is not None and profile[0] == "trace":
+            return out  # tiempos inflados por el trazado: no van a los histogramas
+        timings = out.get("timings") or {}
+        observe_stages(timings)
+        # Cola del pool + pickling de ida y vuelta
+        ANALYSIS_STAGE.observe(max(0.0, total - sum(timings.values())), "pool_overhead")
+        ANALYSIS_STAGE.observe(total, "total")
+        return out
+
+    async def run(self, sig: np.ndarray, fs: float, per_beat: bool = False,
+                  profile: Optional[Tuple[str, float]] = None) -> Dict[str, Any]:
+        """Ejecuta un análisis esperando su resultado (para /analysis). Lanza Busy si no hay cupo."""
+        self._admit()
+        try:
+            return await self._execute(sig, fs, per_beat, profile)
+        finally:
+            self.pending -= 1
+
+    def submit(self, sig: np.ndarray, fs: float, per_beat: bool = False, owner: Any = None,
+               finalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> Job:
+        """
+        Encola un análisis y retorna el Job de inmediato. `finalize` (sync, se ejecuta
+        en un hilo del proceso API) recibe la salida del pipeline y retorna el resultado final.
+        """
+        self._purge()
+        self._admit()
+        job = Job(id=uuid.uuid4().hex, owner=owner)
+        self.jobs[job.id] = job
+        asyncio.get_running_loop().create_task(self._run_job(job, sig, fs, per_beat, finalize))
+        return job
+
+    def completed(self, result: Dict[str, Any], owner: Any = None) -> Job:
+        """Registra un job ya resuelto (p. ej. hit del caché) sin pasar por el pool."""
+        self._purge()
+        job = Job(id=uuid.uuid4().hex, owner=owner, status="done", result=result, finished=time.time())
+        job.done.set()
+        self.jobs[job.id] = job
+        return job
+
+    async def _run_job(self, job: Job, sig, fs, per_beat, finalize) -> None:
+        try:
+            job.status = "running"
+            out = await self._execute(sig, fs, per_beat)
+            job.result = await asyncio.to_thread(finalize, out) if finalize else out["result"]
+            job.status = "done"
+        except Exception as e:
+            job.status = "error"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.pending -= 1
+            job.finished = time.time()
+            job.done.set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _purge(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        for jid in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            self.jobs.pop(jid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending, "jobs": len(self.jobs)}
+
+
+analysis_jobs = AnalysisJobs()
@@ -0,0 +1,307 @@
+"""
+Stream de métricas derivadas para tableros (FC, último RR, calidad, alertas nuevas).
+
+    GET /live/metrics?streams=bed-1,bed-2&interval=1     text/event-stream (EventSource; ?token=)
+    WS  /ws/metrics?token=...&streams=...&interval=...   un mensaje JSON por stream y tick
+    GET /live/snapshot?streams=...                       último resumen, una sola respuesta (Streamlit)
+
+Un único hub por proceso calcula, cada LIVE_METRICS_INTERVAL_S, el resumen de
+cada stream en vivo (StreamManager de ecg_api/ingest_api.py) y lo serializa una
+vez; todos los suscriptores reciben el mismo texto ya codificado. Sin
+suscriptores no se calcula nada. Un tablero de 50 pacientes recibe 50 mensajes
+chicos por segundo en lugar de 50 formas de onda.
+
+Mensajes:
+    {"type": "metrics", "stream": "bed-7", "t": ..., "hr_bpm": 72.4, "rr_ms": 828.0,
+     "rr_t": ..., "quality": {"score": 0.9, "label": "good"}, "online": true, "lag_s": 0.004}
+    {"type": "alert", "stream": "bed-7", "alert": {"type": "tachycardia", ...}}
+
+interval (>= LIVE_METRICS_INTERVAL_S) se redondea a un múltiplo del tick. Si un
+cliente se atrasa, sus métricas pendientes se reemplazan por las más nuevas
+(sólo importa el último valor); las alertas nunca se descartan. El stream se
+asocia al paciente cuyo `identifier` coincide con el device_id: un médico sólo
+recibe los streams de sus pacientes (se filtra en el servidor al suscribirse);
+admin ve todos.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import jwt
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ecg_api import metrics
+from ecg_api.auth import decode_token, doctor_id_for, doctor_id_for_async, require_roles
+from ecg_api.ingest_api import live_streams
+from ecg_storage.db import get_async_session, get_session
+from ecg_storage.models import Patient
+
+router = APIRouter(tags=["live"])
+
+LIVE_METRICS_INTERVAL_S = float(os.getenv("LIVE_METRICS_INTERVAL_S", "1.0"))
+LIVE_METRICS_MAX_INTERVAL_S = 60.0
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "200"))
+SSE_KEEPALIVE_S = 15.0
+
+LIVE_SUBSCRIBERS = metrics.Gauge("ecg_live_subscribers", "Open derived-metrics subscriptions", ("transport",))
+LIVE_MESSAGES = metrics.Counter("ecg_live_messages_total", "Derived-metrics messages sent", ("transport",))
+LIVE_SUPERSEDED = metrics.Counter("ecg_live_superseded_total", "Metrics messages replaced by newer ones before a slow client read them")
+LIVE_TICK = metrics.Histogram("ecg_live_tick_seconds", "Time to compute and encode one derived-metrics tick",
+                              buckets=metrics.STAGE_BUCKETS)
+
+# (JSON, evento SSE) de un mensaje: se codifica una vez por tick para todos
+Encoded = Tuple[str, str]
+
+
+def _encode(kind: str, msg: dict) -> Encoded:
+    text = json.dumps(msg, separators=(",", ":"))
+    return text, f"event: {kind}\ndata: {text}\n\n"
+
+
+class Subscriber:
+    def __init__(self, streams: Optional[Set[str]], every: int):
+        self.streams = streams  # None = todos
+        self.every = max(1, every)
+        self.metrics: Dict[str, Encoded] = {}
+        self.alerts: List[Encoded] = []
+        self.event = asyncio.Event()
+
+    def wants(self, stream_id: str) -> bool:
+        return self.streams is None or stream_id in self.streams
+
+    def offer(self, tick: int, latest: Dict[str, Encoded], alerts: List[Tuple[str, Encoded]]) -> None:
+        for stream_id, msg in alerts:
+            if self.wants(stream_id):
+                self.alerts.append(msg)
+        if tick % self.every == 0:
+            if self.metrics:
+                LIVE_SUPERSEDED.inc(len(self.metrics))
+            if self.streams is None:
+                self.metrics = dict(latest)
+            else:
+                self.metrics = {s: latest[s] for s in self.streams if s in latest}
+        if self.metrics or self.alerts:
+            self.event.set()
+
+    async def next(self, timeout: Optional[float] = None) -> List[Encoded]:
+        """Mensajes pendientes (alertas primero); [] si vence el timeout."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.event.clear()
+        out = self.alerts + list(self.metrics.values())
+        self.alerts, self.metrics = [], {}
+        return out
+
+
+class MetricsHub:
+    """Calcula y codifica los resúmenes una vez por tick y los reparte entre los suscriptores."""
+
+    def __init__(self, interval_s: float = LIVE_METRICS_INTERVAL_S):
+        self.interval_s = interval_s
+        self.subscribers: Set[Subscriber] = set()
+        self.latest: Dict[str, Encoded] = {}
+        self.latest_raw: Dict[str, dict] = {}
+        self.ticks = 0
+        self._alert_seq = live_streams.alert_seq
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, streams: Optional[Set[str]], interval_s: Optional[float]) -> Subscriber:
+        if interval_s is not None and not (math.isfinite(interval_s) and interval_s > 0):
+            raise ValueError(f"interval inválido: {interval_s}")
+        every = 1 if not interval_s else math.ceil(min(interval_s, LIVE_METRICS_MAX_INTERVAL_S) / self.interval_s - 1e-9)
+        sub = Subscriber(streams, every)
+        self.subscribers.add(sub)
+        # El último resumen conocido sale de inmediato: el tablero no espera al próximo tick
+        sub.offer(0, self.latest, [])
+        if self._task is None or self._task.done():
+            # Tras un período sin suscriptores sólo interesan las alertas desde ahora
+            self._alert_seq = live_streams.alert_seq
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+
+    def _wanted(self) -> Optional[Set[str]]:
+        wanted: Set[str] = set()
+        for sub in self.subscribers:
+            if sub.streams is None:
+                return None
+            wanted |= sub.streams
+        return wanted
+
+    def _compute(self, wanted: Optional[Set[str]]) -> Tuple[Dict[str, dict], List[dict]]:
+        rows = {r["stream"]: r for r in live_streams.snapshot(wanted)}
+        self._alert_seq, alerts = live_streams.new_alerts(self._alert_seq)
+        return rows, alerts
+
+    async def tick(self) -> None:
+        t0 = time.perf_counter()
+        # Calidad y FC leen numpy de cada pipeline: fuera del event loop
+        rows, alerts = await asyncio.to_thread(self._compute, self._wanted())
+        self.ticks += 1
+        self.latest_raw = rows
+        self.latest = {s: _encode("metrics", {"type": "metrics", **r}) for s, r in rows.items()}
+        encoded_alerts = [(a["stream"], _encode("alert", {"type": "alert", "stream": a["stream"], "alert": a})) for a in alerts]
+        for sub in list(self.subscribers):
+            sub.offer(self.ticks, self.latest, encoded_alerts)
+        LIVE_TICK.observe(time.perf_counter() - t0)
+
+    async def _run(self) -> None:
+        next_t = time.monotonic()
+        while self.subscribers:
+            try:
+                await self.tick()
+            except Exception:
+                pass
+            next_t += self.interval_s
+            await asyncio.sleep(max(0.0, next_t - time.monotonic()))
+        self._task = None
+
+
+hub = MetricsHub()
+
+
+def _streams_param(streams: Optional[str]) -> Optional[Set[str]]:
+    ids = {s.strip() for s in (streams or "").split(",") if s.strip()}
+    return ids or None
+
+
+def _scope(requested: Optional[Set[str]], allowed: Optional[Set[str]]) -> Optional[Set[str]]:
+    """Streams pedidos recortados a los visibles (None = todos)."""
+    if allowed is None:
+        return requested
+    return allowed if requested is None else requested & allowed
+
+
+def _patients_query(doc_id: Optional[int]):
+    return select(Patient.identifier).where(Patient.doctor_id == doc_id, Patient.identifier.isnot(None))
+
+
+def allowed_streams(db: Session, claims: dict) -> Optional[Set[str]]:
+    """Streams visibles: admin todos (None); un médico, los identifier de sus pacientes."""
+    if claims.get("role") == "admin":
+        return None
+    doc_id = doctor_id_for(db, claims.get("uid"))
+    if doc_id is None:
+        return set()
+    return set(db.execute(_patients_query(doc_id)).scalars())
+
+
+async def allowed_streams_async(db: AsyncSession, claims: dict) -> Optional[Set[str]]:
+    """allowed_streams() con una AsyncSession."""
+    if claims.get("role") == "admin":
+        return None
+    doc_id = await doctor_id_for_async(db, claims.get("uid"))
+    if doc_id is None:
+        return set()
+    return set((await db.execute(_patients_query(doc_id))).scalars())
+
+
+@router.get("/live/snapshot")
+def live_snapshot(streams: Optional[str] = None, claims: dict = Depends(require_roles("doctor", "admin")),
+                  db: Session = Depends(get_session)):
+    """Último resumen por stream (calculado ahora si el hub no tiene suscriptores)."""
+    ids = _scope(_streams_param(streams), allowed_streams(db, claims))
+    rows = live_streams.snapshot(ids) if not hub.subscribers else [
+        r for s, r in hub.latest_raw.items() if ids is None or s in ids]
+    return {"t": time.time(), "streams": rows, "recent_alerts": [a for a in list(live_streams.alerts)[-50:]
+                                                                if ids is None or a["stream"] in ids]}
+
+
+@router.get("/live/metrics")
+async def live_metrics_sse(
+    request: Request,
+    streams: Optional[str] = None,
+    interval: Optional[float] = Query(None, gt=0, allow_inf_nan=False),
+    claims: dict = Depends(require_roles("doctor", "admin")),
+    db: AsyncSession = Depends(get_async_session),
+):
+    ids = _scope(_streams_param(streams), await allowed_streams_async(db, claims))
+    if len(hub.subscribers) >= LIVE_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Demasiados suscriptores", headers={"Retry-After": "5"})
+    sub = hub.subscribe(ids, interval)
+
+    async def _events():
+        LIVE_SUBSCRIBERS.inc(1, "sse")
+        try:
+            yield f"retry: 3000\n: interval {sub.every * hub.interval_s:g}s\n\n"
+            while True:
+                msgs = await sub.next(SSE_KEEPALIVE_S)
+                if await request.is_disconnected():
+                    break
+                if not msgs:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(sse for _, sse in msgs)
+                LIVE_MESSAGES.inc(len(msgs), "sse")
+        finally:
+            hub.unsubscribe(sub)
+            LIVE_SUBSCRIBERS.dec(1, "sse")
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/ws/metrics")
+async def live_metrics_ws(websocket: WebSocket, db: AsyncSession = Depends(get_async_session)):
+    token = websocket.query_params.get("token")
+    await websocket.accept()
+    try:
+        claims = decode_token(token) if token else None
+    except jwt.InvalidTokenError:
+        claims = None
+    if not claims:
+        await websocket.close(code=4401)
+        return
+    if claims.get("role") not in ("doctor", "admin"):
+        await websocket.close(code=4403)
+        return
+    raw = websocket.query_params.get("interval")
+    try:
+        interval = float(raw) if raw else None
+    except ValueError:
+        interval = math.nan
+    if interval is not None and not (math.isfinite(interval) and interval > 0):
+        await websocket.close(code=4400, reason="interval must be a positive number")
+        return
+    ids = _scope(_streams_param(websocket.query_params.get("streams")), await allowed_streams_async(db, claims))
+    if len(hub.subscribers) >= LIVE_MAX_SUBSCRIBERS:
+        await websocket.close(code=1013, reason="too many subscribers")
+        return
+    sub = hub.subscribe(ids, interval)
+    LIVE_SUBSCRIBERS.inc(1, "ws")
+    # El cliente no envía nada; leer sólo para enterarse del cierre
+    closed = asyncio.get_running_loop().create_task(_wait_closed(websocket))
+    try:
+        while not closed.done():
+            msgs = await sub.next(SSE_KEEPALIVE_S)
+            for text, _ in msgs:
+                await websocket.send_text(text)
+            LIVE_MESSAGES.inc(len(msgs), "ws")
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        closed.cancel()
+        hub.unsubscribe(sub)
+        LIVE_SUBSCRIBERS.dec(1, "ws")
+
+
+async def _wait_closed(websocket: WebSocket) -> None:
+    try:
+        while True:
+            await websocket.receive_text()
+    except Exception:
+        return
@@ -1,28 +1,38 @@
-from fastapi import FastAPI, WebSocket, HTTPException, Depends, Request
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 import asyncio
 import numpy as np
-from ecg_processing.p_wave import detect_p_waves
-from ecg_processing.t_wave import detect_t_waves
-from ecg_processing.hrv import compute_hrv
-from ecg_processing.intervals import compute_intervals
-from ecg_processing.filters import estimate_quality
-from ecg_ml.classifier import get_classifier
-from ecg_ml.hf_loader import get_ecg2hrv_model, run_ecg2hrv
-from typing import Optional
-from twilio.rest import Client as TwilioClient
+from ecg_processing.beats import median_beat, segment_beats
+from ecg_api.streaming import StreamFormat, FrameBatcher
+from ecg_api.payloads import AnalysisInput, analysis_body, openapi_body
+from ecg_api.jobs import Busy, analysis_jobs
+from ecg_api.cache import analysis_cache
+from ecg_api.reports import report_renderer
+from ecg_api.warmup import last_report as warmup_report, run_warmups
+from ecg_api import metrics, profiling
+from ecg_api.admission import AdmissionMiddleware, admission
+from ecg_ml.classifier import model_cache_state
+from ecg_api.auth import AUTH_ALGO, AUTH_SECRET, decode_token, extract_bearer_token, get_current_claims, invalidate_user, require_roles, cache_stats as auth_cache_stats
+from typing import Any, Optional
+from ecg_notify.dispatcher import Notification, get_dispatcher
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ecg_storage.db import init_db, get_session, Event, Alert, User, AnalysisResult, NotificationConfig
+from ecg_storage.db import init_db, engine, dispose_async_engine, on_async_engine, get_async_session, get_session, SessionLocal, Event, Alert, User, AnalysisResult, NotificationConfig, analysis_metrics
 import ecg_storage.models  # ensure models are registered with Base before init_db
+from ecg_storage.feature_store import save_features, set_label
+from ecg_storage.bulk import event_rows, insert_alerts, insert_events
+from ecg_storage import history
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 import os
 import datetime
 import jwt
 try:
     # Import condicional: en Raspberry Pi estará disponible
-    from ecg_hardware.ads1115 import stream_samples
-    HAS_ADS = True
+    from ecg_hardware.ads1115 import stream_samples, SMBus
+    # Sin smbus2 el import funciona pero stream_samples falla: usar la simulación
+    HAS_ADS = SMBus is not None
 except Exception:
     HAS_ADS = False
 
@@ -30,6 +40,9 @@ load_dotenv()  # Cargar variables desde .env si existe
 
 app = FastAPI()
 
+# Control de admisión de rutas pesadas (interno a CORS: los 503 también llevan sus cabeceras)
+app.add_middleware(AdmissionMiddleware)
+
 # CORS: permite cualquier origen (React en cualquier puerto)
 app.add_middleware(
     CORSMiddleware,
@@ -38,54 +51,96 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+def _scope_is_admin(scope) -> bool:
+    """
+    Token de admin para atender X-Profile: X-Profile-Token (permite perfilar rutas
+    de médico como /analysis), Authorization o ?token=.
+    """
+    token = None
+    for k, v in scope.get("headers", []):
+        if k == b"x-profile-token":
+            token = v.decode("latin-1").strip()
+            break
+        if k == b"authorization" and v[:7].lower() == b"bearer ":
+            token = v[7:].decode("latin-1").strip()
+    if token is None:
+        for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+            if part.startswith("token="):
+                token = part[6:]
+    try:
+        return bool(token) and decode_token(token).get("role") == "admin"
+    except jwt.InvalidTokenError:
+        return False
+
+
+app.add_middleware(profiling.ProfilingMiddleware, is_admin=_scope_is_admin)
 
 # Config JWT
-AUTH_SECRET = os.getenv("AUTH_SECRET", "dev-secret-change-me")
-AUTH_ALGO = "HS256"
 AUTH_EXP_HOURS = float(os.getenv("AUTH_EXP_HOURS", "8"))
-TWILIO_SID = os.getenv("TWILIO_SID")
-TWILIO_TOKEN = os.getenv("TWILIO_TOKEN")
-TWILIO_API_KEY_SID = os.getenv("TWILIO_API_KEY_SID")
-TWILIO_API_KEY_SECRET = os.getenv("TWILIO_API_KEY_SECRET")
-TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")  # e.g., 'whatsapp:+14155238886'
 ALERT_WHATSAPP_TO = os.getenv("ALERT_WHATSAPP_TO")        # e.g., 'whatsapp:+52155...'
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
 ADMIN_WHATSAPP = os.getenv("ADMIN_WHATSAPP")
 
-# --- Auth helpers (RBAC) ---
-def decode_token(token: str) -> dict:
-    return jwt.decode(token, AUTH_SECRET, algorithms=[AUTH_ALGO])
-
-def _extract_bearer_token(request: Request) -> str | None:
-    auth = request.headers.get("Authorization")
-    if auth and auth.lower().startswith("bearer "):
-        return auth.split(" ", 1)[1].strip()
-    return None
-
-def get_current_claims(request: Request) -> dict:
-    # Allow token via Authorization header or query param ?token=
-    token = _extract_bearer_token(request) or request.query_params.get("token")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing token")
-    try:
-        return decode_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-def require_roles(*roles: str):
-    def _dep(claims: dict = Depends(get_current_claims)):
-        role = claims.get("role")
-        if roles and role not in roles:
-            raise HTTPException(status_code=403, detail="Forbidden: insufficient role")
-        return claims
-    return _dep
+# --- Auth helpers (RBAC): ver ecg_api/auth.py ---
 
 # Initialize DB on startup
 @app.on_event("startup")
 def _startup():
     init_db()
+    admission.reserve_threads()
+    # Monitoreo en vivo de dispositivos (ecg_api/ingest_api.py), best-effort como el router
+    try:
+        from ecg_api.ingest_api import start_live
+        start_live()
+    except Exception:
+        pass
+    # Hooks opcionales (ECG_WARMUP); por defecto las dependencias pesadas se cargan en el primer uso
+    run_warmups()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    analysis_jobs.shutdown()
+    report_renderer.shutdown()
+    get_dispatcher().stop()
+    try:
+        from ecg_api.ingest_api import stop_live
+        stop_live()
+    except Exception:
+        pass
+    import ecg_ml.similarity as similarity
+    if similarity._INDEX is not None:
+        similarity._INDEX.flush()
+        if similarity._INDEX._dirty_since_save:
+            similarity._INDEX.save()
+
+
+@app.on_event("shutdown")
+async def _shutdown_async_db():
+    await dispose_async_engine()
+
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+metrics.instrument_engine(engine)
+# Rutas async (/events, /alerts, /doctor/patients, /doctor/analyses): mismas métricas, al crear su motor
+on_async_engine(lambda eng: metrics.instrument_engine(eng.sync_engine))
+metrics.StatsCollector("ecg_analysis_cache", analysis_cache.stats, "Analysis result cache")
+metrics.StatsCollector("ecg_analysis_pool", analysis_jobs.stats, "Analysis process pool")
+metrics.StatsCollector("ecg_report_cache", report_renderer.stats, "PDF report cache and pool")
+metrics.StatsCollector("ecg_auth_cache", auth_cache_stats, "Auth claims/doctor-id caches")
+metrics.StatsCollector("ecg_notify", lambda: get_dispatcher().stats(), "Notification dispatcher")
+metrics.StatsCollector("ecg_model", model_cache_state, "Classifier/HF model cache state in the API process")
+
+
+@app.get("/metrics")
+def prometheus_metrics(request: Request):
+    """Formato texto de Prometheus. Con METRICS_TOKEN definido exige Bearer o ?token=."""
+    if METRICS_TOKEN and (extract_bearer_token(request) or request.query_params.get("token")) != METRICS_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/health")
@@ -115,6 +170,7 @@ async def ecg_stream(websocket: WebSocket):
     # Validate JWT from query param for WebSocket (e.g., ws://.../ws/ecg?token=...)
     token = websocket.query_params.get("token")
     await websocket.accept()
+    metrics.WS_CLIENTS.inc(1, "/ws/ecg")
     try:
         if not token:
             await websocket.close(code=4401)
@@ -130,6 +186,16 @@ async def ecg_stream(websocket: WebSocket):
         if claims.get("role") != "doctor":
             await websocket.close(code=4403)
             return
+        # Formato negociado por query (?format=binary&dtype=int16&batch=50); json por defecto
+        try:
+            fmt = StreamFormat.from_query(websocket.query_params)
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=4400)
+            return
+        if fmt.batched:
+            await _stream_frames(websocket, fmt)
+            return
         if HAS_ADS:
             # Transmitir muestras reales desde ADS1115
             for s in stream_samples(rate=250):  # ajusta address/channel según tu wiring
@@ -137,6 +203,7 @@ async def ecg_stream(websocket: WebSocket):
                     "timestamp": s["timestamp"],
                     "voltage_mV": s["voltage_mV"],
                 })
+                metrics.WS_SAMPLES.inc(1, "/ws/ecg")
                 # cede control al loop
                 await asyncio.sleep(0)
         else:
@@ -148,173 +215,242 @@ async def ecg_stream(websocket: WebSocket):
                     "voltage_mV": random.uniform(-1, 1)
                 }
                 await websocket.send_json(data)
+                metrics.WS_SAMPLES.inc(1, "/ws/ecg")
                 await asyncio.sleep(0.04)
     except Exception:
         await websocket.close()
+    finally:
+        metrics.WS_CLIENTS.dec(1, "/ws/ecg")
+
+
+async def _stream_frames(websocket: WebSocket, fmt: StreamFormat):
+    """Envía N muestras por mensaje (binario o msgpack) en lugar de un JSON por muestra."""
+    import math
+    import time
+    fs = 250.0 if HAS_ADS else 25.0
+    batcher = FrameBatcher(fmt, fs)
+    # Cerrar la trama por cantidad o por tiempo, lo que ocurra primero
+    n = max(1, min(fmt.batch, math.ceil(fmt.interval_ms * fs / 1000.0)))
+    await websocket.send_json(fmt.describe(fs))
+    if HAS_ADS:
+        gen = stream_samples(rate=int(fs))
+
+        def _take(k: int) -> list:
+            return [next(gen) for _ in range(k)]
+
+        while True:
+            # La lectura I2C es bloqueante: hacerla fuera del event loop
+            chunk = await asyncio.to_thread(_take, n)
+            vals = np.fromiter((s["voltage_mV"] for s in chunk), dtype=float, count=len(chunk))
+            t0 = datetime.datetime.fromisoformat(chunk[0]["timestamp"].replace("Z", "+00:00")).timestamp()
+            await websocket.send_bytes(batcher.add_block(vals, t0))
+            metrics.WS_SAMPLES.inc(len(vals), "/ws/ecg")
+    else:
+        rng = np.random.default_rng()
+        while True:
+            t0 = time.time()
+            await websocket.send_bytes(batcher.add_block(rng.uniform(-1, 1, n), t0))
+            metrics.WS_SAMPLES.inc(n, "/ws/ecg")
+            await asyncio.sleep(n / fs)
 
 
 class AnalysisRequest(BaseModel):
-    signal: list  # lista de valores de la señal (mV)
+    signal: list[float]  # lista de valores de la señal (mV)
     fs: float     # frecuencia de muestreo (Hz)
     persist: bool = False  # si se deben guardar eventos/alertas
-def _detect_alerts(rr_ms: np.ndarray, pr_ms: list[float]) -> list[dict]:
-    alerts = []
-    # Simple AF heuristic: high RR variability and absence of P (handled upstream)
-    if len(rr_ms) >= 4:
-        sdnn = float(np.std(rr_ms))
-        if sdnn > 120:  # ms threshold
-            alerts.append({"type": "AF_suspected", "severity": "warning", "details": {"sdnn_ms": sdnn}})
-    # Simple AV block heuristic: prolonged PR intervals
-    long_pr = [x for x in pr_ms if x and x > 200]
-    if len(long_pr) >= 3:
-        alerts.append({"type": "AV_block_suspected", "severity": "warning", "details": {"n_long_pr": len(long_pr)}})
-    return alerts
-
-def _hrv_alerts(hrv: dict) -> list[dict]:
-    alerts = []
-    t = (hrv or {}).get('time', {})
-    f = (hrv or {}).get('freq', {})
-    sdnn = t.get('SDNN')
-    rmssd = t.get('RMSSD')
-    pnn50 = t.get('pNN50')
-    lf_hf = f.get('LF_HF')
-    # Umbrales simples (ajustables): SDNN bajo, LF/HF alto o bajo, pNN50 bajo
-    if sdnn is not None and not np.isnan(sdnn) and sdnn < 50:
-        alerts.append({"type": "HRV_low_SDNN", "severity": "warning", "details": {"sdnn": sdnn}})
-    if rmssd is not None and not np.isnan(rmssd) and rmssd < 20:
-        alerts.append({"type": "HRV_low_RMSSD", "severity": "warning", "details": {"rmssd": rmssd}})
-    if pnn50 is not None and not np.isnan(pnn50) and pnn50 < 5:
-        alerts.append({"type": "HRV_low_pNN50", "severity": "info", "details": {"pnn50": pnn50}})
-    if lf_hf is not None and not np.isnan(lf_hf) and (lf_hf > 3 or lf_hf < 0.5):
-        alerts.append({"type": "HRV_abnormal_LF_HF", "severity": "warning", "details": {"lf_hf": lf_hf}})
-    return alerts
-
-def _send_whatsapp(msg: str) -> Optional[str]:
-    dest = ADMIN_WHATSAPP or ALERT_WHATSAPP_TO
-    if not (TWILIO_WHATSAPP_FROM and dest):
-        return None
-    try:
-        if TWILIO_API_KEY_SID and TWILIO_API_KEY_SECRET:
-            client = TwilioClient(TWILIO_API_KEY_SID, TWILIO_API_KEY_SECRET)
-        elif TWILIO_SID and TWILIO_TOKEN:
-            client = TwilioClient(TWILIO_SID, TWILIO_TOKEN)
-        else:
-            return None
-        # Normaliza destino para WhatsApp
-        to = dest.strip()
-        to = to.replace(" ", "")
-        if not to.startswith("whatsapp:"):
-            if not to.startswith("+"):
-                # Si no incluye +, se deja tal cual; Twilio requiere E.164.
-                pass
-            to = f"whatsapp:{to}"
-        res = client.messages.create(
-            from_=TWILIO_WHATSAPP_FROM,
-            to=to,
-            body=msg
-        )
-        return res.sid
-    except Exception:
-        return None
+    per_beat: bool = False  # clasificar cada latido detectado (una sola llamada batch)
+    start_time: Optional[datetime.datetime] = None  # inicio del registro; default: termina ahora
+def _whatsapp_dest(override: Optional[str] = None) -> Optional[str]:
+    return override or ADMIN_WHATSAPP or ALERT_WHATSAPP_TO
 
 
-@app.post("/analysis")
-def advanced_analysis(req: AnalysisRequest, db: Session = Depends(get_session), claims: dict = Depends(require_roles("doctor"))):
+def _notify_whatsapp(msg: str, to: Optional[str] = None, key: Optional[str] = None, digest: bool = False) -> bool:
+    """Encola un WhatsApp en el despachador (no bloquea la petición). False si no se encoló."""
+    dest = _whatsapp_dest(to)
+    if not dest:
+        return False
+    return get_dispatcher().submit(Notification("whatsapp", dest, msg, key=key, digest=digest))
+
+
+def _persist_analysis(db: Session, req: AnalysisInput, out: dict) -> int:
     """
-    Endpoint para análisis avanzado de ECG: ondas P, T, HRV, intervalos.
+    Guarda eventos, alertas, el AnalysisResult y su vector de features en una sola
+    transacción (un fallo a mitad no deja eventos huérfanos); el WhatsApp se encola
+    recién tras el commit.
     """
-    sig = np.array(req.signal)
-    fs = req.fs
-    # Detectar ondas
-    p_peaks = detect_p_waves(sig, fs)
-    t_peaks = detect_t_waves(sig, fs)
-    # Simular R-peaks (en producción usa tu algoritmo QRS)
-    from scipy.signal import find_peaks
-    r_peaks, _ = find_peaks(sig, distance=int(0.6*fs), prominence=0.2)
-    # RR intervals
-    rr_intervals = np.diff(r_peaks) / fs * 1000  # ms
-    hrv_metrics = compute_hrv(rr_intervals)
-    # Intervalos PR (ejemplo)
-    pr_intervals = compute_intervals(r_peaks, p_peaks, t_peaks, fs)
-    clf = get_classifier()
-    ml_pred = clf.predict(sig, fs)
-
-    # HF model (ECG2HRV) integration (best-effort)
+    result = out["result"]
+    rr_intervals = np.asarray(result.get("rr_ms", []))
+    notify = []
     try:
-        ecg2hrv = get_ecg2hrv_model()
-        if ecg2hrv is not None:
-            hf_out = run_ecg2hrv(ecg2hrv, sig, fs)
-        else:
-            hf_out = {"ok": False, "error": "Modelo no disponible"}
-    except Exception as _:
-        hf_out = {"ok": False, "error": "Fallo al ejecutar modelo"}
-
-    quality = estimate_quality(sig, fs)
-
-    result = {
-        "n_p_peaks": int(len(p_peaks)),
-        "n_t_peaks": int(len(t_peaks)),
-        "n_r_peaks": int(len(r_peaks)),
-        "hrv": hrv_metrics,
-    "ml": ml_pred,
-    "hf_model": hf_out,
-        "quality": quality,
-        "pr_intervals_ms": pr_intervals
-    }
-
-    # Build events (RR/HR) and alerts
-    if len(rr_intervals) > 0:
-        hr_bpm_seq = 60000.0 / rr_intervals
-        result["rr_ms"] = rr_intervals.tolist()
-        result["hr_bpm_seq"] = hr_bpm_seq.tolist()
-        alerts = _detect_alerts(rr_intervals, pr_intervals)
-        # Agregar alertas basadas en HRV
-        alerts += _hrv_alerts(hrv_metrics)
-        result["alerts"] = alerts
-
-        if req.persist:
-            # Persist events
-            now = None
-            for i, rr in enumerate(rr_intervals):
-                ev = Event(timestamp=np.datetime64('now').astype('datetime64[ms]').astype(object), rr_ms=float(rr), hr_bpm=float(hr_bpm_seq[i]), source="analysis", extras=None)
-                db.add(ev)
+        if len(rr_intervals) > 0:
+            # Persist events: inserción masiva, cada uno fechado en su pico R
+            insert_events(db, event_rows(rr_intervals, out["r_peaks"], req.fs, req.start_time, n_samples=len(req.signal)),
+                          commit=False)
             # Persist alerts
             # Verificar configuración de notificaciones
             cfg = db.query(NotificationConfig).first()
             wp_enabled = bool(cfg and cfg.whatsapp_enabled)
             wp_to_override = cfg.whatsapp_to if cfg and cfg.whatsapp_to else None
 
-            for a in alerts:
-                al = Alert(timestamp=np.datetime64('now').astype('datetime64[ms]').astype(object), type=a["type"], severity=a["severity"], details=a.get("details"))
-                db.add(al)
-                # Notificación WhatsApp (mejor: throttle y desduplicación en producción)
-                if wp_enabled:
-                    if wp_to_override:
-                        # Override destino temporalmente usando variable de proceso
-                        os.environ['ALERT_WHATSAPP_TO'] = wp_to_override
-                    _send_whatsapp(f"[ALERTA HRV] {a['type']} ({a['severity']}) detalles: {a.get('details')}")
-            db.commit()
+            now = datetime.datetime.utcnow()
+            insert_alerts(db, [
+                {"timestamp": now, "type": a["type"], "severity": a["severity"], "details": a.get("details")}
+                for a in result["alerts"]
+            ], commit=False)
+            if wp_enabled:
+                notify = result["alerts"]
 
-    if req.persist:
+        beats, _ = segment_beats(req.signal, out["r_peaks"], req.fs)
         row = AnalysisResult(
             source="analysis",
-            hrv=hrv_metrics,
-            ml=ml_pred,
-            quality=quality,
+            hrv=result["hrv"],
+            ml=result["ml"],
+            quality=result["quality"],
             extras={
-                "n_p_peaks": int(len(p_peaks)),
-                "n_t_peaks": int(len(t_peaks)),
-                "n_r_peaks": int(len(r_peaks)),
-                "pr_intervals_ms": pr_intervals,
+                "n_p_peaks": result["n_p_peaks"],
+                "n_t_peaks": result["n_t_peaks"],
+                "n_r_peaks": result["n_r_peaks"],
+                "pr_intervals_ms": result["pr_intervals_ms"],
+                **({"beats": result["beats"]} if "beats" in result else {}),
+                "median_beat": median_beat(beats, req.fs),
             },
+            **analysis_metrics(result["hrv"], result["ml"], result["quality"]),
         )
         db.add(row)
+        db.flush()
+        save_features(db, row.id, out["features"])
         db.commit()
-        db.refresh(row)
-        result["analysis_id"] = row.id
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(row)
+    # Notificación WhatsApp asíncrona: deduplicada por tipo y agrupada en resúmenes
+    for a in notify:
+        _notify_whatsapp(f"[ALERTA HRV] {a['type']} ({a['severity']}) detalles: {a.get('details')}",
+                         to=wp_to_override, key=a["type"], digest=True)
+    # Indexar latidos para búsqueda de casos similares (best-effort)
+    try:
+        from ecg_ml.similarity import get_index
+        index = get_index()
+        index.add_analysis(row.id, beats)
+        index.maybe_save()
+    except Exception:
+        pass
+    return row.id
+
+
+def _finalize_analysis(req: AnalysisInput, out: dict, key: Optional[str] = None, fresh: bool = True,
+                       owner: Any = None) -> dict:
+    """
+    Corre en un hilo del proceso API tras el pool: guarda la salida en el caché y
+    persiste con su propia sesión. Si el caché ya tiene un AnalysisResult vigente
+    para esta señal, del mismo médico y con el mismo start_time (o ambos sin
+    start_time), se reutiliza en vez de insertar otro.
+    """
+    metrics.ANALYSIS_RESULTS.inc(1, "miss" if fresh else "hit")
+    if key is not None and fresh:
+        analysis_cache.put(key, out)
+    result = dict(out["result"])
+    if req.persist:
+        db = SessionLocal()
+        try:
+            scope = analysis_cache.persist_scope(owner, req.start_time)
+            aid = analysis_cache.analysis_id(out, scope)
+            if aid is None or db.query(AnalysisResult.id).filter(AnalysisResult.id == aid).first() is None:
+                with metrics.ANALYSIS_STAGE.time("persist"):
+                    aid = _persist_analysis(db, req, out)
+                if key is not None:
+                    analysis_cache.set_analysis_id(key, scope, aid)
+            result["analysis_id"] = aid
+        finally:
+            db.close()
     return result
 
 
+def _busy(e: Busy) -> HTTPException:
+    return HTTPException(status_code=503, detail="Analysis queue is full, retry later", headers={"Retry-After": str(e.retry_after)})
+
+
+@app.post("/analysis", openapi_extra=openapi_body(AnalysisRequest))
+async def advanced_analysis(response: Response, req: AnalysisInput = Depends(analysis_body(AnalysisRequest)), claims: dict = Depends(require_roles("doctor"))):
+    """
+    Endpoint para análisis avanzado de ECG: ondas P, T, HRV, intervalos.
+    Acepta JSON o cuerpos binarios (octet-stream/.npy, gzip/zstd); ver ecg_api/payloads.py.
+    El cómputo corre en el pool de procesos (ecg_api/jobs.py); para registros largos
+    usar POST /analysis/jobs y consultar el resultado. Los resultados se cachean por
+    contenido de la señal (ecg_api/cache.py; cabecera X-Analysis-Cache: hit|miss).
+    """
+    key = analysis_cache.key(req.signal, req.fs, req.per_beat)
+    prof = profiling.requested()
+    # Un perfil pedido explícitamente siempre recalcula (un hit del caché no dice nada)
+    out = None if prof is not None and prof.source == "on-demand" else analysis_cache.get(key)
+    fresh = out is None
+    response.headers["X-Analysis-Cache"] = "miss" if fresh else "hit"
+    if fresh:
+        try:
+            out = await analysis_jobs.run(req.signal, req.fs, req.per_beat,
+                                          profile=(prof.mode, prof.interval_ms) if prof is not None else None)
+        except Busy as e:
+            raise _busy(e)
+        profiling.attach_worker(out)
+    return await asyncio.to_thread(_finalize_analysis, req, out, key, fresh, claims.get("uid"))
+
+
+@app.post("/analysis/jobs", status_code=202, openapi_extra=openapi_body(AnalysisRequest))
+async def submit_analysis_job(req: AnalysisInput = Depends(analysis_body(AnalysisRequest)), claims: dict = Depends(require_roles("doctor"))):
+    """Encola un análisis y retorna su job_id; el resultado se consulta en GET /analysis/jobs/{job_id}."""
+    key = analysis_cache.key(req.signal, req.fs, req.per_beat)
+    out = analysis_cache.get(key)
+    if out is not None:
+        result = await asyncio.to_thread(_finalize_analysis, req, out, key, False, claims.get("uid"))
+        job = analysis_jobs.completed(result, owner=claims.get("uid"))
+        return {"job_id": job.id, "status": job.status, "ws": f"/ws/analysis/jobs/{job.id}", "cache": "hit"}
+    try:
+        job = analysis_jobs.submit(req.signal, req.fs, req.per_beat, owner=claims.get("uid"),
+                                   finalize=lambda out: _finalize_analysis(req, out, key, owner=claims.get("uid")))
+    except Busy as e:
+        raise _busy(e)
+    return {"job_id": job.id, "status": job.status, "ws": f"/ws/analysis/jobs/{job.id}", "cache": "miss"}
+
+
+@app.get("/analysis/jobs/{job_id}")
+def get_analysis_job(job_id: str, claims: dict = Depends(require_roles("doctor", "admin"))):
+    job = analysis_jobs.get(job_id)
+    if not job or (claims.get("role") != "admin" and job.owner != claims.get("uid")):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.websocket("/ws/analysis/jobs/{job_id}")
+async def analysis_job_ws(websocket: WebSocket, job_id: str):
+    """Envía el estado del job (JSON) al terminar. Mismo control que GET /analysis/jobs/{job_id} (?token=)."""
+    token = websocket.query_params.get("token")
+    await websocket.accept()
+    try:
+        claims = decode_token(token) if token else None
+    except jwt.InvalidTokenError:
+        claims = None
+    if not claims:
+        await websocket.close(code=4401)
+        return
+    if claims.get("role") not in ("doctor", "admin"):
+        await websocket.close(code=4403)
+        return
+    job = analysis_jobs.get(job_id)
+    if not job or (claims.get("role") != "admin" and job.owner != claims.get("uid")):
+        await websocket.close(code=4404)
+        return
+    metrics.WS_CLIENTS.inc(1, "/ws/analysis/jobs")
+    try:
+        if not job.done.is_set():
+            await websocket.send_json({"job_id": job.id, "status": job.status})
+            await job.done.wait()
+        await websocket.send_json(job.to_dict())
+        await websocket.close()
+    finally:
+        metrics.WS_CLIENTS.dec(1, "/ws/analysis/jobs")
+
+
 class FeedbackIn(BaseModel):
     label: str
     notes: dict | None = None
@@ -328,16 +464,81 @@ def post_feedback(analysis_id: int, body: FeedbackIn, db: Session = Depends(get_
     fb = {"label": body.label, "notes": body.notes or {}, "by_uid": claims.get("uid"), "ts": datetime.datetime.utcnow().isoformat()}
     row.feedback = fb
     db.add(row)
+    set_label(db, analysis_id, body.label)
     db.commit()
     return {"ok": True, "analysis_id": analysis_id, "feedback": fb}
 
 
+@app.post("/admin/retrain")
+def admin_retrain(full: bool = False, epochs: int = 1, claims: dict = Depends(require_roles("admin"))):
+    """
+    Re-entrena el clasificador con los vectores etiquetados por los médicos
+    (incremental: sólo feedback nuevo desde el último entrenamiento, salvo full=true).
+    """
+    from ecg_ml.retrain import retrain
+    return retrain(full=full, epochs=epochs)
+
+
+@app.get("/admin/analysis-stats")
+def admin_analysis_stats(claims: dict = Depends(require_roles("admin"))):
+    """Métricas del caché de resultados, del pool de análisis, del despachador de notificaciones y de admisión."""
+    return {"cache": analysis_cache.stats(), "pool": analysis_jobs.stats(), "notifications": get_dispatcher().stats(), "auth": auth_cache_stats(), "reports": report_renderer.stats(), "warmup": warmup_report, "admission": admission.stats()}
+
+
 # --- Notification settings (admin only) ---
 class NotificationBody(BaseModel):
     whatsapp_enabled: bool
     whatsapp_to: str | None = None
 
 
+class ProfilingConfigIn(BaseModel):
+    sample_rate: Optional[float] = None
+    min_ms: Optional[float] = None
+    interval_ms: Optional[float] = None
+    max_concurrent: Optional[int] = None
+
+
+@app.get("/admin/profiling")
+def get_profiling_config(claims: dict = Depends(require_roles("admin"))):
+    return {**vars(profiling.config), "slowest_n": profiling.store.slowest_n}
+
+
+@app.post("/admin/profiling")
+def set_profiling_config(body: ProfilingConfigIn, claims: dict = Depends(require_roles("admin"))):
+    """Ajusta el muestreo de producción para el buffer de peticiones lentas (sin redeploy)."""
+    if body.sample_rate is not None:
+        profiling.config.sample_rate = min(1.0, max(0.0, body.sample_rate))
+    if body.min_ms is not None:
+        profiling.config.min_ms = max(0.0, body.min_ms)
+    if body.interval_ms is not None:
+        profiling.config.interval_ms = min(100.0, max(0.5, body.interval_ms))
+    if body.max_concurrent is not None:
+        profiling.config.max_concurrent = max(1, body.max_concurrent)
+    return vars(profiling.config)
+
+
+@app.get("/admin/profiles")
+def list_profiles(claims: dict = Depends(require_roles("admin"))):
+    return profiling.store.list()
+
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "collapsed", claims: dict = Depends(require_roles("admin"))):
+    """format: collapsed (flamegraph.pl / speedscope), speedscope (JSON) o json."""
+    p = profiling.store.get(profile_id)
+    if p is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    body, ctype = p.render(format)
+    ext = {"speedscope": "speedscope.json", "json": "json"}.get(format, "collapsed.txt")
+    return Response(body, media_type=ctype, headers={"Content-Disposition": f"attachment; filename=profile_{p.id}.{ext}"})
+
+
+@app.delete("/admin/profiles")
+def clear_profiles(claims: dict = Depends(require_roles("admin"))):
+    profiling.store.clear()
+    return {"ok": True}
+
+
 @app.get("/admin/notifications")
 def get_notifications(db: Session = Depends(get_session), claims: dict = Depends(require_roles("admin"))):
     cfg = db.query(NotificationConfig).first()
@@ -364,10 +565,14 @@ def set_notifications(body: NotificationBody, db: Session = Depends(get_session)
 @app.post("/admin/test-whatsapp")
 def admin_test_whatsapp(claims: dict = Depends(require_roles("admin"))):
     ts = datetime.datetime.utcnow().isoformat()
-    sid = _send_whatsapp(f"[TEST] Notificación WhatsApp desde ECG API a las {ts}")
-    if sid:
-        return {"ok": True, "sid": sid}
-    return {"ok": False, "message": "WhatsApp no configurado o fallo de envío"}
+    dest = _whatsapp_dest()
+    if not (dest and get_dispatcher().configured("whatsapp")):
+        return {"ok": False, "message": "WhatsApp no configurado o fallo de envío"}
+    try:
+        sid = get_dispatcher().send_now(Notification("whatsapp", dest, f"[TEST] Notificación WhatsApp desde ECG API a las {ts}"))
+    except Exception:
+        return {"ok": False, "message": "WhatsApp no configurado o fallo de envío"}
+    return {"ok": True, "sid": sid}
 
 
 class EventsIn(BaseModel):
@@ -376,26 +581,64 @@ class EventsIn(BaseModel):
 
 @app.post("/events")
 def create_events(payload: EventsIn, db: Session = Depends(get_session), claims: dict = Depends(require_roles("doctor"))):
-    for e in payload.events:
-        ev = Event(
-            timestamp=np.datetime64(e.get("timestamp", 'now')).astype('datetime64[ms]').astype(object),
-            rr_ms=e.get("rr_ms"),
-            hr_bpm=e.get("hr_bpm"),
-            source=e.get("source"),
-            extras=e.get("extras"),
-        )
-        db.add(ev)
-    db.commit()
-    return {"inserted": len(payload.events)}
+    # Timestamps convertidos en una sola operación vectorizada; inserción masiva por bloques
+    ts = np.array([e.get("timestamp") or "now" for e in payload.events], dtype="datetime64[ms]").astype(object)
+    rows = [
+        {"timestamp": t, "rr_ms": e.get("rr_ms"), "hr_bpm": e.get("hr_bpm"), "source": e.get("source"), "extras": e.get("extras")}
+        for t, e in zip(ts, payload.events)
+    ]
+    stats = insert_events(db, rows)
+    return {"inserted": len(payload.events), "rows_per_s": stats["rows_per_s"], "method": stats["method"]}
+
+
+async def _history(model, response: Response, db: AsyncSession, format: str, limit: Optional[int], cursor: Optional[str], since, until, order: str, **filters):
+    """JSON paginado por cursor (cabecera X-Next-Cursor) o exportación NDJSON/CSV en streaming."""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    # Los timestamps se guardan en UTC sin zona
+    since, until = [
+        t.astimezone(datetime.timezone.utc).replace(tzinfo=None) if t is not None and t.tzinfo else t
+        for t in (since, until)
+    ]
+    try:
+        if format in ("ndjson", "csv"):
+            if cursor:
+                history.decode_cursor(cursor)  # validar antes de abrir el stream
+            name = f"{model.__tablename__}.{format}"
+            return StreamingResponse(
+                history.stream(model, fmt=format, limit=limit, cursor=cursor, since=since, until=until, order=order, **filters),
+                media_type="application/x-ndjson" if format == "ndjson" else "text/csv",
+                headers={"Content-Disposition": f"attachment; filename={name}"},
+            )
+        if format != "json":
+            raise HTTPException(status_code=400, detail="format must be json, ndjson or csv")
+        rows, next_cursor = await history.page_async(db, model, limit=limit or 200, cursor=cursor, since=since, until=until, order=order, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
 @app.get("/events")
-def list_events(limit: int = 200, db: Session = Depends(get_session), claims: dict = Depends(require_roles("doctor"))):
-    rows = db.query(Event).order_by(Event.id.desc()).limit(limit).all()
-    return [
-        {"id": r.id, "timestamp": r.timestamp.isoformat(), "rr_ms": r.rr_ms, "hr_bpm": r.hr_bpm, "source": r.source, "extras": r.extras}
-        for r in rows
-    ]
+async def list_events(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    source: Optional[str] = None,
+    order: str = "desc",
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_session),
+    claims: dict = Depends(require_roles("doctor")),
+):
+    """
+    Eventos RR/HR ordenados por (timestamp, id). `format=json` pagina con `cursor`
+    (siguiente en X-Next-Cursor, default limit=200); `ndjson`/`csv` exporta todo el
+    rango en streaming (limit opcional).
+    """
+    return await _history(Event, response, db, format, limit, cursor, since, until, order, source=source)
 
 
 class AlertIn(BaseModel):
@@ -413,12 +656,21 @@ def create_alert(alert: AlertIn, db: Session = Depends(get_session), claims: dic
 
 
 @app.get("/alerts")
-def list_alerts(limit: int = 200, db: Session = Depends(get_session), claims: dict = Depends(require_roles("doctor"))):
-    rows = db.query(Alert).order_by(Alert.id.desc()).limit(limit).all()
-    return [
-        {"id": r.id, "timestamp": r.timestamp.isoformat(), "type": r.type, "severity": r.severity, "details": r.details}
-        for r in rows
-    ]
+async def list_alerts(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    order: str = "desc",
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_session),
+    claims: dict = Depends(require_roles("doctor")),
+):
+    """Alertas con los mismos modos que /events; filtros por tipo y severidad."""
+    return await _history(Alert, response, db, format, limit, cursor, since, until, order, type=type, severity=severity)
 
 
 # --- AUTH endpoints para integrar login React ---
@@ -428,7 +680,10 @@ class LoginRequest(BaseModel):
 
 
 # Use bcrypt_sha256 to avoid 72-byte password edge cases and backend quirks
-from passlib.hash import bcrypt_sha256 as pwd_hash
+def _pwd_hash():
+    # passlib se importa en el primer login/alta, no al arrancar la API
+    from passlib.hash import bcrypt_sha256
+    return bcrypt_sha256
 
 
 # --- Support: Request access (no auth required) ---
@@ -454,12 +709,12 @@ def support_request_access(body: SupportAccessRequest, request: Request):
         f"user_agent: {body.user_agent or ua or '-'}\n"
         f"time: {datetime.datetime.utcnow().isoformat()}Z\n"
     )
-    sid = _send_whatsapp(msg)
-    delivered_via = "whatsapp" if sid else "none"
+    queued = _notify_whatsapp(msg, key=f"access:{body.username or body.email or ua}")
+    delivered_via = "whatsapp" if queued else "none"
     return {
         "ok": True,
         "delivered_via": delivered_via,
-        "twilio_sid": sid,
+        "queued": queued,
         "admin": {
             "email": ADMIN_EMAIL,
             "whatsapp": ADMIN_WHATSAPP or ALERT_WHATSAPP_TO,
@@ -474,7 +729,7 @@ def auth_login(req: LoginRequest, db: Session = Depends(get_session)):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     # Validar contraseña
-    if not pwd_hash.verify(req.password, user.password_hash):
+    if not _pwd_hash().verify(req.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     payload = {
         "sub": user.username,
@@ -497,7 +752,7 @@ def auth_verify(request: Request, token: str | None = None):
     if not token:
         raise HTTPException(status_code=401, detail="Missing token")
     try:
-        decoded = jwt.decode(token, AUTH_SECRET, algorithms=[AUTH_ALGO])
+        decoded = decode_token(token)
         return {
             "ok": True,
             "sub": decoded.get("sub"),
@@ -534,7 +789,7 @@ def auth_register(req: RegisterRequest, db: Session = Depends(get_session), requ
     if db.query(User).filter(User.username == req.username).first():
         raise HTTPException(status_code=409, detail="Username already exists")
 
-    hashed = pwd_hash.hash(req.password)
+    hashed = _pwd_hash().hash(req.password)
     u = User(username=req.username, password_hash=hashed, role=req.role or "doctor")
     db.add(u)
     db.commit()
@@ -570,7 +825,7 @@ def admin_list_users(db: Session = Depends(get_session), claims: dict = Depends(
 def admin_create_user(body: UserCreate, db: Session = Depends(get_session), claims: dict = Depends(require_roles("admin"))):
     if db.query(User).filter(User.username == body.username).first():
         raise HTTPException(status_code=409, detail="Username already exists")
-    hashed = pwd_hash.hash(body.password)
+    hashed = _pwd_hash().hash(body.password)
     u = User(username=body.username, password_hash=hashed, role=body.role or "doctor")
     db.add(u)
     db.commit()
@@ -583,11 +838,12 @@ def admin_patch_user(user_id: int, body: UserPatch, db: Session = Depends(get_se
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
     if body.password:
-        u.password_hash = pwd_hash.hash(body.password)
+        u.password_hash = _pwd_hash().hash(body.password)
     if body.role:
         u.role = body.role
     db.add(u)
     db.commit()
+    invalidate_user(u.id)
     return {"id": u.id, "username": u.username, "role": u.role}
 
 @app.delete("/admin/users/{user_id}")
@@ -597,6 +853,7 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_session), claims:
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(u)
     db.commit()
+    invalidate_user(user_id)
     return {"ok": True}
 
 # Include Doctor module routes
@@ -605,4 +862,16 @@ try:
     app.include_router(doctor_router)
 except Exception:
     # Router inclusion is best-effort to avoid breaking legacy flows if import fails
-    pass
\ No newline at end of file
+    pass
+
+try:
+    from ecg_api.ingest_api import router as ingest_router
+    app.include_router(ingest_router)
+except Exception:
+    pass
+
+try:
+    from ecg_api.live_metrics import router as live_router
+    app.include_router(live_router)
+except Exception:
+    pass
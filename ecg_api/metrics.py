@@ -0,0 +1,293 @@
+"""
+Métricas en proceso con exposición en formato texto de Prometheus (GET /metrics).
+
+Sin dependencias: contadores, gauges e histogramas de buckets fijos protegidos por
+un lock (observe() cuesta ~2-3 µs), más colectores que leen los stats() de los
+cachés/pools al momento del scrape. Las tasas (p. ej. muestras/s por WebSocket)
+se obtienen con rate() sobre los contadores *_total.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger("ecg_api.metrics")
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or (v.is_integer() and abs(v) < 1e15):
+        return str(int(v))
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for lv, v in items:
+            yield self.name, _labels(self.labelnames, lv), v
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labelvalues: str) -> None:
+        self.inc(-amount, *labelvalues)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for lv, v in items:
+            yield self.name, _labels(self.labelnames, lv), v
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 registry: Optional["Registry"] = None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteo por bucket (no acumulado) + overflow, suma, total]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            items = [(lv, list(s[0]), s[1], s[2]) for lv, s in self._series.items()]
+        for lv, counts, total, n in items:
+            acc = 0
+            for b, c in zip((*self.buckets, math.inf), counts):
+                acc += c
+                yield f"{self.name}_bucket", _labels(self.labelnames, lv, f'le="{_fmt(b)}"'), acc
+            yield f"{self.name}_sum", _labels(self.labelnames, lv), total
+            yield f"{self.name}_count", _labels(self.labelnames, lv), n
+
+
+class _Timer:
+    __slots__ = ("h", "lv", "t0")
+
+    def __init__(self, h: Histogram, lv: LabelValues):
+        self.h, self.lv = h, lv
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0, *self.lv)
+
+
+class StatsCollector:
+    """Expone los valores numéricos de un stats() -> dict como métricas `prefix_<clave>`."""
+    type = "untyped"
+
+    def __init__(self, prefix: str, fn: Callable[[], Dict[str, Any]], help: str = "", registry: Optional["Registry"] = None):
+        self.name = prefix
+        self.fn = fn
+        self.help = help
+        (registry or REGISTRY).register(self)
+
+    def families(self) -> Iterable[Tuple[str, str, List[Tuple[str, str, float]]]]:
+        try:
+            stats = self.fn()
+        except Exception:
+            # La familia falta en este scrape: que se note en el log y en un contador
+            log.exception("metrics collector %s failed", self.name)
+            COLLECTOR_ERRORS.inc(1, self.name)
+            return
+        yield from self._flatten(self.name, stats, ())
+
+    def _flatten(self, name: str, stats: Dict[str, Any], labels: Tuple[Tuple[str, str], ...]):
+        for k, v in stats.items():
+            if isinstance(v, bool):
+                v = float(v)
+            if isinstance(v, (int, float)):
+                if isinstance(v, float) and not math.isfinite(v):
+                    continue
+                lab = _labels([n for n, _ in labels], [x for _, x in labels])
+                yield f"{name}_{k}", self.help, [(f"{name}_{k}", lab, float(v))]
+            elif isinstance(v, dict):
+                # Un nivel anidado (p. ej. auth: {claims: {...}, doctor_ids: {...}}) pasa a etiqueta
+                yield from self._flatten(name, v, labels + (("cache", str(k)),))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._lock = threading.Lock()
+
+    def register(self, m) -> None:
+        with self._lock:
+            self._metrics.append(m)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics)
+        collected: Dict[str, Tuple[str, List[Tuple[str, str, float]]]] = {}
+        for m in metrics:
+            if isinstance(m, StatsCollector):
+                for fam, help, samples in m.families():
+                    collected.setdefault(fam, (help, []))[1].extend(samples)
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type}")
+            for name, lab, v in m.samples():
+                lines.append(f"{name}{lab} {_fmt(v)}")
+        for fam, (help, samples) in collected.items():
+            lines.append(f"# HELP {fam} {help}")
+            lines.append(f"# TYPE {fam} untyped")
+            for name, lab, v in samples:
+                lines.append(f"{name}{lab} {_fmt(v)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Métricas de la API ---
+HTTP_LATENCY = Histogram("ecg_http_request_duration_seconds", "HTTP request latency by route template",
+                         ("method", "route", "status"))
+HTTP_IN_PROGRESS = Gauge("ecg_http_requests_in_progress", "HTTP requests being served")
+ANALYSIS_STAGE = Histogram("ecg_analysis_stage_seconds", "Duration of each /analysis pipeline stage",
+                           ("stage",), buckets=STAGE_BUCKETS)
+ANALYSIS_RESULTS = Counter("ecg_analysis_requests_total", "Analyses served, by result cache outcome", ("cache",))
+WS_CLIENTS = Gauge("ecg_ws_clients", "Active WebSocket clients", ("endpoint",))
+WS_SAMPLES = Counter("ecg_ws_samples_sent_total", "ECG samples sent over WebSocket", ("endpoint",))
+DB_CONN_HOLD = Histogram("ecg_db_connection_hold_seconds", "Time a DB connection is checked out of the pool (session time)",
+                         buckets=STAGE_BUCKETS)
+DB_QUERY = Histogram("ecg_db_query_seconds", "DB statement execution time", buckets=STAGE_BUCKETS)
+COLLECTOR_ERRORS = Counter("ecg_metrics_collector_errors_total", "Scrapes in which a stats collector raised", ("collector",))
+
+
+def observe_stages(timings: Optional[Dict[str, float]]) -> None:
+    for stage, dt in (timings or {}).items():
+        ANALYSIS_STAGE.observe(dt, stage)
+
+
+class MetricsMiddleware:
+    """ASGI puro (sin BaseHTTPMiddleware): latencia por plantilla de ruta, no por URL."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - t0, scope["method"], path, str(status[0]))
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Tiempo de sesión (checkout -> checkin de la conexión) y de cada sentencia."""
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_conn, rec, proxy):
+        rec.info["ecg_checkout"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_conn, rec):
+        t0 = rec.info.pop("ecg_checkout", None)
+        if t0 is not None:
+            DB_CONN_HOLD.observe(time.perf_counter() - t0)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, params, context, executemany):
+        conn.info.setdefault("ecg_query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, params, context, executemany):
+        stack = conn.info.get("ecg_query_t0")
+        if stack:
+            DB_QUERY.observe(time.perf_counter() - stack.pop())
@@ -0,0 +1,163 @@
+"""
+Decodificación de cuerpos de /analysis sin trabajo Python por muestra.
+
+Content-Type soportados:
+  - application/json                       {"signal": [...], "fs": ..., ...} (compatibilidad)
+  - application/octet-stream               muestras crudas; ?dtype=float32|int16|float64&scale=
+  - application/x-npy | application/npy    archivo .npy (allow_pickle=False)
+Content-Encoding opcional: gzip, deflate o zstd (si está instalado `zstandard`).
+
+Para los formatos binarios, fs/persist/per_beat/start_time se pasan como query params
+(?fs=360&persist=true) o cabeceras X-ECG-Fs, X-ECG-Persist, X-ECG-Per-Beat, X-ECG-Start-Time.
+"""
+
+from __future__ import annotations
+
+import datetime
+import io
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+import numpy as np
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+try:
+    import zstandard  # opcional
+except Exception:  # pragma: no cover - depende del entorno
+    zstandard = None  # type: ignore
+
+
+MAX_BODY_BYTES = int(os.getenv("ANALYSIS_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+RAW_DTYPES = {"float32": "<f4", "int16": "<i2", "float64": "<f8"}
+
+
+@dataclass
+class AnalysisInput:
+    signal: np.ndarray
+    fs: float
+    persist: bool = False
+    per_beat: bool = False
+    start_time: Optional[datetime.datetime] = None  # inicio del registro (fecha de cada latido)
+
+
+def _param(request: Request, name: str) -> Optional[str]:
+    v = request.query_params.get(name)
+    if v is None:
+        v = request.headers.get("X-ECG-" + name.replace("_", "-").title())
+    return v
+
+
+def _as_bool(v: Optional[str]) -> bool:
+    return (v or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    encoding = (encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        return body
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if "gzip" in encoding else zlib.MAX_WBITS
+        d = zlib.decompressobj(wbits)
+        out = d.decompress(body, MAX_BODY_BYTES + 1)
+        if len(out) > MAX_BODY_BYTES or d.unconsumed_tail:
+            raise HTTPException(status_code=413, detail="Decompressed body too large")
+        return out
+    if encoding == "zstd":
+        if zstandard is None:
+            raise HTTPException(status_code=415, detail="zstd not supported on this server")
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as r:
+            out = r.read(MAX_BODY_BYTES + 1)
+        if len(out) > MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Decompressed body too large")
+        return out
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+
+def decode_signal(body: bytes, content_type: str, dtype: Optional[str] = None, scale: Optional[float] = None) -> np.ndarray:
+    """Bytes -> señal float64 en mV usando np.frombuffer/np.load (sin bucles por elemento)."""
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in ("application/x-npy", "application/npy"):
+        try:
+            x = np.load(io.BytesIO(body), allow_pickle=False)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid .npy payload")
+        if x.dtype.kind not in "iuf":
+            raise HTTPException(status_code=400, detail="Non-numeric .npy payload")
+    else:
+        np_dtype = RAW_DTYPES.get((dtype or "float32").lower())
+        if np_dtype is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported dtype: {dtype}")
+        if len(body) % np.dtype(np_dtype).itemsize:
+            raise HTTPException(status_code=400, detail="Body length is not a multiple of the sample size")
+        x = np.frombuffer(body, dtype=np_dtype)
+    x = x.reshape(-1).astype(np.float64)
+    if scale is not None:
+        x *= scale
+    return x
+
+
+def analysis_body(model: Type[BaseModel]) -> Callable[[Request], Awaitable[AnalysisInput]]:
+    """
+    Dependencia de /analysis: acepta JSON validado con `model` (compatibilidad)
+    o cuerpos binarios compactos.
+    """
+    async def read_analysis_input(request: Request) -> AnalysisInput:
+        body = await request.body()
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Body too large")
+        body = _decompress(body, request.headers.get("Content-Encoding", ""))
+        ct = (request.headers.get("Content-Type") or "application/json").split(";")[0].strip().lower()
+
+        if ct == "application/json":
+            try:
+                data = json.loads(body or b"{}")
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise HTTPException(status_code=400, detail="Invalid JSON body")
+            if not isinstance(data, dict):
+                # JSON válido pero no un objeto ([1, 2], 3, "x"): 422 como el body validado de FastAPI
+                raise RequestValidationError([{"type": "model_attributes_type", "loc": ("body",),
+                                               "msg": "Input should be a valid dictionary or object", "input": data}])
+            try:
+                req = model(**data)
+            except ValidationError as e:
+                raise RequestValidationError([dict(err, loc=("body",) + tuple(err["loc"])) for err in e.errors()])
+            try:
+                sig = np.asarray(req.signal, dtype=np.float64).reshape(-1)
+            except (TypeError, ValueError):
+                raise RequestValidationError([{"type": "float_type", "loc": ("body", "signal"),
+                                               "msg": "signal must be a flat list of numbers", "input": None}])
+            return AnalysisInput(sig, float(req.fs), bool(req.persist), bool(req.per_beat), req.start_time)
+
+        if ct not in ("application/octet-stream", "application/x-npy", "application/npy"):
+            raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {ct}")
+        try:
+            fs = _param(request, "fs")
+            fs_val = float(fs) if fs is not None else None
+            scale = _param(request, "scale")
+            scale_val = float(scale) if scale is not None else None
+            start = _param(request, "start_time")
+            start_val = datetime.datetime.fromisoformat(start.replace("Z", "+00:00")) if start else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="fs/scale must be numbers and start_time ISO-8601")
+        if not fs_val or fs_val <= 0:
+            raise HTTPException(status_code=400, detail="fs is required for binary bodies")
+        sig = decode_signal(body, ct, _param(request, "dtype"), scale_val)
+        return AnalysisInput(sig, fs_val, _as_bool(_param(request, "persist")), _as_bool(_param(request, "per_beat")), start_val)
+
+    return read_analysis_input
+
+
+def openapi_body(model: Type[BaseModel]) -> Dict[str, Any]:
+    """openapi_extra para documentar los Content-Type aceptados por analysis_body."""
+    schema = model.model_json_schema() if hasattr(model, "model_json_schema") else model.schema()
+    binary = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        "application/octet-stream": binary,
+        "application/x-npy": binary,
+    }}}
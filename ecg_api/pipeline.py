@@ -0,0 +1,155 @@
+"""
+Pipeline de análisis de ECG sin estado de la API (sin DB ni red saliente).
+
+Se ejecuta dentro de los procesos del pool de ecg_api/jobs.py, así que sólo
+recibe/retorna objetos picklables: la persistencia queda en el proceso de la API.
+SciPy, el clasificador y el modelo HF se importan al primer análisis (o en
+warm_up), no al importar el módulo: la API lo importa sin pagar ese costo.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict
+
+import numpy as np
+
+
+# Subir al cambiar el algoritmo: invalida el caché de resultados (ecg_api/cache.py)
+PIPELINE_VERSION = 1
+
+
+def detect_alerts(rr_ms: np.ndarray, pr_ms: list[float]) -> list[dict]:
+    alerts = []
+    # Simple AF heuristic: high RR variability and absence of P (handled upstream)
+    if len(rr_ms) >= 4:
+        sdnn = float(np.std(rr_ms))
+        if sdnn > 120:  # ms threshold
+            alerts.append({"type": "AF_suspected", "severity": "warning", "details": {"sdnn_ms": sdnn}})
+    # Simple AV block heuristic: prolonged PR intervals
+    long_pr = [x for x in pr_ms if x and x > 200]
+    if len(long_pr) >= 3:
+        alerts.append({"type": "AV_block_suspected", "severity": "warning", "details": {"n_long_pr": len(long_pr)}})
+    return alerts
+
+
+def hrv_alerts(hrv: dict) -> list[dict]:
+    alerts = []
+    t = (hrv or {}).get('time', {})
+    f = (hrv or {}).get('freq', {})
+    sdnn = t.get('SDNN')
+    rmssd = t.get('RMSSD')
+    pnn50 = t.get('pNN50')
+    lf_hf = f.get('LF_HF')
+    # Umbrales simples (ajustables): SDNN bajo, LF/HF alto o bajo, pNN50 bajo
+    if sdnn is not None and not np.isnan(sdnn) and sdnn < 50:
+        alerts.append({"type": "HRV_low_SDNN", "severity": "warning", "details": {"sdnn": sdnn}})
+    if rmssd is not None and not np.isnan(rmssd) and rmssd < 20:
+        alerts.append({"type": "HRV_low_RMSSD", "severity": "warning", "details": {"rmssd": rmssd}})
+    if pnn50 is not None and not np.isnan(pnn50) and pnn50 < 5:
+        alerts.append({"type": "HRV_low_pNN50", "severity": "info", "details": {"pnn50": pnn50}})
+    if lf_hf is not None and not np.isnan(lf_hf) and (lf_hf > 3 or lf_hf < 0.5):
+        alerts.append({"type": "HRV_abnormal_LF_HF", "severity": "warning", "details": {"lf_hf": lf_hf}})
+    return alerts
+
+
+class _Laps:
+    """Duración (s) de cada etapa desde la anterior; viaja de vuelta con el resultado."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._t = time.perf_counter()
+
+    def __call__(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.timings[stage] = now - self._t
+        self._t = now
+
+
+def warm_up() -> None:
+    """Initializer de los workers: carga clasificador y modelo HF una sola vez por proceso."""
+    import scipy.signal  # noqa: F401
+    from ecg_ml.classifier import get_classifier
+    from ecg_ml.hf_loader import get_ecg2hrv_model
+
+    get_classifier()
+    get_ecg2hrv_model()
+
+
+def run_analysis(sig: np.ndarray, fs: float, per_beat: bool = False) -> Dict[str, Any]:
+    """
+    Ondas P/T, picos R, HRV, intervalos, calidad, clasificador y modelo HF.
+    Retorna {"result": dict JSON para la respuesta, "features": vector float32,
+    "r_peaks": índices, "timings": segundos por etapa} (features/r_peaks los usa
+    la persistencia; timings, /metrics).
+    """
+    from scipy.signal import find_peaks
+
+    from ecg_processing.p_wave import detect_p_waves
+    from ecg_processing.t_wave import detect_t_waves
+    from ecg_processing.hrv import compute_hrv
+    from ecg_processing.intervals import compute_intervals
+    from ecg_processing.filters import estimate_quality
+    from ecg_processing.beats import classify_beats
+    from ecg_ml.classifier import get_classifier
+    from ecg_ml.features import extract_features
+    from ecg_ml.hf_loader import get_ecg2hrv_model, run_ecg2hrv
+
+    lap = _Laps()
+    sig = np.asarray(sig, dtype=float)
+    # Detectar ondas
+    p_peaks = detect_p_waves(sig, fs)
+    lap("p_waves")
+    t_peaks = detect_t_waves(sig, fs)
+    lap("t_waves")
+    # Simular R-peaks (en producción usa tu algoritmo QRS)
+    r_peaks, _ = find_peaks(sig, distance=int(0.6*fs), prominence=0.2)
+    lap("r_peaks")
+    # RR intervals
+    rr_intervals = np.diff(r_peaks) / fs * 1000  # ms
+    hrv_metrics = compute_hrv(rr_intervals)
+    lap("hrv")
+    # Intervalos PR (ejemplo)
+    pr_intervals = compute_intervals(r_peaks, p_peaks, t_peaks, fs)
+    lap("intervals")
+    quality = estimate_quality(sig, fs)
+    lap("quality")
+    features = extract_features(sig, fs, rr_intervals, hrv_metrics, quality, len(p_peaks), len(t_peaks), pr_intervals)
+    lap("features")
+    clf = get_classifier()
+    ml_pred = clf.predict(sig, fs, features=features)
+    lap("classifier")
+    beats_out = classify_beats(clf, sig, r_peaks, fs) if per_beat else None
+    if per_beat:
+        lap("per_beat")
+
+    # HF model (ECG2HRV) integration (best-effort)
+    try:
+        ecg2hrv = get_ecg2hrv_model()
+        if ecg2hrv is not None:
+            hf_out = run_ecg2hrv(ecg2hrv, sig, fs)
+        else:
+            hf_out = {"ok": False, "error": "Modelo no disponible"}
+    except Exception as _:
+        hf_out = {"ok": False, "error": "Fallo al ejecutar modelo"}
+    lap("hf_model")
+
+    result = {
+        "n_p_peaks": int(len(p_peaks)),
+        "n_t_peaks": int(len(t_peaks)),
+        "n_r_peaks": int(len(r_peaks)),
+        "hrv": hrv_metrics,
+        "ml": ml_pred,
+        "hf_model": hf_out,
+        "quality": quality,
+        "pr_intervals_ms": pr_intervals
+    }
+    if beats_out is not None:
+        result["beats"] = beats_out
+    if len(rr_intervals) > 0:
+        result["rr_ms"] = rr_intervals.tolist()
+        result["hr_bpm_seq"] = (60000.0 / rr_intervals).tolist()
+        # Alertas de ritmo + basadas en HRV
+        result["alerts"] = detect_alerts(rr_intervals, pr_intervals) + hrv_alerts(hrv_metrics)
+    lap("alerts")
+    return {"result": result, "features": features, "r_peaks": r_peaks, "timings": lap.timings}
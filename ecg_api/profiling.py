@@ -0,0 +1,413 @@
+"""
+Perfilado bajo demanda para administradores.
+
+- Petición puntual: cabecera `X-Profile: sampling|trace` (o `?profile=`) con token
+  de admin (en `X-Profile-Token` si la ruta exige otro rol, p. ej. /analysis). La
+  respuesta lleva `X-Profile-Id`; el perfil se descarga en
+  GET /admin/profiles/{id}?format=collapsed|speedscope. Con `X-Profile-Output: inline`
+  (o `?profile_output=inline`) el cuerpo de la respuesta ES el perfil y el
+  status original va en `X-Profiled-Status`.
+- Buffer de las N peticiones más lentas: POST /admin/profiling {"sample_rate": 0.05}
+  perfila esa fracción de peticiones y conserva las PROFILE_SLOWEST_N más lentas
+  (sobre PROFILE_MIN_MS), sin redeploy.
+
+En el proceso de la API se muestrean sólo las pilas que trabajan para la petición
+perfilada: en el event loop, mientras corre su propia corrutina (el frame del
+middleware está en la pila); en el threadpool de anyio, mientras el hilo ejecuta
+una función con el contexto de esa petición (dependencias y rutas `def`). Las
+peticiones concurrentes no se cuelan en el perfil; tareas que la ruta lance
+aparte (create_task) tampoco se cuentan. Las pilas en espera se descartan. El análisis corre en el pool: run_profiled() perfila dentro
+del worker y sus pilas se agregan bajo "analysis_worker". "trace" es determinista
+(sys.setprofile, tiempos exactos pero ~2-5x más lento) y sólo aplica al pipeline.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_SLOWEST_N = int(os.getenv("PROFILE_SLOWEST_N", "20"))
+PROFILE_MIN_MS = float(os.getenv("PROFILE_MIN_MS", "200"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+MODES = ("sampling", "trace")
+# Hojas en estos módulos = hilo ocioso (event loop en select, workers esperando cola)
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "connection.py", "base_events.py")
+
+
+# --- pilas ---
+_labels: Dict[Any, str] = {}
+
+
+def _label(code) -> str:
+    lab = _labels.get(code)
+    if lab is None:
+        parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+        lab = f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+        _labels[code] = lab
+    return lab
+
+
+def _for_request(frame, anchor, prof: "RequestProfile") -> bool:
+    """¿La pila que termina en `frame` trabaja para la petición `prof`?"""
+    while frame is not None:
+        if frame is anchor:
+            return True
+        code = frame.f_code
+        if code.co_name == "run" and "anyio" in code.co_filename:
+            # WorkerThread.run de anyio: `context` es el contexto copiado de quien llamó run_sync
+            ctx = frame.f_locals.get("context")
+            return isinstance(ctx, contextvars.Context) and ctx.get(_current) is prof
+        frame = frame.f_back
+    return False
+
+
+def _stack(frame) -> Tuple[str, bool]:
+    """Pila raíz->hoja en formato collapsed y si el hilo está ocioso."""
+    idle = frame.f_code.co_filename.endswith(_IDLE_FILES)
+    names = []
+    while frame is not None:
+        names.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names)), idle
+
+
+class Sampler:
+    """
+    Hilo que toma sys._current_frames() cada interval_ms: de `thread_id`, o de los
+    hilos que trabajan para `request` (RequestProfile cuyo middleware está en `anchor`).
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, thread_id: Optional[int] = None,
+                 request: Optional["RequestProfile"] = None, anchor=None):
+        self.interval = max(0.5, interval_ms) / 1000.0
+        self.thread_id = thread_id
+        self.request = request
+        self.anchor = anchor
+        self.stacks: Dict[str, float] = defaultdict(float)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me or (self.thread_id is not None and tid != self.thread_id):
+                    continue
+                if self.request is not None and not _for_request(frame, self.anchor, self.request):
+                    continue
+                stack, idle = _stack(frame)
+                if not idle:
+                    self.stacks[stack] += 1
+
+    def __enter__(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class Tracer:
+    """Perfil determinista del hilo actual: tiempo propio (µs) acumulado por pila."""
+
+    def __init__(self):
+        self.stacks: Dict[str, float] = defaultdict(float)
+        self._paths: List[str] = []
+        self._last = 0.0
+
+    def _cb(self, frame, event, arg) -> None:
+        now = time.perf_counter()
+        if self._paths:
+            self.stacks[self._paths[-1]] += (now - self._last) * 1e6
+        if event == "call":
+            self._push(_label(frame.f_code))
+        elif event == "c_call":
+            self._push(f"{getattr(arg, '__qualname__', None) or getattr(arg, '__name__', '?')} [c]")
+        elif event in ("return", "c_return", "c_exception") and self._paths:
+            self._paths.pop()
+        self._last = time.perf_counter()
+
+    def _push(self, label: str) -> None:
+        self._paths.append(f"{self._paths[-1]};{label}" if self._paths else label)
+
+    def __enter__(self) -> "Tracer":
+        self._last = time.perf_counter()
+        sys.setprofile(self._cb)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        sys.setprofile(None)
+
+
+def run_profiled(fn: Callable[..., Dict[str, Any]], args: tuple, mode: str = "sampling",
+                 interval_ms: float = PROFILE_INTERVAL_MS) -> Dict[str, Any]:
+    """
+    Ejecuta fn(*args) (en el worker del pool) bajo el perfilador y agrega a su salida
+    out["profile"] = {"mode", "unit", "stacks"}.
+    """
+    if mode == "trace":
+        with Tracer() as tr:
+            out = fn(*args)
+        prof = {"mode": mode, "unit": "microseconds", "stacks": dict(tr.stacks)}
+    else:
+        with Sampler(interval_ms, thread_id=threading.get_ident()) as s:
+            out = fn(*args)
+        prof = {"mode": "sampling", "unit": "samples", "interval_ms": interval_ms, "stacks": dict(s.stacks)}
+    out["profile"] = prof
+    return out
+
+
+# --- perfiles de petición ---
+@dataclass
+class RequestProfile:
+    id: str
+    mode: str
+    interval_ms: float
+    source: str  # "on-demand" | "sampled"
+    method: str = ""
+    path: str = ""
+    status: int = 0
+    ts: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    samples: int = 0
+    stacks: Dict[str, float] = field(default_factory=dict)
+    # Perfil del pipeline en el worker (ms o µs según modo)
+    worker: Optional[Dict[str, Any]] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {"id": self.id, "source": self.source, "mode": self.mode, "method": self.method, "path": self.path,
+                "status": self.status, "ts": self.ts, "duration_ms": round(self.duration_ms, 1), "samples": self.samples,
+                "has_worker_profile": self.worker is not None}
+
+    def weighted_stacks(self) -> Tuple[Dict[str, float], str]:
+        """Pilas de API y worker en una sola unidad (ms de muestreo, o µs si el worker usó trace)."""
+        worker = self.worker or {}
+        if worker.get("unit") == "microseconds":
+            scale, unit = self.interval_ms * 1000.0, "microseconds"
+        else:
+            scale, unit = self.interval_ms, "milliseconds"
+        out: Dict[str, float] = {k: v * scale for k, v in self.stacks.items()}
+        wscale = 1.0 if worker.get("unit") == "microseconds" else float(worker.get("interval_ms", self.interval_ms))
+        for k, v in worker.get("stacks", {}).items():
+            key = f"analysis_worker;{k}"
+            out[key] = out.get(key, 0.0) + v * wscale
+        return out, unit
+
+    def collapsed(self) -> str:
+        stacks, _ = self.weighted_stacks()
+        return "".join(f"{k} {int(round(v))}\n" for k, v in sorted(stacks.items(), key=lambda kv: -kv[1]) if v >= 0.5)
+
+    def speedscope(self) -> Dict[str, Any]:
+        stacks, unit = self.weighted_stacks()
+        frames: List[Dict[str, str]] = []
+        index: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, w in stacks.items():
+            ids = []
+            for name in stack.split(";"):
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            samples.append(ids)
+            weights.append(w)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": f"{self.method} {self.path} ({self.duration_ms:.0f} ms)", "unit": unit,
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+            "name": f"ecg {self.id}",
+            "exporter": "ecg_api.profiling",
+        }
+
+    def render(self, fmt: str) -> Tuple[bytes, str]:
+        if fmt == "speedscope":
+            return json.dumps(self.speedscope()).encode(), "application/json"
+        if fmt == "json":
+            return json.dumps({**self.summary(), "stacks": self.weighted_stacks()[0]}).encode(), "application/json"
+        return self.collapsed().encode(), "text/plain; charset=utf-8"
+
+
+class ProfileStore:
+    """Últimos perfiles bajo demanda + heap con las N peticiones muestreadas más lentas."""
+
+    def __init__(self, keep: int = PROFILE_KEEP, slowest_n: int = PROFILE_SLOWEST_N):
+        self.slowest_n = slowest_n
+        self._recent: Deque[RequestProfile] = deque(maxlen=keep)
+        self._slowest: List[Tuple[float, int, RequestProfile]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, p: RequestProfile) -> None:
+        with self._lock:
+            if p.source == "on-demand":
+                self._recent.append(p)
+                return
+            item = (p.duration_ms, next(self._seq), p)
+            if len(self._slowest) < self.slowest_n:
+                heapq.heappush(self._slowest, item)
+            elif p.duration_ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def threshold_ms(self) -> float:
+        """Duración mínima para entrar al buffer de lentas (evita perfilar de más)."""
+        with self._lock:
+            if len(self._slowest) < self.slowest_n:
+                return 0.0
+            return self._slowest[0][0]
+
+    def list(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            recent = [p.summary() for p in reversed(self._recent)]
+            slowest = [p.summary() for _, _, p in sorted(self._slowest, key=lambda it: -it[0])]
+        return {"on_demand": recent, "slowest": slowest}
+
+    def get(self, pid: str) -> Optional[RequestProfile]:
+        with self._lock:
+            for p in itertools.chain(self._recent, (it[2] for it in self._slowest)):
+                if p.id == pid:
+                    return p
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._slowest = []
+
+
+@dataclass
+class ProfilingConfig:
+    sample_rate: float = PROFILE_SAMPLE_RATE
+    min_ms: float = PROFILE_MIN_MS
+    interval_ms: float = PROFILE_INTERVAL_MS
+    max_concurrent: int = PROFILE_MAX_CONCURRENT
+
+
+config = ProfilingConfig()
+store = ProfileStore()
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("ecg_profile", default=None)
+_active = 0
+_active_lock = threading.Lock()
+
+
+def requested() -> Optional[RequestProfile]:
+    """Perfil en curso para esta petición (las rutas lo usan para perfilar también el worker)."""
+    return _current.get()
+
+
+def attach_worker(out: Dict[str, Any]) -> None:
+    """Saca out["profile"] (pilas del worker) y lo asocia al perfil de la petición en curso."""
+    prof = out.pop("profile", None)
+    p = _current.get()
+    if p is not None and prof is not None:
+        p.worker = prof
+
+
+def _acquire() -> bool:
+    global _active
+    with _active_lock:
+        if _active >= max(1, config.max_concurrent):
+            return False
+        _active += 1
+        return True
+
+
+def _release() -> None:
+    global _active
+    with _active_lock:
+        _active -= 1
+
+
+class ProfilingMiddleware:
+    """
+    ASGI puro. `is_admin(scope)` decide si se atiende la cabecera/query de perfilado;
+    a los demás usuarios se les ignora en silencio.
+    """
+
+    def __init__(self, app, is_admin: Callable[[Dict[str, Any]], bool]):
+        self.app = app
+        self.is_admin = is_admin
+
+    @staticmethod
+    def _options(scope) -> Tuple[Optional[str], bool, str]:
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        query: Dict[str, str] = {}
+        for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+            if "=" in part:
+                k, v = part.split("=", 1)
+                query[k] = v
+        mode = (headers.get("x-profile") or query.get("profile") or "").strip().lower() or None
+        if mode in ("1", "true", "yes"):
+            mode = "sampling"
+        inline = (headers.get("x-profile-output") or query.get("profile_output") or "").lower() == "inline"
+        fmt = (headers.get("x-profile-format") or query.get("profile_format") or "collapsed").lower()
+        return mode, inline, fmt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode, inline, fmt = self._options(scope) if (b"profile" in scope.get("query_string", b"") or
+                                                      any(k.startswith(b"x-profile") for k, _ in scope.get("headers", []))) else (None, False, "collapsed")
+        source = None
+        if mode in MODES and self.is_admin(scope):
+            source = "on-demand"
+        elif config.sample_rate > 0 and random.random() < config.sample_rate:
+            source, mode, inline = "sampled", "sampling", False
+        if source is None or not _acquire():
+            return await self.app(scope, receive, send)
+
+        prof = RequestProfile(id=uuid.uuid4().hex[:16], mode=mode, interval_ms=config.interval_ms, source=source,
+                              method=scope["method"], path=scope["path"])
+        buffered: List[Dict[str, Any]] = []
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                prof.status = message["status"]
+                if source == "on-demand" and not inline:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", prof.id.encode())]}
+            if inline:
+                buffered.append(message)
+                return
+            await send(message)
+
+        token = _current.set(prof)
+        t0 = time.perf_counter()
+        try:
+            with Sampler(config.interval_ms, request=prof, anchor=sys._getframe()) as s:
+                await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            _release()
+            prof.duration_ms = (time.perf_counter() - t0) * 1000.0
+            prof.samples = s.samples
+            prof.stacks = dict(s.stacks)
+            if source == "on-demand" or prof.duration_ms >= max(config.min_ms, store.threshold_ms()):
+                store.add(prof)
+        if inline:
+            body, ctype = prof.render(fmt)
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", ctype.encode()), (b"content-length", str(len(body)).encode()),
+                (b"x-profile-id", prof.id.encode()), (b"x-profiled-status", str(prof.status).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
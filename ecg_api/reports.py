@@ -0,0 +1,312 @@
+"""
+Reportes PDF de análisis HRV.
+
+- render_pdf() es una función pura (payload dict -> bytes) que corre en un pool de
+  procesos (REPORT_WORKERS, default 2; 0 = hilo del proceso API): ReportLab no
+  libera el GIL y no debe competir con las peticiones HTTP.
+- Los PDF se cachean en memoria (LRU acotado por REPORT_CACHE_MAX_MB, default 32)
+  con clave (analysis_id, versión); la versión cambia con el feedback, los datos
+  del paciente, las gráficas pedidas o REPORT_LAYOUT_VERSION.
+- zip_stream() arma un ZIP incremental y emite cada reporte en cuanto termina.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+REPORT_LAYOUT_VERSION = 2
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_CACHE_MAX_MB = float(os.getenv("REPORT_CACHE_MAX_MB", "32"))
+REPORT_BATCH_MAX = int(os.getenv("REPORT_BATCH_MAX", "500"))
+
+# Puntos máximos por gráfica (el PDF no gana nada con más resolución)
+_PLOT_POINTS = 600
+
+
+def report_payload(ar, patient, plots: bool = False) -> Dict[str, Any]:
+    """Datos planos (picklables) que necesita render_pdf a partir de las filas ORM."""
+    hrv = ar.hrv or {}
+    payload = {
+        "id": ar.id,
+        "timestamp": ar.timestamp.isoformat() if ar.timestamp else None,
+        "time": hrv.get("time") or {},
+        "freq": {k: v for k, v in (hrv.get("freq") or {}).items() if k != "spectrum"},
+        "quality": ar.quality or {},
+        "feedback": ar.feedback,
+        "patient": _patient_dict(patient),
+        "plots": bool(plots),
+    }
+    if plots:
+        payload["tachogram"] = hrv.get("tachogram") or {}
+        payload["median_beat"] = (ar.extras or {}).get("median_beat")
+    return payload
+
+
+def _patient_dict(patient) -> Optional[Dict[str, Any]]:
+    if patient is None:
+        return None
+    return {"name": patient.name, "identifier": patient.identifier, "email": patient.email}
+
+
+def report_version(feedback: Optional[dict], patient, plots: bool = False) -> str:
+    """Huella de lo que puede cambiar en un análisis ya guardado (las métricas no cambian)."""
+    raw = json.dumps({"feedback": feedback, "patient": _patient_dict(patient), "plots": bool(plots),
+                      "layout": REPORT_LAYOUT_VERSION}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _decimate(x: List[float], y: List[float], n: int = _PLOT_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size > n:
+        idx = np.linspace(0, x.size - 1, n).astype(int)
+        x, y = x[idx], y[idx]
+    ok = np.isfinite(x) & np.isfinite(y)
+    return x[ok], y[ok]
+
+
+def _draw_series(c, x, y, left: float, bottom: float, w: float, h: float, title: str, unit: str) -> None:
+    """Polilínea escalada a la caja (left, bottom, w, h) con marco y rango del eje Y."""
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(left, bottom + h + 6, title)
+    c.setLineWidth(0.5)
+    c.rect(left, bottom, w, h)
+    if x.size < 2:
+        c.setFont("Helvetica", 9)
+        c.drawString(left + 8, bottom + h / 2, "Sin datos")
+        return
+    x0, x1 = float(x.min()), float(x.max())
+    y0, y1 = float(y.min()), float(y.max())
+    xs = (x - x0) / ((x1 - x0) or 1.0) * w + left
+    ys = (y - y0) / ((y1 - y0) or 1.0) * (h - 8) + bottom + 4
+    path = c.beginPath()
+    path.moveTo(xs[0], ys[0])
+    for px, py in zip(xs[1:].tolist(), ys[1:].tolist()):
+        path.lineTo(px, py)
+    c.setStrokeColorRGB(0.75, 0.1, 0.1)
+    c.drawPath(path, stroke=1, fill=0)
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setFont("Helvetica", 7)
+    c.drawRightString(left - 2, bottom + h - 6, f"{y1:.0f} {unit}")
+    c.drawRightString(left - 2, bottom + 2, f"{y0:.0f} {unit}")
+
+
+def _import_reportlab() -> None:
+    from reportlab.pdfgen import canvas  # noqa: F401
+
+
+def render_pdf(payload: Dict[str, Any]) -> bytes:
+    # Minimal PDF via reportlab (no external binaries)
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    width, height = A4
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, y, "ECG HRV Report")
+    y -= 24
+    c.setFont("Helvetica", 10)
+    patient = payload.get("patient")
+    if patient:
+        c.drawString(50, y, f"Paciente: {patient['name']}  ID: {patient['identifier'] or '-'}  Email: {patient['email'] or '-'}")
+        y -= 18
+    c.drawString(50, y, f"Análisis ID: {payload['id']}  Fecha: {payload['timestamp'] or '-'}")
+    y -= 18
+    # HRV summary
+    t = payload["time"]
+    f = payload["freq"]
+    c.drawString(50, y, f"SDNN: {t.get('SDNN')}  RMSSD: {t.get('RMSSD')}  pNN50: {t.get('pNN50')}")
+    y -= 16
+    c.drawString(50, y, f"LF: {f.get('LF')}  HF: {f.get('HF')}  LF/HF: {f.get('LF_HF')}")
+    y -= 16
+    q = payload["quality"]
+    c.drawString(50, y, f"Calidad: SNR: {q.get('snr_db')} dB  Artefactos: {q.get('artifact_ratio')}")
+    y -= 18
+    fb = payload.get("feedback")
+    if fb:
+        c.drawString(50, y, f"Diagnóstico: {fb.get('label')}  Notas: {fb.get('notes')}")
+        y -= 18
+    if payload.get("plots"):
+        plot_w = width - 110
+        tach = payload.get("tachogram") or {}
+        x, v = _decimate(tach.get("t_s") or [], tach.get("rr_ms") or [])
+        y -= 150
+        _draw_series(c, x, v, 70, y, plot_w, 130, "Tacograma (RR vs tiempo)", "ms")
+        beat = payload.get("median_beat")
+        if beat and beat.get("mv"):
+            mv = np.asarray(beat["mv"], dtype=float)
+            tb = np.arange(mv.size) / float(beat["fs"]) - float(beat.get("pre_s", 0.0))
+            y -= 170
+            _draw_series(c, tb * 1000.0, mv, 70, y, plot_w, 130, "Latido mediano", "")
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+class ReportRenderer:
+    def __init__(self, workers: int = REPORT_WORKERS, max_mb: float = REPORT_CACHE_MAX_MB):
+        self.workers = workers
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._mem: "OrderedDict[Tuple[int, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "rendered": 0, "evictions": 0}
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def warm(self) -> None:
+        """Arranca los workers e importa ReportLab en cada uno."""
+        pool = self._get_pool()
+        if pool is None:
+            _import_reportlab()
+            return
+        for fut in [pool.submit(_import_reportlab) for _ in range(self.workers)]:
+            fut.result()
+
+    # --- caché ---
+    def get(self, key: Tuple[int, str]) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._mem.get(key)
+            if pdf is None:
+                self.metrics["misses"] += 1
+                return None
+            self._mem.move_to_end(key)
+            self.metrics["hits"] += 1
+            return pdf
+
+    def put(self, key: Tuple[int, str], pdf: bytes) -> None:
+        if self.max_bytes <= 0 or len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            # Versiones anteriores del mismo análisis ya no sirven
+            for old in [k for k in self._mem if k[0] == key[0] and k != key]:
+                self._bytes -= len(self._mem.pop(old))
+            if key in self._mem:
+                self._bytes -= len(self._mem[key])
+            self._mem[key] = pdf
+            self._mem.move_to_end(key)
+            self._bytes += len(pdf)
+            while self._bytes > self.max_bytes:
+                _, dropped = self._mem.popitem(last=False)
+                self._bytes -= len(dropped)
+                self.metrics["evictions"] += 1
+
+    # --- render ---
+    def submit(self, key: Tuple[int, str], payload: Dict[str, Any], check_cache: bool = True) -> Future:
+        """Future con los bytes del PDF (hit de caché = future ya resuelto)."""
+        pdf = self.get(key) if check_cache else None
+        if pdf is not None:
+            return _resolved(pdf)
+        pool = self._get_pool()
+        if pool is None:
+            try:
+                fut = _resolved(render_pdf(payload))
+            except Exception as e:
+                fut = Future()
+                fut.set_exception(e)
+        else:
+            try:
+                fut = pool.submit(render_pdf, payload)
+            except BrokenProcessPool:
+                # Un worker murió: recrear el pool
+                self._pool = None
+                fut = self._get_pool().submit(render_pdf, payload)
+        fut.add_done_callback(lambda f: self._store(key, f))
+        return fut
+
+    def _store(self, key: Tuple[int, str], fut: Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        self.metrics["rendered"] += 1
+        self.put(key, fut.result())
+
+    def render(self, key: Tuple[int, str], payload: Dict[str, Any], check_cache: bool = True) -> bytes:
+        """Bloqueante (rutas sync en el threadpool)."""
+        return self.submit(key, payload, check_cache).result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "entries": len(self._mem), "bytes": self._bytes, "workers": self.workers}
+
+
+def _resolved(value: Any) -> Future:
+    fut: Future = Future()
+    fut.set_result(value)
+    return fut
+
+
+class _ZipSink(io.RawIOBase):
+    """Destino no 'seekable' para zipfile: acumula lo escrito hasta drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+async def zip_stream(renderer: ReportRenderer, jobs: List[Tuple[str, Tuple[int, str], Any]]) -> AsyncIterator[bytes]:
+    """
+    jobs = [(nombre en el zip, clave, payload dict o bytes del PDF ya cacheado)];
+    los payload se renderizan sin volver a consultar la caché. Cada PDF se agrega al ZIP (y se emite) en el orden en que termina.
+    """
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+    pending = {}
+    for name, key, payload in jobs:
+        fut = _resolved(payload) if isinstance(payload, bytes) else renderer.submit(key, payload, check_cache=False)
+        pending[asyncio.wrap_future(fut)] = name
+    try:
+        while pending:
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                name = pending.pop(fut)
+                try:
+                    zf.writestr(name, fut.result())
+                except Exception as e:
+                    zf.writestr(name.rsplit(".", 1)[0] + ".error.txt", f"Error al generar el reporte: {e}")
+            yield sink.drain()
+    finally:
+        for fut in pending:
+            fut.cancel()
+        zf.close()
+    yield sink.drain()
+
+
+report_renderer = ReportRenderer()
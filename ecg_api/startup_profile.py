@@ -0,0 +1,117 @@
+"""
+Perfil de arranque en frío: tiempo de import por módulo (python -X importtime).
+
+    python -m ecg_api.startup_profile                      # top 25 de ecg_api.main
+    python -m ecg_api.startup_profile --budget-ms 1000     # exit 1 si se excede
+    python -m ecg_api.startup_profile --module ecg_api.auth --top 10 --json
+
+Cada corrida es un intérprete nuevo (caché de bytecode ya caliente, imports en
+frío); se toma la mediana de --repeat corridas para el chequeo de presupuesto.
+ECG_IMPORT_BUDGET_MS fija el presupuesto por defecto (sin él no se chequea).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+# (módulo, self_us, cumulative_us, profundidad)
+Row = Tuple[str, int, int, int]
+
+
+def parse_importtime(stderr: str) -> List[Row]:
+    rows: List[Row] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line.split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].split(":", 1)[1])
+            cum_us = int(parts[1])
+        except ValueError:
+            continue
+        raw = parts[2].rstrip()
+        name = raw.lstrip()
+        depth = (len(raw) - len(name) - 1) // 2
+        rows.append((name, self_us, cum_us, depth))
+    return rows
+
+
+def measure(module: str, env: Optional[Dict[str, str]] = None) -> List[Row]:
+    """Importa `module` en un subproceso con -X importtime y retorna las filas parseadas."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, **(env or {})},
+    )
+    if proc.returncode != 0:
+        err = [ln for ln in proc.stderr.splitlines() if not ln.startswith("import time:")]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(err[-15:]))
+    return parse_importtime(proc.stderr)
+
+
+def total_ms(rows: List[Row], module: str) -> float:
+    for name, _, cum, depth in reversed(rows):
+        if name == module and depth == 0:
+            return cum / 1000.0
+    return sum(cum for _, _, cum, depth in rows if depth == 0) / 1000.0
+
+
+def by_package(rows: List[Row]) -> Dict[str, float]:
+    """Tiempo propio (self) agregado por paquete de primer nivel, en ms."""
+    acc: Dict[str, float] = defaultdict(float)
+    for name, self_us, _, _ in rows:
+        acc[name.split(".", 1)[0]] += self_us / 1000.0
+    return dict(sorted(acc.items(), key=lambda kv: -kv[1]))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="ecg_api.main")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--repeat", type=int, default=3)
+    budget_env = os.getenv("ECG_IMPORT_BUDGET_MS")
+    ap.add_argument("--budget-ms", type=float, default=float(budget_env) if budget_env else None)
+    ap.add_argument("--json", action="store_true", help="salida JSON (para CI)")
+    args = ap.parse_args(argv)
+
+    runs = [measure(args.module, env={"HF_HUB_OFFLINE": os.getenv("HF_HUB_OFFLINE", "1")}) for _ in range(max(1, args.repeat))]
+    totals = [total_ms(r, args.module) for r in runs]
+    median = statistics.median(totals)
+    rows = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    top_cum = sorted(rows, key=lambda r: -r[2])[: args.top]
+    top_self = sorted(rows, key=lambda r: -r[1])[: args.top]
+    over = args.budget_ms is not None and median > args.budget_ms
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module, "total_ms": median, "runs_ms": totals, "budget_ms": args.budget_ms, "over_budget": over,
+            "modules": len(rows), "by_package_ms": by_package(rows),
+            "top_cumulative": [{"module": n, "cumulative_ms": c / 1000.0, "self_ms": s / 1000.0} for n, s, c, _ in top_cum],
+        }, indent=2))
+    else:
+        print(f"import {args.module}: {median:.0f} ms (mediana de {len(totals)}: {', '.join(f'{t:.0f}' for t in totals)}), {len(rows)} módulos")
+        print(f"\n{'acumulado ms':>12} {'propio ms':>10}  módulo")
+        for n, s, c, d in top_cum:
+            print(f"{c / 1000.0:12.1f} {s / 1000.0:10.1f}  {'  ' * d}{n}")
+        print(f"\n{'propio ms':>12}  módulo (top por tiempo propio)")
+        for n, s, _, _ in top_self:
+            print(f"{s / 1000.0:12.1f}  {n}")
+        print(f"\n{'propio ms':>12}  paquete")
+        for pkg, ms in list(by_package(rows).items())[: args.top]:
+            print(f"{ms:12.1f}  {pkg}")
+        if args.budget_ms is not None:
+            print(f"\npresupuesto {args.budget_ms:.0f} ms: {'EXCEDIDO' if over else 'ok'}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Formato de tramas para /ws/ecg.
+
+El cliente negocia el formato con query params:
+  format   = json (default, una muestra por mensaje) | binary | msgpack
+  dtype    = int16 (default) | float32
+  scale    = mV por LSB cuando dtype=int16 (default 0.001 -> 1 µV, rango ±32.7 mV)
+  batch    = muestras por trama (default 50)
+  interval_ms = tiempo máximo para cerrar una trama aunque no esté llena (default 200)
+  points_per_second | width (+ window_s) = decimar en el servidor según la resolución
+               del visor; decimation = minmax (default) | lttb. Sólo en binary/msgpack:
+               la trama lleva los puntos elegidos y sus offsets (ver version 2).
+
+En modo binary cada mensaje WebSocket binario es:
+  cabecera little-endian de 28 bytes (FRAME_HEADER) + n muestras (int16 o float32)
+    magic  4s   b"ECG1"
+    version B
+    dtype  B    1 = int16, 2 = float32
+    n      H    muestras en la trama
+    seq    I    número de trama (detectar pérdidas)
+    t0     d    timestamp de la primera muestra (epoch s, UTC)
+    fs     f    frecuencia de muestreo (Hz)
+    scale  f    mV por unidad (1.0 para float32)
+Con decimación los puntos no quedan equiespaciados: la trama usa version 2 y tras
+las muestras agrega n offsets uint32 (índice de cada punto en la señal original);
+el punto i corresponde a t0 + idx[i] / fs, con fs la frecuencia de muestreo real.
+En modo msgpack se envía un mapa con las mismas claves, `data` como bytes y, en
+version 2, `idx` como bytes (uint32).
+"""
+
+from __future__ import annotations
+
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from ecg_processing.decimate import decimate, target_points
+
+try:
+    import msgpack  # opcional
+except Exception:  # pragma: no cover - depende del entorno
+    msgpack = None  # type: ignore
+
+
+FRAME_MAGIC = b"ECG1"
+FRAME_VERSION = 1
+FRAME_VERSION_IDX = 2  # trama decimada: lleva offsets de muestra por punto
+IDX_DTYPE = np.dtype("<u4")
+FRAME_HEADER = struct.Struct("<4sBBHIdff")
+DTYPE_CODES = {"int16": 1, "float32": 2}
+CODE_DTYPES = {1: np.dtype("<i2"), 2: np.dtype("<f4")}
+
+
+@dataclass
+class StreamFormat:
+    format: str = "json"
+    dtype: str = "int16"
+    scale: float = 0.001
+    batch: int = 50
+    interval_ms: float = 200.0
+    points_per_second: Optional[float] = None
+    width: Optional[int] = None
+    window_s: Optional[float] = None
+    decimation: str = "minmax"
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str]) -> "StreamFormat":
+        fmt = (params.get("format") or "json").lower()
+        if fmt not in ("json", "binary", "msgpack"):
+            raise ValueError(f"Formato no soportado: {fmt}")
+        if fmt == "msgpack" and msgpack is None:
+            raise ValueError("msgpack no instalado en el servidor")
+        dtype = (params.get("dtype") or "int16").lower()
+        if dtype not in DTYPE_CODES:
+            raise ValueError(f"dtype no soportado: {dtype}")
+        scale = float(params.get("scale") or 0.001)
+        if scale <= 0:
+            raise ValueError("scale debe ser > 0")
+        batch = max(1, min(int(params.get("batch") or 50), 65535))
+        interval_ms = max(1.0, float(params.get("interval_ms") or 200.0))
+        pps = float(params["points_per_second"]) if params.get("points_per_second") else None
+        width = int(params["width"]) if params.get("width") else None
+        window_s = float(params["window_s"]) if params.get("window_s") else None
+        method = (params.get("decimation") or "minmax").lower()
+        if method not in ("minmax", "lttb"):
+            raise ValueError(f"decimation no soportada: {method}")
+        if (pps or width) and fmt == "json":
+            raise ValueError("La decimación requiere format=binary o msgpack")
+        return cls(fmt, dtype, scale, batch, interval_ms, pps, width, window_s, method)
+
+    @property
+    def batched(self) -> bool:
+        return self.format != "json"
+
+    def output_points(self, n: int, fs: float) -> Optional[int]:
+        """Puntos a enviar para n muestras (None = sin decimar)."""
+        if not (self.points_per_second or self.width):
+            return None
+        return target_points(n, fs, self.points_per_second, self.width, self.window_s)
+
+    def describe(self, fs: float) -> Dict[str, Any]:
+        """Mensaje 'hello' (texto JSON) que el servidor envía antes de las tramas."""
+        return {
+            "type": "hello",
+            "format": self.format,
+            "dtype": self.dtype,
+            "scale": self.scale if self.dtype == "int16" else 1.0,
+            "batch": self.batch,
+            "interval_ms": self.interval_ms,
+            "fs": fs,
+            "header": "<4sBBHIdff" if self.format == "binary" else None,
+            "decimation": {
+                "method": self.decimation,
+                "points_per_second": self.points_per_second,
+                "width": self.width,
+                "window_s": self.window_s,
+                "idx": "<u4",
+            } if (self.points_per_second or self.width) else None,
+        }
+
+
+def encode_frame(values_mV: np.ndarray, t0: float, fs: float, seq: int, fmt: StreamFormat,
+                 idx: Optional[np.ndarray] = None) -> bytes:
+    x = np.asarray(values_mV, dtype=np.float64)
+    version = FRAME_VERSION if idx is None else FRAME_VERSION_IDX
+    offsets = b"" if idx is None else np.asarray(idx).astype(IDX_DTYPE).tobytes()
+    if fmt.dtype == "int16":
+        payload = np.clip(np.rint(x / fmt.scale), -32768, 32767).astype("<i2").tobytes()
+        scale = fmt.scale
+    else:
+        payload = x.astype("<f4").tobytes()
+        scale = 1.0
+    code = DTYPE_CODES[fmt.dtype]
+    if fmt.format == "msgpack":
+        m = {
+            "v": version, "dtype": code, "n": int(x.size), "seq": seq,
+            "t0": t0, "fs": fs, "scale": scale, "data": payload,
+        }
+        if idx is not None:
+            m["idx"] = offsets
+        return msgpack.packb(m)
+    return FRAME_HEADER.pack(FRAME_MAGIC, version, code, x.size, seq & 0xFFFFFFFF, t0, fs, scale) + payload + offsets
+
+
+def decode_frame(frame: bytes) -> Tuple[Dict[str, Any], np.ndarray]:
+    """Inverso de encode_frame (útil para clientes Python). Retorna (cabecera, muestras en mV).
+
+    En tramas decimadas la cabecera trae `idx` (offsets de muestra) y `t` (epoch s
+    de cada punto); en las demás ambos son None.
+    """
+    if frame[:4] == FRAME_MAGIC:
+        magic, ver, code, n, seq, t0, fs, scale = FRAME_HEADER.unpack_from(frame)
+        data = frame[FRAME_HEADER.size:]
+        size = n * CODE_DTYPES[code].itemsize
+        offsets = data[size:] if ver == FRAME_VERSION_IDX else None
+    else:
+        m = msgpack.unpackb(frame)
+        ver, code, n, seq, t0, fs, scale, data = m["v"], m["dtype"], m["n"], m["seq"], m["t0"], m["fs"], m["scale"], m["data"]
+        offsets = m.get("idx")
+    x = np.frombuffer(data, dtype=CODE_DTYPES[code], count=n).astype(np.float64) * scale
+    idx = np.frombuffer(offsets, dtype=IDX_DTYPE, count=n) if offsets is not None else None
+    t = t0 + idx / fs if idx is not None else None
+    return {"version": ver, "n": n, "seq": seq, "t0": t0, "fs": fs, "idx": idx, "t": t}, x
+
+
+class FrameBatcher:
+    """Acumula muestras y emite una trama al llegar a `batch` muestras o `interval_ms`."""
+
+    def __init__(self, fmt: StreamFormat, fs: float):
+        self.fmt = fmt
+        self.fs = float(fs)
+        self.seq = 0
+        self._vals: List[float] = []
+        self._t0: Optional[float] = None
+        self._opened = 0.0
+
+    def add(self, value_mV: float, ts: Optional[float] = None) -> Optional[bytes]:
+        if self._t0 is None:
+            self._t0 = time.time() if ts is None else ts
+            self._opened = time.monotonic()
+        self._vals.append(value_mV)
+        if len(self._vals) >= self.fmt.batch or (time.monotonic() - self._opened) * 1000.0 >= self.fmt.interval_ms:
+            return self.flush()
+        return None
+
+    def _encode(self, values_mV: np.ndarray, t0: float) -> bytes:
+        x = np.asarray(values_mV, dtype=float)
+        idx = None
+        n_out = self.fmt.output_points(x.size, self.fs)
+        if n_out is not None and n_out < x.size:
+            # minmax/LTTB eligen índices no uniformes: se envían junto a los puntos
+            idx = decimate(x, n_out, self.fmt.decimation)
+            x = x[idx]
+        frame = encode_frame(x, t0, self.fs, self.seq, self.fmt, idx)
+        self.seq += 1
+        return frame
+
+    def add_block(self, values_mV: np.ndarray, t0: float) -> bytes:
+        """Codifica un bloque ya armado (p. ej. simulación) como una trama."""
+        return self._encode(values_mV, t0)
+
+    def flush(self) -> Optional[bytes]:
+        if not self._vals:
+            return None
+        frame = self._encode(np.asarray(self._vals), self._t0)
+        self._vals = []
+        self._t0 = None
+        return frame
@@ -0,0 +1,88 @@
+"""
+Warm-up explícito al arrancar la API.
+
+Las dependencias pesadas (SciPy, modelos, ReportLab, passlib, Twilio) se importan
+en el primer uso. ECG_WARMUP permite pagar ese costo al arrancar en lugar de en
+la primera petición: lista separada por comas de hooks, o "all".
+
+    ECG_WARMUP=pipeline,reports   # producción: workers listos antes del tráfico
+    ECG_WARMUP=                   # desarrollo (--reload): arranque mínimo
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+
+def _warm_pipeline() -> None:
+    from ecg_api.jobs import analysis_jobs
+    analysis_jobs.warm()
+
+
+def _warm_reports() -> None:
+    from ecg_api.reports import report_renderer
+    report_renderer.warm()
+
+
+def _warm_auth() -> None:
+    from passlib.hash import bcrypt_sha256
+    bcrypt_sha256.hash("warm-up")  # carga el backend bcrypt
+
+
+def _warm_notify() -> None:
+    from ecg_notify.dispatcher import get_dispatcher
+    d = get_dispatcher()
+    if d.configured("whatsapp"):
+        import twilio.rest  # noqa: F401
+    d.start()
+
+
+def _warm_streams() -> None:
+    from ecg_api.ingest_api import live_streams
+    live_streams.warm()
+
+
+def _warm_similarity() -> None:
+    from ecg_ml.similarity import get_index
+    get_index()
+
+
+WARMUPS: Dict[str, Callable[[], None]] = {
+    "pipeline": _warm_pipeline,
+    "reports": _warm_reports,
+    "auth": _warm_auth,
+    "notify": _warm_notify,
+    "similarity": _warm_similarity,
+    "streams": _warm_streams,
+}
+
+# Resultado del último run_warmups (expuesto en /admin/analysis-stats)
+last_report: Dict[str, Dict[str, object]] = {}
+
+
+def _parse(spec: Optional[str]) -> Iterable[str]:
+    names = [n.strip() for n in (spec or "").split(",") if n.strip()]
+    return list(WARMUPS) if names == ["all"] else names
+
+
+def run_warmups(spec: Optional[str] = None) -> Dict[str, Dict[str, object]]:
+    """Ejecuta los hooks pedidos (default: ECG_WARMUP). Un hook que falla no detiene el arranque."""
+    if spec is None:
+        spec = os.getenv("ECG_WARMUP", "")
+    report: Dict[str, Dict[str, object]] = {}
+    for name in _parse(spec):
+        fn = WARMUPS.get(name)
+        if fn is None:
+            report[name] = {"ok": False, "error": "unknown hook"}
+            continue
+        t0 = time.perf_counter()
+        try:
+            fn()
+            report[name] = {"ok": True, "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+        except Exception as e:
+            report[name] = {"ok": False, "ms": round((time.perf_counter() - t0) * 1000.0, 1), "error": f"{type(e).__name__}: {e}"}
+    last_report.clear()
+    last_report.update(report)
+    return report
@@ -0,0 +1,218 @@
+"""
+Decodificación de tramas de muestras enviadas por los dispositivos.
+
+Se aceptan tres codificaciones en el mismo tópico (se distinguen por el primer byte):
+
+  binary   la misma trama que /ws/ecg (ecg_api/streaming.py): cabecera "<4sBBHIdff"
+           magic b"ECG1", version, dtype (1=int16, 2=float32, 3=delta), n, seq, t0, fs, scale
+           + n muestras little-endian. Es la recomendada para ESP32 (PubSubClient:
+           subir MQTT_MAX_PACKET_SIZE; 28 + 2*n bytes).
+           dtype 3 (delta): cuentas int16 como diferencias sucesivas (la primera
+           respecto de 0) en zigzag + varint LEB128; el ECG a 250 Hz ocupa ~1 byte
+           por muestra. En C: d = x - prev; z = (d << 1) ^ (d >> 31);
+           while (z >= 0x80) { put(z | 0x80); z >>= 7; } put(z);
+  json     {"seq": 12, "t0": 1718000000.25, "fs": 250, "v": [812, 815, ...], "scale": 0.001}
+           (ArduinoJson). Sin "scale", "v" se interpreta en mV.
+  msgpack  mapa con las claves de la trama binaria y "data" en bytes.
+
+t0 es el epoch (s, UTC) de la primera muestra; 0 o ausente = el dispositivo no
+tiene reloj y el gateway asigna la hora de llegada.
+
+decode_many() lee varias tramas binarias concatenadas, o una lista JSON de tramas
+(POST /ingest/{device_id}).
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ecg_api.streaming import CODE_DTYPES, FRAME_HEADER, FRAME_MAGIC
+
+try:
+    import msgpack  # opcional
+except Exception:  # pragma: no cover - depende del entorno
+    msgpack = None  # type: ignore
+
+
+MAX_SAMPLES = 65535
+MAX_SEQ = 0xFFFFFFFF
+CODE_NAMES = {1: "int16", 2: "float32"}
+DTYPES = {name: CODE_DTYPES[code] for code, name in CODE_NAMES.items()}
+DELTA_CODE = 3
+
+
+class DecodeError(ValueError):
+    pass
+
+
+@dataclass
+class Chunk:
+    seq: int
+    t0: Optional[float]
+    fs: float
+    dtype: str
+    scale: float
+    data: bytes  # muestras tal como llegaron (se guardan sin re-codificar)
+
+    @property
+    def n(self) -> int:
+        return len(self.data) // DTYPES[self.dtype].itemsize
+
+    def values(self) -> np.ndarray:
+        """Muestras en mV (float64)."""
+        return np.frombuffer(self.data, dtype=DTYPES[self.dtype]).astype(np.float64) * self.scale
+
+
+def _check(seq, t0, fs, n) -> None:
+    if not (fs and 0 < float(fs) <= 10000):
+        raise DecodeError(f"fs inválida: {fs}")
+    if not 0 < n <= MAX_SAMPLES:
+        raise DecodeError(f"cantidad de muestras inválida: {n}")
+    # Mismo rango que el campo I (uint32) de la cabecera binaria
+    if not 0 <= int(seq) <= MAX_SEQ:
+        raise DecodeError(f"seq fuera de rango: {seq}")
+    if t0 is not None and not math.isfinite(t0):
+        raise DecodeError(f"t0 inválido: {t0}")
+
+
+def delta_encode(counts: np.ndarray) -> bytes:
+    """Cuentas int16 -> diferencias en zigzag + varint (inverso de delta_decode)."""
+    x = np.asarray(counts, dtype=np.int64)
+    d = np.diff(x, prepend=0)
+    z = ((d << 1) ^ (d >> 63)).astype(np.uint64)
+    nbytes = 1 + (z >= 0x80).astype(np.int64) + (z >= 0x4000).astype(np.int64)
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    start = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    for k in range(3):
+        sel = nbytes > k
+        byte = (z[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = nbytes[sel] > k + 1
+        out[start[sel] + k] = (byte | (more.astype(np.uint64) << np.uint64(7))).astype(np.uint8)
+    return out.tobytes()
+
+
+def delta_decode(buf: bytes, n: int, offset: int = 0) -> Tuple[np.ndarray, int]:
+    """Lee n varints desde buf[offset]; retorna (cuentas int16, bytes consumidos). Vectorizado."""
+    # Sin copiar el resto del cuerpo y mirando sólo lo que n varints pueden ocupar
+    b = np.frombuffer(buf, dtype=np.uint8, count=min(len(buf) - offset, 3 * n), offset=offset)
+    ends = np.flatnonzero(b < 0x80)
+    if ends.size < n:
+        raise DecodeError(f"delta: se esperaban {n} muestras, hay {ends.size}")
+    end = int(ends[n - 1]) + 1
+    starts = np.concatenate(([0], ends[:n - 1] + 1))
+    lengths = np.diff(np.concatenate((starts, [end])))
+    if lengths.max() > 3:
+        raise DecodeError("delta: varint de más de 3 bytes")
+    group = np.repeat(np.arange(n), lengths)
+    pos = np.arange(end) - starts[group]
+    z = np.add.reduceat((b[:end].astype(np.int64) & 0x7F) << (7 * pos), starts)
+    x = np.cumsum((z >> 1) ^ -(z & 1))
+    if x.min() < -32768 or x.max() > 32767:
+        raise DecodeError("delta: valores fuera de int16")
+    return x.astype("<i2"), end
+
+
+def _decode_binary(payload: bytes, offset: int = 0, whole: bool = True) -> Tuple[Chunk, int]:
+    """Trama binaria en payload[offset:]; retorna (chunk, offset del final de la trama)."""
+    if len(payload) - offset < FRAME_HEADER.size or payload[offset:offset + 4] != FRAME_MAGIC:
+        raise DecodeError("trama binaria truncada")
+    _, _, code, n, seq, t0, fs, scale = FRAME_HEADER.unpack_from(payload, offset)
+    _check(seq, t0, fs, n)
+    start = offset + FRAME_HEADER.size
+    if code == DELTA_CODE:
+        counts, used = delta_decode(payload, n, start)
+        data, end = counts.tobytes(), start + used
+        dtype, scale = "int16", float(scale)
+    elif code in CODE_NAMES:
+        end = start + n * CODE_DTYPES[code].itemsize
+        if len(payload) < end:
+            raise DecodeError(f"se esperaban {n} muestras, llegaron {len(payload) - start} bytes")
+        data, dtype = bytes(payload[start:end]), CODE_NAMES[code]
+        scale = float(scale) if code == 1 else 1.0
+    else:
+        raise DecodeError(f"dtype desconocido: {code}")
+    if whole and end != len(payload):
+        raise DecodeError(f"{len(payload) - end} bytes sobrantes tras la trama")
+    return Chunk(int(seq), float(t0) or None, float(fs), dtype, scale, data), end
+
+
+def _json_chunk(m: dict) -> Chunk:
+    if not isinstance(m, dict):
+        raise DecodeError("JSON inválido: se esperaba un objeto por trama")
+    try:
+        v = np.asarray(m["v"], dtype=np.float64).reshape(-1)
+        seq, fs = int(m.get("seq", 0)), float(m["fs"])
+        t0 = float(m.get("t0") or 0) or None
+        scale = float(m["scale"]) if m.get("scale") else None
+    except (ValueError, KeyError, TypeError, OverflowError) as e:
+        raise DecodeError(f"JSON inválido: {e}") from e
+    _check(seq, t0, fs, v.size)
+    if scale is not None:
+        if not (math.isfinite(scale) and scale > 0):
+            raise DecodeError(f"scale inválida: {scale}")
+        # Cuentas enteras del ADC: se guardan como int16 tal cual
+        return Chunk(seq, t0, fs, "int16", scale, np.clip(v, -32768, 32767).astype("<i2").tobytes())
+    return Chunk(seq, t0, fs, "float32", 1.0, v.astype("<f4").tobytes())
+
+
+def _decode_json(payload: bytes) -> Chunk:
+    try:
+        m = json.loads(payload)
+    except ValueError as e:
+        raise DecodeError(f"JSON inválido: {e}") from e
+    return _json_chunk(m)
+
+
+def _decode_msgpack(payload: bytes) -> Chunk:
+    if msgpack is None:
+        raise DecodeError("msgpack no instalado en el gateway")
+    try:
+        m = msgpack.unpackb(payload)
+        code, n, seq, fs = int(m["dtype"]), int(m["n"]), int(m["seq"]), float(m["fs"])
+        data = bytes(m["data"])
+        t0 = float(m.get("t0") or 0) or None
+        scale = float(m.get("scale") or 1.0) if code == 1 else 1.0
+    except Exception as e:
+        raise DecodeError(f"msgpack inválido: {e}") from e
+    if code not in CODE_NAMES or len(data) != n * CODE_DTYPES[code].itemsize:
+        raise DecodeError("msgpack: dtype o longitud de data inválidos")
+    _check(seq, t0, fs, n)
+    return Chunk(seq, t0, fs, CODE_NAMES[code], scale, data)
+
+
+def decode(payload: bytes) -> Chunk:
+    if not payload:
+        raise DecodeError("payload vacío")
+    if payload[:4] == FRAME_MAGIC:
+        return _decode_binary(payload)[0]
+    if payload[:1] == b"{":
+        return _decode_json(payload)
+    return _decode_msgpack(payload)
+
+
+def decode_many(payload: bytes, max_frames: int = 4096) -> List[Chunk]:
+    """Tramas binarias concatenadas (cada una con su cabecera ECG1), o JSON: una trama o una lista."""
+    if payload[:1] in (b"[", b"{"):
+        try:
+            m = json.loads(payload)
+        except ValueError as e:
+            raise DecodeError(f"JSON inválido: {e}") from e
+        frames = m if isinstance(m, list) else [m]
+        if not frames or len(frames) > max_frames:
+            raise DecodeError(f"se esperaban entre 1 y {max_frames} tramas")
+        return [_json_chunk(f) for f in frames]
+    out: List[Chunk] = []
+    offset = 0
+    while offset < len(payload):
+        if len(out) >= max_frames:
+            raise DecodeError(f"más de {max_frames} tramas en el cuerpo")
+        chunk, offset = _decode_binary(payload, offset, whole=False)
+        out.append(chunk)
+    if not out:
+        raise DecodeError("payload vacío")
+    return out
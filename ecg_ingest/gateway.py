@@ -0,0 +1,188 @@
+"""
+Gateway MQTT de ingesta para dispositivos ESP32/Arduino (PubSubClient / EasyMQTT).
+
+    python -m ecg_ingest.gateway --host mosquitto --prefix ecg/devices
+
+Tópicos (por dispositivo):
+  <prefix>/<device_id>/samples   tramas de muestras (ver ecg_ingest/codec.py), QoS 0 o 1
+  <prefix>/<device_id>/status    "online" / "offline" (usar como Last Will del dispositivo)
+
+El hilo de red de paho sólo encola el payload en el StreamManager
+(ecg_ingest/streams.py): cola acotada por dispositivo, INGEST_WORKERS hilos con
+planificación equitativa, StreamingPipeline y alertas por dispositivo. Las tramas
+crudas, los RR detectados y las alertas se escriben en lote desde un hilo aparte
+con su propia cola acotada (INGEST_STORE_QUEUE).
+
+Métricas Prometheus en http://:INGEST_METRICS_PORT/metrics: muestras y tramas
+por dispositivo, lag (llegada y procesamiento), huecos de seq, descartes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import re
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from ecg_api import metrics
+from ecg_ingest.streams import INGEST_DROPPED, INGEST_IDLE_S, INGEST_WORKERS, StorageWriter, StreamManager
+
+
+log = logging.getLogger("ecg_ingest.gateway")
+
+MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "ecg/devices")
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+INGEST_STORE = os.getenv("INGEST_STORE", "1") == "1"
+INGEST_METRICS_PORT = int(os.getenv("INGEST_METRICS_PORT", "9108"))
+
+_DEVICE_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+class Gateway:
+    """Transporte MQTT: cada trama se entrega a un StreamManager (propio o compartido con la API)."""
+
+    def __init__(self, host: str = MQTT_HOST, port: int = MQTT_PORT, prefix: str = MQTT_TOPIC_PREFIX,
+                 workers: int = INGEST_WORKERS, store: bool = INGEST_STORE, client_id: Optional[str] = None,
+                 manager: Optional[StreamManager] = None):
+        self.host, self.port = host, port
+        self.prefix = prefix.rstrip("/")
+        self.client_id = client_id or f"ecg-ingest-{os.getpid()}"
+        self._own_manager = manager is None
+        self.manager = manager or StreamManager(workers, storage=StorageWriter() if store else None)
+        self.client = None
+        self.connected = threading.Event()
+
+    # --- MQTT ---
+    def _build_client(self):
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id)
+        if MQTT_USERNAME:
+            client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        return client
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code.is_failure:
+            log.error("conexión MQTT rechazada: %s", reason_code)
+            return
+        client.subscribe([(f"{self.prefix}/+/samples", 1), (f"{self.prefix}/+/status", 1)])
+        self.connected.set()
+        log.info("conectado a %s:%s, suscrito a %s/+/samples", self.host, self.port, self.prefix)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        self.connected.clear()
+        log.warning("desconectado del broker (%s); paho reintenta", reason_code)
+
+    def _on_message(self, client, userdata, msg):
+        parts = msg.topic[len(self.prefix) + 1:].split("/")
+        if len(parts) != 2 or not _DEVICE_ID.match(parts[0]):
+            INGEST_DROPPED.inc(1, "bad_topic")
+            return
+        device_id, kind = parts
+        if kind == "status":
+            self._status(device_id, msg.payload.decode("utf-8", "replace").strip().lower())
+        elif kind == "samples":
+            self.submit(device_id, bytes(msg.payload))
+
+    def _status(self, device_id: str, status: str) -> None:
+        self.manager.set_online(device_id, status != "offline")
+
+    def submit(self, device_id: str, payload: bytes, received: Optional[float] = None) -> None:
+        """Encola una trama (desde el hilo de red; no decodifica)."""
+        self.manager.submit(device_id, payload, received)
+
+    # --- ciclo de vida ---
+    def start(self, connect: bool = True) -> None:
+        if self._own_manager:
+            self.manager.warm()
+            self.manager.start()
+        if connect:
+            self.client = self._build_client()
+            self.client.connect_async(self.host, self.port, keepalive=30)
+            self.client.loop_start()
+
+    def stop(self) -> None:
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+        if self._own_manager:
+            self.manager.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"connected": self.connected.is_set(), **self.manager.stats()}
+
+
+def serve_metrics(gw: Gateway, port: int = INGEST_METRICS_PORT) -> ThreadingHTTPServer:
+    """/metrics (Prometheus) y /stats (JSON por dispositivo) en un hilo."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, ctype = metrics.REGISTRY.render().encode(), metrics.CONTENT_TYPE
+            elif self.path.startswith("/stats"):
+                body, ctype = json.dumps(gw.stats()).encode(), "application/json"
+            elif self.path.startswith("/health"):
+                ok = gw.connected.is_set()
+                body, ctype = json.dumps({"status": "ok" if ok else "disconnected"}).encode(), "application/json"
+                self.send_response(200 if ok else 503)
+                self.send_header("Content-Type", ctype)
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="ingest-metrics", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=MQTT_HOST)
+    ap.add_argument("--port", type=int, default=MQTT_PORT)
+    ap.add_argument("--prefix", default=MQTT_TOPIC_PREFIX)
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    ap.add_argument("--no-store", action="store_true", help="sólo pipeline y métricas, sin escribir en la base")
+    ap.add_argument("--metrics-port", type=int, default=INGEST_METRICS_PORT)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    gw = Gateway(args.host, args.port, args.prefix, args.workers, store=INGEST_STORE and not args.no_store)
+    gw.start()
+    server = serve_metrics(gw, args.metrics_port) if args.metrics_port else None
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    signal.signal(signal.SIGINT, lambda *a: stop.set())
+    metrics.StatsCollector("ecg_ingest_storage", lambda: gw.manager.storage.stats() if gw.manager.storage else {},
+                           "Ingest storage writer")
+    while not stop.wait(30):
+        gw.manager.evict_idle(INGEST_IDLE_S)
+    gw.stop()
+    if server is not None:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+"""
+Generador de carga del StreamManager: cuántos streams sostiene un nodo con una
+latencia dada (tiempo desde que se recibe una trama hasta que el pipeline la
+procesó).
+
+    python -m ecg_ingest.loadgen --streams 50,100,200,400 --seconds 20
+    python -m ecg_ingest.loadgen --find --latency-ms 100 --percentile 99 --workers 2
+
+Cada stream es un SimDevice (ecg_ingest/simulate.py) que entrega una trama
+binaria cada chunk/fs segundos, con las fases repartidas dentro del período como
+dispositivos reales sin sincronizar. Las tramas entran por StreamManager.submit,
+igual que desde MQTT o POST /ingest, así que se mide el planificador, la
+decodificación, el pipeline y las alertas; no el broker ni la red (para eso:
+ecg_ingest.simulate contra el gateway y sus métricas ecg_ingest_process_lag_*).
+
+Un paso "cumple" si el percentil pedido queda bajo --latency-ms, no se descartó
+ninguna trama y el generador no se atrasó (si se atrasa, la medición no vale:
+el generador comparte CPU con el gestor, lo que hace la cifra conservadora).
+--find duplica la cantidad de streams hasta fallar y luego bisecta.
+Con --store se escriben RR y alertas en DATABASE_URL (sin tramas crudas).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ecg_api.streaming import StreamFormat
+from ecg_ingest.simulate import SimDevice
+from ecg_ingest.streams import INGEST_WORKERS, StorageWriter, StreamManager
+
+
+SLOTS = 10  # subdivisiones del período para repartir las fases de los dispositivos
+
+
+def run_step(n_streams: int, seconds: float, fs: float = 250.0, chunk: int = 50, workers: int = INGEST_WORKERS,
+             store: bool = False, seed: int = 0) -> Dict[str, Any]:
+    """Una corrida con n_streams durante `seconds`; retorna percentiles de latencia y contadores."""
+    fmt = StreamFormat(format="binary", dtype="int16")
+    devices = [SimDevice(f"load-{i:05d}", fs, chunk, seconds_buffer=30.0, seed=seed + i) for i in range(n_streams)]
+    manager = StreamManager(workers, storage=StorageWriter() if store else None, store_chunks=False)
+    lags: List[float] = []
+    alerts = [0]
+
+    def _on_result(stream_id: str, out: Dict[str, Any]) -> None:
+        lags.append(out["lag_s"])  # list.append es atómico con el GIL
+        alerts[0] += len(out["alerts"])
+
+    manager.add_listener(_on_result)
+    manager.warm(fs)
+    manager.start()
+    period = chunk / fs
+    slots = [devices[k::SLOTS] for k in range(SLOTS)]
+    sent = 0
+    behind = 0.0
+    cpu0, start = time.process_time(), time.monotonic()
+    tick = 0
+    while time.monotonic() - start < seconds:
+        for k, devs in enumerate(slots):
+            due = start + (tick + k / SLOTS) * period
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                behind = max(behind, -delay)
+            now = time.time()
+            for d in devs:
+                manager.submit(d.device_id, d.payload("binary", fmt), received=now)
+            sent += len(devs)
+        tick += 1
+    elapsed = time.monotonic() - start
+    deadline = time.monotonic() + 10.0
+    while manager.queued() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    cpu = time.process_time() - cpu0
+    stats = manager.stats(per_stream=False)
+    dropped = sum(st.dropped for st in manager.streams.values())
+    manager.stop()
+    lag = np.asarray(lags) * 1000.0
+    pct = {f"p{q}_ms": round(float(np.percentile(lag, q)), 2) if lag.size else None for q in (50, 90, 99)}
+    return {
+        "streams": n_streams, "workers": workers, "fs": fs, "chunk": chunk, "seconds": round(elapsed, 1),
+        "frames_sent": sent, "frames_processed": int(lag.size), "frames_dropped": dropped,
+        "frames_per_s": round(sent / elapsed, 1), "samples_per_s": round(sent * chunk / elapsed, 1),
+        **pct, "max_ms": round(float(lag.max()), 2) if lag.size else None,
+        "generator_behind_ms": round(behind * 1000.0, 1), "cpu_util": round(cpu / elapsed, 2),
+        "alerts": alerts[0], "storage": stats["storage"],
+    }
+
+
+def passes(step: Dict[str, Any], latency_ms: float, percentile: int, period_s: float) -> bool:
+    value = step.get(f"p{percentile}_ms")
+    return (value is not None and value <= latency_ms and step["frames_dropped"] == 0
+            and step["frames_processed"] >= step["frames_sent"] * 0.99
+            and step["generator_behind_ms"] <= period_s * 1000.0)
+
+
+def find_capacity(args) -> Dict[str, Any]:
+    period = args.chunk / args.fs
+    ok, bad = 0, None
+    n = args.start
+    history = []
+
+    def step(k: int) -> bool:
+        r = run_step(k, args.seconds, args.fs, args.chunk, args.workers, args.store)
+        r["pass"] = passes(r, args.latency_ms, args.percentile, period)
+        history.append(r)
+        print(json.dumps(r), flush=True)
+        return r["pass"]
+
+    while n <= args.max_streams:
+        if not step(n):
+            bad = n
+            break
+        ok, n = n, n * 2
+    if bad is not None:
+        for _ in range(args.refine):
+            if bad - ok <= max(1, ok // 20):
+                break
+            mid = (ok + bad) // 2
+            if step(mid):
+                ok = mid
+            else:
+                bad = mid
+    return {
+        "max_streams": ok, "first_failing": bad, "latency_ms": args.latency_ms, "percentile": args.percentile,
+        "workers": args.workers, "fs": args.fs, "chunk": args.chunk, "steps": len(history),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--streams", default="50,100,200", help="lista de cantidades de streams a probar")
+    ap.add_argument("--find", action="store_true", help="buscar el máximo de streams que cumple la latencia")
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--percentile", type=int, choices=(50, 90, 99), default=99)
+    ap.add_argument("--start", type=int, default=50)
+    ap.add_argument("--max-streams", type=int, default=5000)
+    ap.add_argument("--refine", type=int, default=4, help="pasos de bisección tras el primer fallo")
+    ap.add_argument("--seconds", type=float, default=20.0)
+    ap.add_argument("--fs", type=float, default=250.0)
+    ap.add_argument("--chunk", type=int, default=50, help="muestras por trama")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    ap.add_argument("--store", action="store_true", help="escribir RR y alertas en la base")
+    args = ap.parse_args(argv)
+
+    if args.find:
+        print(json.dumps(find_capacity(args)))
+        return 0
+    period = args.chunk / args.fs
+    for n in [int(x) for x in args.streams.split(",") if x.strip()]:
+        r = run_step(n, args.seconds, args.fs, args.chunk, args.workers, args.store)
+        r["pass"] = passes(r, args.latency_ms, args.percentile, period)
+        print(json.dumps(r), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
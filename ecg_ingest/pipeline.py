@@ -0,0 +1,236 @@
+"""
+Pipeline incremental por dispositivo: se le entregan bloques de muestras en orden
+y mantiene el estado entre bloques (filtros, detector de QRS, ventana de RR).
+
+Detector tipo Pan-Tompkins causal: pasa-banda 5-15 Hz (lfilter con estado),
+derivada al cuadrado e integración de 150 ms; umbral adaptativo
+NPK + 0.25 * (SPK - NPK) aprendido en los primeros LEARN_S segundos. Todo está
+vectorizado por bloque: el único bucle de Python es por latido detectado.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import signal as sps
+
+
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "10"))
+STREAM_RR_WINDOW = int(os.getenv("STREAM_RR_WINDOW", "300"))
+LEARN_S = 2.0
+REFRACTORY_S = 0.25
+DELAY_S = 0.135
+RR_MIN_MS, RR_MAX_MS = 250.0, 2000.0
+HR_BEATS = 8
+QUALITY_NO_BEAT_S = 3.0
+
+
+@lru_cache(maxsize=16)
+def _bandpass(fs: float) -> Tuple[np.ndarray, np.ndarray]:
+    # (b, a) y no sos: orden 4 es estable en forma directa y lfilter cuesta ~1/9 con bloques de 50 muestras
+    high = min(15.0, 0.45 * fs)
+    return sps.butter(2, [min(5.0, high / 2.0), high], btype="band", fs=fs)
+
+
+class StreamingPipeline:
+    def __init__(self, fs: float, window_s: float = STREAM_WINDOW_S, rr_window: int = STREAM_RR_WINDOW):
+        self.fs = float(fs)
+        self._b, self._a = _bandpass(self.fs)
+        self._w = max(1, int(round(0.150 * self.fs)))
+        # Retardo del máximo integrado respecto del pico R (pasa-banda + media móvil), medido
+        self._delay = int(round(DELAY_S * self.fs))
+        self._ring = np.zeros(max(1, int(window_s * self.fs)))
+        self.rr: Deque[float] = deque(maxlen=rr_window)
+        self.beats = 0
+        self.t_start: Optional[float] = None  # epoch de la muestra 0 del tramo actual
+        self.n_seen = 0
+        self.resets = 0
+        self._hr: Optional[float] = None
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._zi: Optional[np.ndarray] = None
+        self._tail = np.zeros(self._w)  # últimos w valores de la derivada^2 (integración entre bloques)
+        self._prev = 0.0
+        self._learn: List[np.ndarray] = []
+        self.spk: Optional[float] = None
+        self.npk: Optional[float] = None
+        self._run: Optional[Tuple[float, int]] = None  # (máximo, índice) de un pico abierto al final del bloque
+        self._last_peak: Optional[int] = None
+
+    def reset(self) -> None:
+        """Corte en la señal (hueco de tramas, reinicio del dispositivo): el RR no cruza el corte."""
+        self._reset_state()
+        self.t_start = None
+        self.n_seen = 0
+        self.resets += 1
+
+    @property
+    def threshold(self) -> Optional[float]:
+        if self.spk is None:
+            return None
+        return self.npk + 0.25 * (self.spk - self.npk)
+
+    def expected_t(self) -> Optional[float]:
+        """Epoch esperado para la siguiente muestra (para detectar huecos)."""
+        return None if self.t_start is None else self.t_start + self.n_seen / self.fs
+
+    def last_beat_t(self) -> Optional[float]:
+        """Epoch del último latido aceptado en el tramo actual."""
+        if self.t_start is None or self._last_peak is None:
+            return None
+        return self.t_start + self._last_peak / self.fs
+
+    def _features(self, x: np.ndarray) -> np.ndarray:
+        if self._zi is None:
+            self._zi = sps.lfilter_zi(self._b, self._a) * x[0]
+        y, self._zi = sps.lfilter(self._b, self._a, x, zi=self._zi)
+        d = np.empty_like(y)
+        d[0] = y[0] - self._prev
+        np.subtract(y[1:], y[:-1], out=d[1:])
+        self._prev = float(y[-1])
+        e = np.concatenate((self._tail, d * d))
+        c = np.cumsum(e)
+        mwi = (c[self._w:] - c[:-self._w]) / self._w
+        self._tail = e[-self._w:]
+        return mwi
+
+    def _accept(self, value: float, idx: int, rr_out: List[Tuple[int, float]], beats_out: List[int]) -> None:
+        refractory = int(REFRACTORY_S * self.fs)
+        if self._last_peak is not None and idx - self._last_peak < refractory:
+            return
+        self.spk = 0.125 * value + 0.875 * self.spk
+        if self._last_peak is not None:
+            rr = (idx - self._last_peak) * 1000.0 / self.fs
+            if RR_MIN_MS <= rr <= RR_MAX_MS:
+                self.rr.append(rr)
+                self._hr = None
+                rr_out.append((idx, rr))
+        self._last_peak = idx
+        self.beats += 1
+        beats_out.append(idx)
+
+    def _detect(self, mwi: np.ndarray, base: int) -> Tuple[List[int], List[Tuple[int, float]]]:
+        beats: List[int] = []
+        rr: List[Tuple[int, float]] = []
+        if self.spk is None:
+            # Umbrales con los primeros LEARN_S s; el resto del bloque ya se analiza
+            need = int(math.ceil(LEARN_S * self.fs)) - sum(a.size for a in self._learn)
+            self._learn.append(mwi[:need])
+            if mwi.size < need:
+                return beats, rr
+            learned = np.concatenate(self._learn)
+            self.spk = 0.6 * float(learned.max())
+            self.npk = float(np.median(learned))
+            self._learn = []
+            if mwi.size == need:
+                return beats, rr
+            mwi, base = mwi[need:], base + need
+        thr = self.threshold
+        above = mwi > thr
+        prev = np.concatenate(([self._run is not None], above[:-1]))
+        starts = np.flatnonzero(above & ~prev)
+        ends = np.flatnonzero(above & ~np.concatenate((above[1:], [False])))
+        if self._run is not None and above[0]:
+            starts = np.concatenate(([0], starts))
+        elif self._run is not None:
+            # El pico abierto terminó justo en el borde del bloque
+            self._accept(*self._run, rr, beats)
+            self._run = None
+        for s, e in zip(starts, ends):
+            k = s + int(mwi[s:e + 1].argmax())
+            value, idx = float(mwi[k]), base + k - self._delay
+            if s == 0 and self._run is not None:
+                if self._run[0] >= value:
+                    value, idx = self._run
+                self._run = None
+            if e == mwi.size - 1:
+                self._run = (value, idx)
+                continue
+            self._accept(value, idx, rr, beats)
+        n_below = mwi.size - int(above.sum())
+        if n_below:
+            self.npk = 0.875 * self.npk + 0.125 * float(mwi.sum() - mwi[above].sum()) / n_below
+        # Sin latidos por 3 s (cambio de amplitud/electrodo): bajar el nivel de pico
+        if self._last_peak is not None and base + mwi.size - self._last_peak > 3.0 * self.fs:
+            self.spk = self.npk + 0.5 * (self.spk - self.npk)
+        return beats, rr
+
+    def process(self, x: np.ndarray, t0: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Procesa un bloque (mV). Retorna los latidos nuevos (epoch) y los RR que cerraron
+        en este bloque, con rr_t = epoch del latido que cierra cada RR.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.size == 0:
+            return {"n": 0, "beats": [], "rr_ms": [], "rr_t": [], "hr_bpm": self.hr_bpm()}
+        if self.t_start is None:
+            self.t_start = (t0 if t0 is not None else time.time() - x.size / self.fs) - self.n_seen / self.fs
+        base = self.n_seen
+        k = min(x.size, self._ring.size)
+        self._ring[:-k] = self._ring[k:]
+        self._ring[-k:] = x[-k:]
+        beats, rr = self._detect(self._features(x), base)
+        self.n_seen += x.size
+        return {
+            "n": int(x.size),
+            "beats": [self.t_start + b / self.fs for b in beats],
+            "rr_ms": [v for _, v in rr],
+            "rr_t": [self.t_start + i / self.fs for i, _ in rr],
+            "hr_bpm": self.hr_bpm(),
+        }
+
+    def hr_bpm(self) -> Optional[float]:
+        """Mediana de los últimos HR_BEATS RR (se recalcula sólo cuando llega un RR nuevo)."""
+        if not self.rr:
+            return None
+        if self._hr is None:
+            recent = sorted(list(self.rr)[-HR_BEATS:])
+            k = len(recent)
+            med = recent[k // 2] if k % 2 else 0.5 * (recent[k // 2 - 1] + recent[k // 2])
+            self._hr = 60000.0 / med
+        return self._hr
+
+    def hrv(self) -> Dict[str, Any]:
+        from ecg_processing.hrv import compute_hrv
+        return compute_hrv(np.asarray(self.rr))
+
+    def quality(self, seconds: float = 5.0) -> Dict[str, Any]:
+        """
+        Índice simple de calidad (0-1) sobre los últimos `seconds` de señal:
+        sin señal (plana / electrodo suelto), saturación del ADC, latidos ausentes
+        y RR inconsistentes (ruido o artefactos que el detector toma por QRS).
+        """
+        _, x = self.window()
+        x = x[-int(seconds * self.fs):]
+        if x.size < self.fs:
+            return {"score": None, "label": "warming_up"}
+        if float(x.std()) < 0.005:
+            return {"score": 0.0, "label": "no_signal"}
+        score = 1.0
+        clipped = float(np.mean(x == x.max()) + np.mean(x == x.min()))
+        if clipped > 0.01:
+            score -= 0.4
+        last_beat = self.last_beat_t()
+        end = self.expected_t()
+        if last_beat is None or end - last_beat > max(QUALITY_NO_BEAT_S, 2.0 * 60.0 / (self.hr_bpm() or 60.0)):
+            score -= 0.5
+        recent = np.asarray(self.rr)[-HR_BEATS:]
+        if recent.size >= 3:
+            med = float(np.median(recent))
+            score -= 0.5 * float(np.mean(np.abs(recent - med) > 0.3 * med))
+        score = max(0.0, round(score, 2))
+        return {"score": score, "label": "good" if score >= 0.8 else "fair" if score >= 0.5 else "poor"}
+
+    def window(self) -> Tuple[Optional[float], np.ndarray]:
+        """(epoch de la primera muestra, últimas muestras en mV) de la ventana en memoria."""
+        n = min(self.n_seen, self._ring.size)
+        if self.t_start is None or n == 0:
+            return None, np.empty(0)
+        return self.t_start + (self.n_seen - n) / self.fs, self._ring[-n:].copy()
@@ -0,0 +1,131 @@
+"""
+Simulador de dispositivos: publica ECG sintético por MQTT como lo haría un ESP32.
+
+    python -m ecg_ingest.simulate --devices 200 --fs 250 --chunk 50 --seconds 60
+    python -m ecg_ingest.simulate --devices 5 --encoding json --qos 1
+
+Cada dispositivo publica una trama cada chunk/fs segundos en
+<prefix>/<device_id>/samples (formato binario de ecg_ingest/codec.py por defecto)
+y "online"/"offline" retenidos en .../status al empezar y al terminar. Se usan
+--clients conexiones MQTT repartiendo los dispositivos entre ellas.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ecg_api.streaming import StreamFormat, encode_frame
+
+
+def synthetic_ecg(fs: float, seconds: float, hr_bpm: float = 70.0, rng: Optional[np.random.Generator] = None,
+                  noise_mV: float = 0.03) -> np.ndarray:
+    """ECG sintético (mV): QRS, onda T, deriva de línea base y RR con variabilidad."""
+    rng = rng or np.random.default_rng()
+    n = int(round(seconds * fs))
+    t = np.arange(n) / fs
+    mean_rr = 60.0 / hr_bpm
+    beats = np.cumsum(rng.normal(mean_rr, 0.05 * mean_rr, int(seconds / mean_rr) + 2)) - rng.uniform(0, mean_rr)
+    x = 0.15 * np.sin(2 * np.pi * 0.25 * t + rng.uniform(0, 2 * np.pi)) + rng.normal(0, noise_mV, n)
+    for b in beats:
+        lo, hi = np.searchsorted(t, [b - 0.1, b + 0.45])
+        tt = t[lo:hi] - b
+        x[lo:hi] += 1.2 * np.exp(-(tt / 0.012) ** 2) - 0.2 * np.exp(-((tt - 0.03) / 0.01) ** 2) + 0.3 * np.exp(-((tt - 0.25) / 0.05) ** 2)
+    return x
+
+
+class SimDevice:
+    def __init__(self, device_id: str, fs: float, chunk: int, seconds_buffer: float = 60.0, seed: int = 0):
+        self.device_id = device_id
+        self.fs = fs
+        self.chunk = chunk
+        rng = np.random.default_rng(seed)
+        self.signal = synthetic_ecg(fs, seconds_buffer, hr_bpm=float(rng.uniform(55, 110)), rng=rng)
+        self.pos = 0
+        self.seq = 0
+        # La primera trama se publica al completar su bloque, como en el dispositivo
+        self.t0 = time.time() - chunk / fs
+
+    def next_block(self) -> np.ndarray:
+        if self.pos + self.chunk > self.signal.size:
+            self.pos = 0
+        x = self.signal[self.pos:self.pos + self.chunk]
+        self.pos += self.chunk
+        return x
+
+    def payload(self, encoding: str, fmt: StreamFormat) -> bytes:
+        x = self.next_block()
+        t0 = self.t0 + self.seq * self.chunk / self.fs
+        if encoding == "json":
+            out = json.dumps({"seq": self.seq, "t0": t0, "fs": self.fs, "scale": fmt.scale,
+                              "v": np.rint(x / fmt.scale).astype(int).tolist()}).encode()
+        else:
+            out = encode_frame(x, t0, self.fs, self.seq, fmt)
+        self.seq += 1
+        return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import paho.mqtt.client as mqtt
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=os.getenv("MQTT_HOST", "localhost"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    ap.add_argument("--prefix", default=os.getenv("MQTT_TOPIC_PREFIX", "ecg/devices"))
+    ap.add_argument("--devices", type=int, default=10)
+    ap.add_argument("--clients", type=int, default=0, help="conexiones MQTT (default: 1 cada 50 dispositivos)")
+    ap.add_argument("--fs", type=float, default=250.0)
+    ap.add_argument("--chunk", type=int, default=50, help="muestras por trama")
+    ap.add_argument("--seconds", type=float, default=30.0)
+    ap.add_argument("--encoding", choices=("binary", "msgpack", "json"), default="binary")
+    ap.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    args = ap.parse_args(argv)
+
+    fmt = StreamFormat(format="msgpack" if args.encoding == "msgpack" else "binary", dtype="int16")
+    devices = [SimDevice(f"sim-{i:04d}", args.fs, args.chunk, seed=i) for i in range(args.devices)]
+    n_clients = args.clients or max(1, (args.devices + 49) // 50)
+    clients = []
+    for c in range(n_clients):
+        cl = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"ecg-sim-{os.getpid()}-{c}")
+        cl.connect(args.host, args.port, keepalive=30)
+        cl.loop_start()
+        clients.append(cl)
+    by_client: Dict[int, List[SimDevice]] = {c: devices[c::n_clients] for c in range(n_clients)}
+    for c, devs in by_client.items():
+        for d in devs:
+            clients[c].publish(f"{args.prefix}/{d.device_id}/status", "online", qos=1, retain=True)
+
+    period = args.chunk / args.fs
+    start = time.monotonic()
+    sent = 0
+    tick = 0
+    while time.monotonic() - start < args.seconds:
+        for c, devs in by_client.items():
+            for d in devs:
+                clients[c].publish(f"{args.prefix}/{d.device_id}/samples", d.payload(args.encoding, fmt), qos=args.qos)
+                sent += 1
+        tick += 1
+        delay = start + tick * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.monotonic() - start
+    for c, devs in by_client.items():
+        for d in devs:
+            clients[c].publish(f"{args.prefix}/{d.device_id}/status", "offline", qos=1, retain=True)
+        clients[c].disconnect()
+        clients[c].loop_stop()
+    print(json.dumps({
+        "devices": args.devices, "clients": n_clients, "frames": sent, "seconds": round(elapsed, 2),
+        "frames_per_s": round(sent / elapsed, 1), "samples_per_s": round(sent * args.chunk / elapsed, 1),
+        "behind_schedule_s": round(max(0.0, elapsed - args.seconds), 3),
+    }))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,546 @@
+"""
+Gestor de streams en vivo: estado por stream, planificación equitativa sobre un
+pool de hilos y alertas por stream. Lo usan el gateway MQTT (ecg_ingest/gateway.py)
+y la API (POST /ingest/{device_id} alimenta el mismo gestor, ecg_api/ingest_api.py).
+
+Cada stream (un dispositivo / paciente) tiene su StreamingPipeline (estado de
+filtros, detector de QRS y ventana de RR para HRV) y una cola acotada de tramas
+(INGEST_DEVICE_QUEUE; si se llena se descarta la más vieja). Quien recibe sólo
+encola: decodificar y procesar queda para los workers.
+
+Planificación: deficit round-robin por bytes. Un stream entra a la fila de
+listos cuando recibe algo; en cada turno suma INGEST_QUANTUM_BYTES a su crédito,
+procesa tramas mientras el crédito alcance y vuelve al final de la fila. Así un
+dispositivo que sube minutos por HTTP no retrasa a cientos que publican 50
+muestras por MQTT, y las tramas de un mismo stream se procesan en orden (un
+stream nunca está en dos workers a la vez).
+
+Alertas (StreamAlerts), evaluadas cada STREAM_ALERT_EVAL_S de señal y sin repetir
+el mismo tipo antes de STREAM_ALERT_COOLDOWN_S:
+    tachycardia / bradycardia   FC (mediana de 8 RR) > ALERT_TACHY_BPM / < ALERT_BRADY_BPM
+    pause                       sin latidos por más de ALERT_PAUSE_S con señal llegando
+    AF_suspected                detect_alerts (ecg_api/pipeline.py) sobre los últimos 60 RR
+    HRV_*                       hrv_alerts sobre la ventana de RR, cada STREAM_HRV_EVAL_S
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ecg_api import metrics
+from ecg_api.pipeline import detect_alerts, hrv_alerts
+from ecg_ingest.codec import Chunk, DecodeError, decode
+
+if TYPE_CHECKING:
+    from ecg_ingest.pipeline import StreamingPipeline
+
+
+log = logging.getLogger("ecg_ingest.streams")
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_DEVICE_QUEUE = int(os.getenv("INGEST_DEVICE_QUEUE", "64"))
+# 1 KB por turno = 8 tramas binarias de 50 muestras int16
+INGEST_QUANTUM_BYTES = int(os.getenv("INGEST_QUANTUM_BYTES", "1024"))
+INGEST_STORE_QUEUE = int(os.getenv("INGEST_STORE_QUEUE", "5000"))
+INGEST_FLUSH_S = float(os.getenv("INGEST_FLUSH_S", "1.0"))
+INGEST_IDLE_S = float(os.getenv("INGEST_IDLE_S", "300"))
+INGEST_GAP_S = float(os.getenv("INGEST_GAP_S", "1.0"))
+# Sin t0, seq <= INGEST_REBOOT_SEQ tras retroceder más de INGEST_REBOOT_JUMP = reinicio del dispositivo
+INGEST_REBOOT_SEQ = int(os.getenv("INGEST_REBOOT_SEQ", "16"))
+INGEST_REBOOT_JUMP = int(os.getenv("INGEST_REBOOT_JUMP", "256"))
+STREAM_ALERT_EVAL_S = float(os.getenv("STREAM_ALERT_EVAL_S", "5"))
+STREAM_ALERT_COOLDOWN_S = float(os.getenv("STREAM_ALERT_COOLDOWN_S", "300"))
+STREAM_HRV_EVAL_S = float(os.getenv("STREAM_HRV_EVAL_S", "60"))
+STREAM_HRV_MIN_RR = int(os.getenv("STREAM_HRV_MIN_RR", "60"))
+ALERT_TACHY_BPM = float(os.getenv("ALERT_TACHY_BPM", "120"))
+ALERT_BRADY_BPM = float(os.getenv("ALERT_BRADY_BPM", "45"))
+ALERT_PAUSE_S = float(os.getenv("ALERT_PAUSE_S", "3.0"))
+AF_RR_WINDOW = 60
+AF_MIN_RR = 20
+
+INGEST_MESSAGES = metrics.Counter("ecg_ingest_messages_total", "Sample frames received, by device", ("device",))
+INGEST_SAMPLES = metrics.Counter("ecg_ingest_samples_total", "Samples processed, by device", ("device",))
+INGEST_BEATS = metrics.Counter("ecg_ingest_beats_total", "R peaks detected, by device", ("device",))
+INGEST_ARRIVAL_LAG = metrics.Gauge("ecg_ingest_arrival_lag_seconds",
+                                   "Receive time minus device time of the last sample of the latest frame", ("device",))
+INGEST_PROCESS_LAG = metrics.Histogram("ecg_ingest_process_lag_seconds", "Time from receive to pipeline done",
+                                       buckets=metrics.STAGE_BUCKETS)
+INGEST_DEVICE_LAG = metrics.Gauge("ecg_ingest_process_lag_last_seconds", "Receive-to-processed time of the latest frame",
+                                  ("device",))
+INGEST_HR = metrics.Gauge("ecg_ingest_hr_bpm", "Latest heart rate estimate, by device", ("device",))
+INGEST_GAPS = metrics.Counter("ecg_ingest_seq_gaps_total", "Frames missing according to seq, by device", ("device",))
+INGEST_DROPPED = metrics.Counter("ecg_ingest_dropped_total", "Frames or rows dropped", ("reason",))
+INGEST_QUEUED = metrics.Gauge("ecg_ingest_queued_frames", "Frames waiting in device queues")
+INGEST_DEVICES = metrics.Gauge("ecg_ingest_devices", "Devices with live pipeline state")
+INGEST_STORED = metrics.Counter("ecg_ingest_stored_rows_total", "Rows written to the database", ("table",))
+STREAM_ALERTS = metrics.Counter("ecg_stream_alerts_total", "Alerts raised by live streams", ("type",))
+
+Frame = Union[bytes, Chunk]
+
+
+def _jsonable(details: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: float(v) if isinstance(v, (np.floating, np.integer)) else v for k, v in details.items()}
+
+
+class StreamAlerts:
+    """Reglas de alerta sobre el estado de un StreamingPipeline, con enfriamiento por tipo."""
+
+    def __init__(self, eval_s: float = STREAM_ALERT_EVAL_S, cooldown_s: float = STREAM_ALERT_COOLDOWN_S,
+                 hrv_eval_s: float = STREAM_HRV_EVAL_S):
+        self.eval_s = eval_s
+        self.cooldown_s = cooldown_s
+        self.hrv_eval_s = hrv_eval_s
+        self._next_eval: Optional[float] = None
+        self._next_hrv: Optional[float] = None
+        self._last: Dict[str, float] = {}
+        self.raised = 0
+
+    def _rules(self, p: StreamingPipeline, t: float) -> List[Dict[str, Any]]:
+        found: List[Dict[str, Any]] = []
+        hr = p.hr_bpm()
+        if hr is not None and hr > ALERT_TACHY_BPM:
+            found.append({"type": "tachycardia", "severity": "warning", "details": {"hr_bpm": round(hr, 1)}})
+        elif hr is not None and hr < ALERT_BRADY_BPM:
+            found.append({"type": "bradycardia", "severity": "warning", "details": {"hr_bpm": round(hr, 1)}})
+        last_beat = p.last_beat_t()
+        if last_beat is not None and t - last_beat > ALERT_PAUSE_S:
+            found.append({"type": "pause", "severity": "critical", "details": {"seconds": round(t - last_beat, 2)}})
+        if len(p.rr) >= AF_MIN_RR:
+            found.extend(detect_alerts(np.asarray(p.rr)[-AF_RR_WINDOW:], []))
+        if len(p.rr) >= STREAM_HRV_MIN_RR and (self._next_hrv is None or t >= self._next_hrv):
+            self._next_hrv = t + self.hrv_eval_s
+            found.extend(hrv_alerts(p.hrv()))
+        return found
+
+    def evaluate(self, p: StreamingPipeline, t: Optional[float]) -> List[Dict[str, Any]]:
+        """Alertas nuevas al tiempo de señal t (epoch); [] si aún no toca evaluar."""
+        if t is None or (self._next_eval is not None and t < self._next_eval):
+            return []
+        self._next_eval = t + self.eval_s
+        out = []
+        for a in self._rules(p, t):
+            last = self._last.get(a["type"])
+            if last is not None and t - last < self.cooldown_s:
+                continue
+            self._last[a["type"]] = t
+            out.append({**a, "t": t, "details": _jsonable(a.get("details") or {})})
+        self.raised += len(out)
+        return out
+
+
+@dataclass
+class StreamState:
+    stream_id: str
+    frames: Deque[Tuple[float, Frame, int, bool]]
+    pipeline: Optional[StreamingPipeline] = None
+    alerts: StreamAlerts = field(default_factory=StreamAlerts)
+    scheduled: bool = False
+    deficit: int = 0
+    last_seq: Optional[int] = None
+    last_seen: float = 0.0
+    online: bool = True
+    received: int = 0
+    processed: int = 0
+    dropped: int = 0
+    gaps: int = 0
+    errors: int = 0
+    duplicates: int = 0
+    reboots: int = 0
+    lag_s: Optional[float] = None
+
+    def summary(self) -> Dict[str, Any]:
+        p = self.pipeline
+        return {
+            "online": self.online, "last_seen": self.last_seen, "queued": len(self.frames),
+            "received": self.received, "processed": self.processed, "dropped": self.dropped,
+            "gaps": self.gaps, "errors": self.errors, "duplicates": self.duplicates,
+            "reboots": self.reboots,
+            "fs": p.fs if p else None, "beats": p.beats if p else 0,
+            "hr_bpm": p.hr_bpm() if p else None, "alerts": self.alerts.raised,
+        }
+
+
+class StorageWriter:
+    """Escribe tramas crudas (sample_chunks), RR (events) y alertas en lotes desde un hilo propio."""
+
+    TABLES = ("sample_chunks", "events", "alerts")
+
+    def __init__(self, maxsize: int = INGEST_STORE_QUEUE, flush_s: float = INGEST_FLUSH_S, init_db: bool = True):
+        self.q: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=maxsize)
+        self.flush_s = flush_s
+        self.init_db = init_db
+        self.written = {t: 0 for t in self.TABLES}
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ingest-storage", daemon=True)
+
+    def start(self) -> None:
+        if self.init_db:
+            from ecg_storage.db import init_db
+            init_db()
+        self._thread.start()
+
+    def put(self, table: str, row: Dict[str, Any]) -> bool:
+        try:
+            self.q.put_nowait((table, row))
+            return True
+        except queue.Full:
+            INGEST_DROPPED.inc(1, f"store_{table}")
+            return False
+
+    def _drain(self) -> Dict[str, List[Dict[str, Any]]]:
+        out: Dict[str, List[Dict[str, Any]]] = {t: [] for t in self.TABLES}
+        try:
+            table, row = self.q.get(timeout=self.flush_s)
+        except queue.Empty:
+            return out
+        out[table].append(row)
+        deadline = time.monotonic() + self.flush_s
+        while time.monotonic() < deadline:
+            try:
+                table, row = self.q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            out[table].append(row)
+        return out
+
+    def _write(self, batch: Dict[str, List[Dict[str, Any]]]) -> None:
+        from ecg_storage.bulk import insert_alerts, insert_events
+        from ecg_storage.db import SessionLocal
+        from ecg_storage.samples import insert_chunks
+        db = SessionLocal()
+        try:
+            if batch["sample_chunks"]:
+                n = insert_chunks(db, batch["sample_chunks"])
+                self.written["sample_chunks"] += n
+                INGEST_STORED.inc(n, "sample_chunks")
+            for table, insert in (("events", insert_events), ("alerts", insert_alerts)):
+                if batch[table]:
+                    insert(db, batch[table])
+                    self.written[table] += len(batch[table])
+                    INGEST_STORED.inc(len(batch[table]), table)
+        except Exception:
+            db.rollback()
+            self.errors += 1
+            INGEST_DROPPED.inc(sum(len(v) for v in batch.values()), "store_error")
+            log.exception("error escribiendo lote de ingesta")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self.q.empty()):
+            batch = self._drain()
+            if any(batch.values()):
+                self._write(batch)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self.q.qsize(), "errors": self.errors, **{f"written_{k}": v for k, v in self.written.items()}}
+
+
+Listener = Callable[[str, Dict[str, Any]], None]
+
+
+class StreamManager:
+    """
+    Estado y procesamiento de muchos streams concurrentes. submit() se llama desde
+    el hilo de red (MQTT) o desde la API; los workers procesan por turnos.
+    Los listeners reciben (stream_id, resultado de la trama) desde los workers.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, storage: Optional[StorageWriter] = None, store_chunks: bool = True,
+                 quantum_bytes: int = INGEST_QUANTUM_BYTES, queue_size: int = INGEST_DEVICE_QUEUE):
+        self.workers = max(1, workers)
+        self.storage = storage
+        self.store_chunks = store_chunks  # tramas crudas en sample_chunks (además de RR y alertas)
+        self.quantum = max(1, quantum_bytes)
+        self.queue_size = max(1, queue_size)
+        self.streams: Dict[str, StreamState] = {}
+        self.alerts: Deque[Dict[str, Any]] = deque(maxlen=500)
+        self.alert_seq = 0  # alertas emitidas desde el arranque (para leer sólo las nuevas de self.alerts)
+        self.listeners: List[Listener] = []
+        self.decode_errors = 0
+        self._lock = threading.Lock()
+        self._ready: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def add_listener(self, fn: Listener) -> None:
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn: Listener) -> None:
+        try:
+            self.listeners.remove(fn)
+        except ValueError:
+            pass
+
+    # --- entrada ---
+    def submit(self, stream_id: str, frame: Frame, received: Optional[float] = None, persisted: bool = False) -> None:
+        """
+        Encola una trama (payload sin decodificar o Chunk ya decodificado).
+        persisted: la trama cruda ya está en sample_chunks (POST /ingest); sólo se guardan RR y alertas.
+        """
+        now = time.time() if received is None else received
+        cost = len(frame) if isinstance(frame, (bytes, bytearray)) else len(frame.data)
+        with self._lock:
+            st = self.streams.get(stream_id)
+            if st is None:
+                st = self.streams[stream_id] = StreamState(stream_id, deque(maxlen=self.queue_size))
+                INGEST_DEVICES.set(len(self.streams))
+            if len(st.frames) == st.frames.maxlen:
+                st.dropped += 1
+                INGEST_DROPPED.inc(1, "device_queue_full")
+            else:
+                INGEST_QUEUED.inc()
+            st.frames.append((now, frame, cost, persisted))
+            st.received += 1
+            st.last_seen = now
+            st.online = True
+            INGEST_MESSAGES.inc(1, stream_id)
+            if not st.scheduled:
+                st.scheduled = True
+                self._ready.put(stream_id)
+
+    def submit_many(self, stream_id: str, frames: Iterable[Frame], received: Optional[float] = None,
+                    persisted: bool = False) -> None:
+        for f in frames:
+            self.submit(stream_id, f, received, persisted)
+
+    def set_online(self, stream_id: str, online: bool) -> None:
+        with self._lock:
+            st = self.streams.get(stream_id)
+            if st is None:
+                return
+            st.online = online
+            if not online:
+                # El siguiente tramo empieza de cero (el RR no cruza la desconexión)
+                st.last_seq = None
+
+    # --- planificador (deficit round-robin) ---
+    def _worker(self) -> None:
+        while True:
+            stream_id = self._ready.get()
+            if stream_id is None:
+                return
+            st = self.streams.get(stream_id)
+            if st is not None:
+                self._turn(st)
+
+    def _turn(self, st: StreamState) -> None:
+        with self._lock:
+            st.deficit += self.quantum
+        while True:
+            with self._lock:
+                if not st.frames or st.frames[0][2] > st.deficit:
+                    break
+                received, frame, cost, persisted = st.frames.popleft()
+                st.deficit -= cost
+            INGEST_QUEUED.dec()
+            try:
+                self._process(st, received, frame, persisted)
+            except Exception:
+                st.errors += 1
+                log.exception("error procesando trama de %s", st.stream_id)
+        with self._lock:
+            if st.frames:
+                self._ready.put(st.stream_id)  # al final de la fila: turno para los demás
+            else:
+                st.scheduled = False
+                st.deficit = 0
+
+    # --- procesamiento ---
+    def _process(self, st: StreamState, received: float, frame: Frame, persisted: bool = False) -> None:
+        if isinstance(frame, Chunk):
+            chunk = frame
+        else:
+            try:
+                chunk = decode(frame)
+            except DecodeError as e:
+                st.errors += 1
+                self.decode_errors += 1
+                INGEST_DROPPED.inc(1, "decode_error")
+                log.debug("trama inválida de %s: %s", st.stream_id, e)
+                return
+        p = st.pipeline
+        if st.last_seq is not None and self._rebooted(st.last_seq, chunk):
+            # Reinicio sin aviso "offline": tramo nuevo en lugar de descartar hasta superar el seq viejo
+            st.reboots += 1
+            st.last_seq = None
+        if st.last_seq is not None and chunk.seq <= st.last_seq and self._already_seen(p, chunk):
+            # Reentrega QoS 1, reintento HTTP o trama fuera de orden ya superada
+            st.duplicates += 1
+            INGEST_DROPPED.inc(1, "duplicate")
+            return
+        if p is None or p.fs != chunk.fs:
+            # SciPy se carga con el primer stream, no al importar (la API importa este módulo)
+            from ecg_ingest.pipeline import StreamingPipeline
+            p = st.pipeline = StreamingPipeline(chunk.fs)
+        n = chunk.n
+        t0 = chunk.t0 if chunk.t0 is not None else (p.expected_t() or received - n / chunk.fs)
+        expected = p.expected_t()
+        if st.last_seq is not None and chunk.seq > st.last_seq + 1:
+            missing = chunk.seq - st.last_seq - 1
+            st.gaps += missing
+            INGEST_GAPS.inc(missing, st.stream_id)
+        if st.last_seq is None or (expected is not None and abs(t0 - expected) > INGEST_GAP_S):
+            if p.n_seen:
+                p.reset()
+        st.last_seq = chunk.seq
+        out = p.process(chunk.values(), t0)
+        alerts = st.alerts.evaluate(p, p.expected_t())
+        st.processed += 1
+        done = time.time()
+        st.lag_s = done - received
+        INGEST_SAMPLES.inc(n, st.stream_id)
+        INGEST_ARRIVAL_LAG.set(received - (t0 + n / chunk.fs), st.stream_id)
+        INGEST_PROCESS_LAG.observe(done - received)
+        INGEST_DEVICE_LAG.set(done - received, st.stream_id)
+        if out["beats"]:
+            INGEST_BEATS.inc(len(out["beats"]), st.stream_id)
+        if out["hr_bpm"] is not None:
+            INGEST_HR.set(round(out["hr_bpm"], 1), st.stream_id)
+        if alerts:
+            with self._lock:
+                for a in alerts:
+                    a["stream"] = st.stream_id
+                    self.alerts.append(a)
+                    self.alert_seq += 1
+                    STREAM_ALERTS.inc(1, a["type"])
+        if self.storage is not None:
+            self._store(st.stream_id, chunk, t0, out, alerts, self.store_chunks and not persisted)
+        if self.listeners:
+            out.update(t_end=t0 + n / chunk.fs, lag_s=done - received, alerts=alerts)
+            for fn in list(self.listeners):
+                try:
+                    fn(st.stream_id, out)
+                except Exception:
+                    log.exception("listener de streams falló")
+
+    @staticmethod
+    def _rebooted(last_seq: int, chunk: Chunk) -> bool:
+        """
+        Dispositivo sin reloj que reinició sin publicar "offline": seq vuelve a casi 0
+        tras un valor alto. Un reintento o una trama fuera de orden retrocede poco.
+        """
+        return (chunk.t0 is None and chunk.seq <= INGEST_REBOOT_SEQ
+                and last_seq - chunk.seq > INGEST_REBOOT_JUMP)
+
+    @staticmethod
+    def _already_seen(p: Optional[StreamingPipeline], chunk: Chunk) -> bool:
+        """
+        seq no avanzó: es un duplicado si la trama termina antes de lo ya procesado.
+        Un dispositivo reiniciado vuelve a seq 0 con un t0 actual (tramo nuevo, no duplicado).
+        Sin reloj en el dispositivo sólo queda el seq (ver _rebooted).
+        """
+        expected = p.expected_t() if p is not None else None
+        if chunk.t0 is None or expected is None:
+            return True
+        return chunk.t0 + chunk.n / chunk.fs <= expected + 0.5 / chunk.fs
+
+    def _store(self, stream_id: str, chunk: Chunk, t0: float, out: Dict[str, Any], alerts: List[Dict[str, Any]],
+               store_chunk: bool) -> None:
+        from ecg_storage.samples import chunk_row
+        if store_chunk:
+            self.storage.put("sample_chunks", chunk_row(stream_id, chunk.seq, t0, chunk.fs, chunk.dtype, chunk.scale, chunk.data, chunk.n))
+        source = f"device:{stream_id}"[:64]
+        for ts, rr in zip(out["rr_t"], out["rr_ms"]):
+            self.storage.put("events", {
+                "timestamp": datetime.datetime.utcfromtimestamp(ts), "rr_ms": rr, "hr_bpm": 60000.0 / rr,
+                "source": source, "extras": None,
+            })
+        for a in alerts:
+            self.storage.put("alerts", {
+                "timestamp": datetime.datetime.utcfromtimestamp(a["t"]), "type": a["type"], "severity": a["severity"],
+                "details": {**a["details"], "source": source},
+            })
+
+    def evict_idle(self, idle_s: float = INGEST_IDLE_S) -> int:
+        """Libera el estado de streams sin tramas hace más de idle_s."""
+        cutoff = time.time() - idle_s
+        with self._lock:
+            stale = [s for s, st in self.streams.items() if st.last_seen < cutoff and not st.frames and not st.scheduled]
+            for s in stale:
+                del self.streams[s]
+            INGEST_DEVICES.set(len(self.streams))
+        return len(stale)
+
+    # --- ciclo de vida ---
+    def warm(self, fs: float = 250.0) -> None:
+        """Importa SciPy y diseña el filtro antes del tráfico (si no, lo paga la primera trama)."""
+        from ecg_ingest.pipeline import StreamingPipeline
+        StreamingPipeline(fs).process(np.zeros(int(fs)))
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        if self.storage is not None:
+            self.storage.start()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"stream-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self._ready.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        if self.storage is not None:
+            self.storage.stop()
+
+    def new_alerts(self, since_seq: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(alert_seq actual, alertas emitidas después de since_seq que siguen en memoria)."""
+        with self._lock:
+            seq, recent = self.alert_seq, list(self.alerts)
+        n = min(seq - since_seq, len(recent))
+        return seq, recent[len(recent) - n:] if n > 0 else []
+
+    def snapshot(self, stream_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Métricas derivadas actuales por stream: FC, último RR, calidad, estado."""
+        with self._lock:
+            states = list(self.streams.values()) if stream_ids is None else [
+                self.streams[s] for s in stream_ids if s in self.streams]
+        out = []
+        for st in states:
+            p = st.pipeline
+            hr = p.hr_bpm() if p else None
+            rr = p.rr[-1] if p and p.rr else None
+            out.append({
+                "stream": st.stream_id, "online": st.online, "t": p.expected_t() if p else None,
+                "hr_bpm": round(hr, 1) if hr is not None else None, "rr_ms": rr,
+                "rr_t": p.last_beat_t() if p else None,
+                "quality": p.quality() if p else {"score": None, "label": "warming_up"},
+                "lag_s": round(st.lag_s, 3) if st.lag_s is not None else None,
+                "alerts": st.alerts.raised,
+            })
+        return out
+
+    def queued(self) -> int:
+        with self._lock:
+            return sum(len(st.frames) for st in self.streams.values())
+
+    def stats(self, per_stream: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            streams = {s: st.summary() for s, st in self.streams.items()}
+        out = {
+            "workers": self.workers, "streams": len(streams), "queued": sum(d["queued"] for d in streams.values()),
+            "decode_errors": self.decode_errors, "alerts": sum(d["alerts"] for d in streams.values()),
+            "storage": self.storage.stats() if self.storage else None,
+        }
+        if per_stream:
+            out["per_stream"] = streams
+        return out
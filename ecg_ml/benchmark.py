@@ -0,0 +1,204 @@
+"""
+Benchmark de throughput y calidad de los modelos sobre ECG5000 (ecg.csv.zip).
+
+Para cada modelo registrado reporta:
+  - accuracy y F1 por clase (normal / anormal) cuando el modelo clasifica
+  - latencia de una muestra (p50, p99)
+  - throughput en lote para varios tamaños de batch
+  - RSS pico del proceso
+
+ECG5000 no tiene frecuencia de muestreo real (latidos interpolados a 140 puntos):
+a los modelos se les pasa una fs NOMINAL (datasets.ECG5000_NOMINAL_FS, o --fs) y
+el reporte la marca como supuesta. El throughput se mide en latidos por segundo
+de CPU, no en segundos de señal.
+
+Uso:
+	python -m ecg_ml.benchmark --out bench_results.json [--models ecg_classifier,ecg2hrv]
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import platform
+import resource
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from ecg_ml.datasets import ECG5000_NOMINAL_FS, ECG5000_PATH, load_ecg5000
+
+
+# Supuesto, no dato del dataset: ver ECG5000_NOMINAL_FS
+ECG5000_FS = ECG5000_NOMINAL_FS
+ECG5000_CLASSES = {1: "normal", 0: "abnormal"}
+
+
+def _peak_rss_mb() -> float:
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reporta KiB, macOS bytes
+	return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+
+def _f1_report(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, Any]:
+	out: Dict[str, Any] = {"accuracy": float(np.mean(y_true == y_pred)), "per_class": {}}
+	for cls, name in ECG5000_CLASSES.items():
+		tp = int(np.sum((y_pred == cls) & (y_true == cls)))
+		fp = int(np.sum((y_pred == cls) & (y_true != cls)))
+		fn = int(np.sum((y_pred != cls) & (y_true == cls)))
+		prec = tp / (tp + fp) if tp + fp else 0.0
+		rec = tp / (tp + fn) if tp + fn else 0.0
+		f1 = 2 * prec * rec / (prec + rec) if prec + rec else 0.0
+		out["per_class"][name] = {"precision": prec, "recall": rec, "f1": f1, "support": int(np.sum(y_true == cls))}
+	out["macro_f1"] = float(np.mean([v["f1"] for v in out["per_class"].values()]))
+	return out
+
+
+# --- Registro de modelos ---
+# Cada entrada expone: single(x) -> Any, batch(X) -> Any, y opcionalmente labels(X) -> y_pred (0/1)
+class ModelSpec:
+	def __init__(self, single: Callable, batch: Callable, labels: Optional[Callable] = None):
+		self.single = single
+		self.batch = batch
+		self.labels = labels
+
+
+def _classifier_spec(fs: float = ECG5000_FS) -> ModelSpec:
+	from ecg_ml.classifier import get_classifier
+	clf = get_classifier()
+	normal_idx = clf.labels.index("normal")
+
+	def labels(X: np.ndarray) -> np.ndarray:
+		return (clf.predict_batch(X, fs)["top"] == normal_idx).astype(np.int8)
+
+	return ModelSpec(
+		single=lambda x: clf.predict(x, fs),
+		batch=lambda X: clf.predict_batch(X, fs),
+		labels=labels,
+	)
+
+
+def _ecg2hrv_spec(fs: float = ECG5000_FS) -> Optional[ModelSpec]:
+	from ecg_ml.hf_loader import get_ecg2hrv_model, run_ecg2hrv
+	model = get_ecg2hrv_model()
+	if model is None:
+		return None
+	return ModelSpec(
+		single=lambda x: run_ecg2hrv(model, x, fs),
+		batch=lambda X: run_ecg2hrv(model, X, fs),
+	)
+
+
+MODELS: Dict[str, Callable[..., Optional[ModelSpec]]] = {
+	"ecg_classifier": _classifier_spec,
+	"ecg2hrv": _ecg2hrv_spec,
+}
+
+
+def bench_model(
+	spec: ModelSpec,
+	X: np.ndarray,
+	y: np.ndarray,
+	n_single: int = 500,
+	batch_sizes: List[int] = (1, 32, 256, 2048),
+	min_seconds: float = 0.5,
+) -> Dict[str, Any]:
+	res: Dict[str, Any] = {}
+	if spec.labels is not None:
+		res["quality"] = _f1_report(y, spec.labels(X))
+
+	# Latencia de una muestra
+	idx = np.random.default_rng(0).integers(0, X.shape[0], size=n_single)
+	spec.single(np.asarray(X[idx[0]]))  # warm-up
+	lat = np.empty(n_single)
+	for i, j in enumerate(idx):
+		x = np.asarray(X[j])
+		t0 = time.perf_counter()
+		spec.single(x)
+		lat[i] = time.perf_counter() - t0
+	res["latency_ms"] = {
+		"p50": float(np.percentile(lat, 50) * 1e3),
+		"p99": float(np.percentile(lat, 99) * 1e3),
+		"mean": float(lat.mean() * 1e3),
+	}
+
+	# Throughput en lote
+	thr = {}
+	for bs in batch_sizes:
+		bs = min(bs, X.shape[0])
+		Xb = np.ascontiguousarray(X[:bs])
+		spec.batch(Xb)
+		n = 0
+		t0 = time.perf_counter()
+		while True:
+			spec.batch(Xb)
+			n += bs
+			el = time.perf_counter() - t0
+			if el >= min_seconds:
+				break
+		thr[str(bs)] = round(n / el, 1)
+	res["throughput_samples_per_s"] = thr
+	res["peak_rss_mb"] = _peak_rss_mb()
+	return res
+
+
+def run(models: List[str], data_path: str = ECG5000_PATH, fs: float = ECG5000_FS, **kw) -> Dict[str, Any]:
+	t0 = time.perf_counter()
+	X, y = load_ecg5000(data_path)
+	load_s = time.perf_counter() - t0
+	report: Dict[str, Any] = {
+		"timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"dataset": {
+			"path": data_path, "n": int(X.shape[0]), "length": int(X.shape[1]), "load_s": round(load_s, 4),
+			"fs": fs, "fs_nominal": True,
+			"fs_note": "ECG5000 has no real sample rate (beats interpolated to 140 points); fs is an assumption",
+		},
+		"throughput_unit": "beats per CPU second (not seconds of signal)",
+		"models": {},
+	}
+	for name in models:
+		factory = MODELS.get(name)
+		if factory is None:
+			report["models"][name] = {"error": "modelo no registrado"}
+			continue
+		try:
+			spec = factory(fs)
+		except Exception as e:
+			spec = None
+			report["models"][name] = {"error": str(e)}
+			continue
+		if spec is None:
+			report["models"][name] = {"error": "modelo no disponible"}
+			continue
+		report["models"][name] = bench_model(spec, X, y, **kw)
+	return report
+
+
+def main() -> None:
+	ap = argparse.ArgumentParser(description="ECG model benchmark on ECG5000")
+	ap.add_argument("--data", default=ECG5000_PATH)
+	ap.add_argument("--models", default=",".join(MODELS))
+	ap.add_argument("--out", default="bench_results.json")
+	ap.add_argument("--n-single", type=int, default=500)
+	ap.add_argument("--batch-sizes", default="1,32,256,2048")
+	ap.add_argument("--fs", type=float, default=ECG5000_FS, help="fs nominal supuesta para ECG5000 (Hz)")
+	args = ap.parse_args()
+	report = run(
+		[m.strip() for m in args.models.split(",") if m.strip()],
+		data_path=args.data,
+		fs=args.fs,
+		n_single=args.n_single,
+		batch_sizes=[int(b) for b in args.batch_sizes.split(",")],
+	)
+	with open(args.out, "w", encoding="utf-8") as f:
+		json.dump(report, f, indent=2)
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -1,31 +1,136 @@
 from __future__ import annotations
 
-from typing import Dict, Any
+from typing import Dict, Any, Sequence
+import os
 import numpy as np
 
+from ecg_ml.features import FEATURE_DIM, FEATURE_VERSION
+
+
+MODEL_PATH = os.getenv("ECG_CLASSIFIER_PATH", "ecg_classifier.npz")
+
 
 class ECGClassifier:
 	"""
 	Simple placeholder classifier. In a real setup, load a trained model
 	(e.g., sklearn/onnx/torch) in __init__ and run inference in predict.
+
+	When feature vectors (see ecg_ml.features) are available and the model has
+	been trained with doctor feedback (partial_fit), predictions come from an
+	incremental softmax-regression model instead of the heuristic.
 	"""
 
-	def __init__(self):
+	def __init__(self, n_features: int = FEATURE_DIM):
 		self.labels = [
 			"normal",
 			"afib",
 			"av_block",
 			"pvcs",
 		]
+		self.n_features = n_features
+		self.reset()
+
+	def reset(self) -> None:
+		"""Discard the learned weights (heuristic mode until the next partial_fit)."""
+		k = len(self.labels)
+		self.W = np.zeros((self.n_features, k), dtype=np.float64)
+		self.b = np.zeros(k, dtype=np.float64)
+		# Running standardization stats (Chan's parallel update per batch)
+		self.n_seen = 0
+		self.mean_ = np.zeros(self.n_features, dtype=np.float64)
+		self.m2_ = np.zeros(self.n_features, dtype=np.float64)
+		self.trained_until: str | None = None  # ISO timestamp of last labelled row consumed
+
+	@property
+	def is_trained(self) -> bool:
+		return self.n_seen > 0
+
+	def _standardize(self, X: np.ndarray) -> np.ndarray:
+		if self.n_seen < 2:
+			return X - self.mean_
+		std = np.sqrt(self.m2_ / (self.n_seen - 1))
+		std[std == 0] = 1.0
+		return (X - self.mean_) / std
+
+	def _update_stats(self, X: np.ndarray) -> None:
+		n_b = X.shape[0]
+		mean_b = X.mean(axis=0)
+		m2_b = ((X - mean_b) ** 2).sum(axis=0)
+		n = self.n_seen + n_b
+		delta = mean_b - self.mean_
+		self.mean_ = self.mean_ + delta * (n_b / n)
+		self.m2_ = self.m2_ + m2_b + delta ** 2 * (self.n_seen * n_b / n)
+		self.n_seen = n
 
-	def predict(self, signal: np.ndarray, fs: float) -> Dict[str, Any]:
+	def _softmax(self, Z: np.ndarray) -> np.ndarray:
+		Z = Z - Z.max(axis=1, keepdims=True)
+		np.exp(Z, out=Z)
+		Z /= Z.sum(axis=1, keepdims=True)
+		return Z
+
+	def partial_fit(
+		self,
+		X: np.ndarray,
+		y: Sequence[str],
+		lr: float = 0.1,
+		l2: float = 1e-4,
+		epochs: int = 1,
+		batch_size: int = 256,
+	) -> Dict[str, int]:
+		"""
+		Incremental update (sklearn partial_fit style) with mini-batch SGD.
+
+		Parameters:
+		  - X: (n, n_features) feature matrix
+		  - y: n labels; rows whose label is not in self.labels are skipped
+		Returns:
+		  - dict with number of rows used and skipped
+		"""
+		X = np.asarray(X, dtype=np.float64)
+		if X.ndim != 2 or X.shape[1] != self.n_features:
+			raise ValueError(f"Expected (n, {self.n_features}) features, got {X.shape}")
+		index = {lab: i for i, lab in enumerate(self.labels)}
+		y_idx = np.fromiter((index.get(str(lab).strip().lower(), -1) for lab in y), dtype=np.int64, count=len(y))
+		keep = y_idx >= 0
+		X, y_idx = X[keep], y_idx[keep]
+		if X.shape[0] == 0:
+			return {"used": 0, "skipped": int((~keep).sum())}
+
+		self._update_stats(X)
+		Xs = self._standardize(X)
+		Y = np.zeros((Xs.shape[0], len(self.labels)))
+		Y[np.arange(Xs.shape[0]), y_idx] = 1.0
+		rng = np.random.default_rng(self.n_seen)
+		for _ in range(max(1, epochs)):
+			order = rng.permutation(Xs.shape[0])
+			for start in range(0, order.size, batch_size):
+				sl = order[start:start + batch_size]
+				xb, yb = Xs[sl], Y[sl]
+				P = self._softmax(xb @ self.W + self.b)
+				G = (P - yb) / sl.size
+				self.W -= lr * (xb.T @ G + l2 * self.W)
+				self.b -= lr * G.sum(axis=0)
+		return {"used": int(X.shape[0]), "skipped": int((~keep).sum())}
+
+	def predict_proba_features(self, X: np.ndarray) -> np.ndarray:
+		"""Class probabilities for a (n, n_features) matrix in one vectorized call."""
+		X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+		return self._softmax(self._standardize(X) @ self.W + self.b)
+
+	def predict(self, signal: np.ndarray, fs: float, features: np.ndarray | None = None) -> Dict[str, Any]:
 		"""
 		Parameters:
 		  - signal: ECG signal in mV (1D numpy array)
 		  - fs: sampling rate in Hz
+		  - features: optional feature vector (ecg_ml.features.extract_features)
 		Returns:
 		  - dict with per-class scores and top_label
 		"""
+		if features is not None and self.is_trained:
+			p = self.predict_proba_features(features)[0]
+			scores = {lab: float(p[i]) for i, lab in enumerate(self.labels)}
+			top_label = max(scores, key=scores.get)
+			return {"scores": scores, "top_label": top_label, "model": "softmax"}
 		if signal.size == 0 or fs <= 0:
 			return {"scores": {}, "top_label": None}
 		# Dummy heuristic features
@@ -41,12 +146,92 @@ class ECGClassifier:
 		top_label = max(scores, key=scores.get)
 		return {"scores": scores, "top_label": top_label}
 
+	def predict_batch(self, signals: np.ndarray, fs: float, features: np.ndarray | None = None) -> Dict[str, Any]:
+		"""
+		Vectorized predict over a (n, n_samples) matrix of equal-length windows/beats.
+		Returns:
+		  - dict with 'labels' (list of class names), 'scores' (n, n_classes) array
+		    and 'top' (n,) array of indices into labels
+		"""
+		X = np.atleast_2d(np.asarray(signals, dtype=np.float64))
+		if features is not None and self.is_trained:
+			P = self.predict_proba_features(features)
+		else:
+			var = X.var(axis=1)
+			mean_abs = np.abs(X).mean(axis=1)
+			P = np.column_stack([
+				np.maximum(0.0, 1.0 - var),
+				np.minimum(1.0, var * 0.5),
+				np.minimum(1.0, mean_abs * 0.3),
+				np.minimum(1.0, var * 0.2 + mean_abs * 0.1),
+			])
+		return {"labels": list(self.labels), "scores": P, "top": P.argmax(axis=1)}
+
+	# --- Persistence ---
+	def save(self, path: str = MODEL_PATH) -> None:
+		tmp = f"{path}.tmp.npz"
+		np.savez(
+			tmp,
+			W=self.W, b=self.b, mean=self.mean_, m2=self.m2_,
+			n_seen=np.int64(self.n_seen),
+			labels=np.array(self.labels),
+			feature_version=np.int64(FEATURE_VERSION),
+			trained_until=np.array(self.trained_until or ""),
+		)
+		os.replace(tmp, path)
+
+	def load(self, path: str = MODEL_PATH) -> bool:
+		"""Load weights if present and compatible; returns True on success."""
+		if not os.path.exists(path):
+			return False
+		with np.load(path, allow_pickle=False) as z:
+			if int(z["feature_version"]) != FEATURE_VERSION or list(z["labels"]) != self.labels:
+				return False
+			self.W, self.b = z["W"], z["b"]
+			self.mean_, self.m2_ = z["mean"], z["m2"]
+			self.n_seen = int(z["n_seen"])
+			self.trained_until = str(z["trained_until"]) or None
+		return True
+
 
 _singleton: ECGClassifier | None = None
+_loaded_mtime: float | None = None
+
+
+def model_mtime() -> float | None:
+	try:
+		return os.stat(MODEL_PATH).st_mtime
+	except OSError:
+		return None
+
+
+def model_cache_state() -> Dict[str, Any]:
+	"""Estado de los modelos cargados en este proceso (los workers del pool tienen el suyo)."""
+	import sys
+	mtime = model_mtime()
+	hf = sys.modules.get("ecg_ml.hf_loader")
+	return {
+		"file_mtime_seconds": mtime or 0.0,
+		"classifier_loaded": _singleton is not None,
+		"classifier_trained": _singleton is not None and _singleton.is_trained,
+		"classifier_stale": _singleton is not None and mtime != _loaded_mtime,
+		"hf_model_loaded": bool(hf is not None and hf._MODEL_SINGLETON is not None),
+	}
 
 
 def get_classifier() -> ECGClassifier:
-	global _singleton
-	if _singleton is None:
-		_singleton = ECGClassifier()
+	"""
+	Singleton por proceso. Recarga los pesos si MODEL_PATH cambió en disco, para
+	que los workers del pool de análisis vean el resultado de /admin/retrain.
+	"""
+	global _singleton, _loaded_mtime
+	mtime = model_mtime()
+	if _singleton is None or mtime != _loaded_mtime:
+		clf = ECGClassifier()
+		try:
+			clf.load()
+		except Exception:
+			# Modelo corrupto o incompatible: seguir con la heurística
+			clf.reset()
+		_singleton, _loaded_mtime = clf, mtime
 	return _singleton
@@ -0,0 +1,216 @@
+"""
+Caché de datasets en disco servida por memory-map.
+
+Cada fuente (ecg.csv.zip, CSVs de registros, etc.) se convierte una sola vez a
+.npy junto al archivo original (float32 para señales, float64 para tiempos y
+epochs), nombrados por el hash de contenido de la fuente. Las cargas posteriores usan np.load(mmap_mode='r'): son casi
+instantáneas y varios procesos comparten la misma copia en el page cache.
+
+Si el directorio de la fuente no es escribible se usa ECG_DATASET_CACHE
+(por defecto ~/.cache/ecg_datasets).
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import io
+import json
+import os
+import zipfile
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+ECG5000_PATH = os.getenv("ECG5000_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ecg.csv.zip"))
+CACHE_DIR = os.getenv("ECG_DATASET_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ecg_datasets"))
+
+Parser = Callable[[str], Tuple[np.ndarray, Dict[str, Any]]]
+
+
+def source_digest(path: str) -> str:
+	"""
+	sha256 del contenido de la fuente. Se memoiza por (tamaño, mtime) en un
+	índice junto al caché para no releer el archivo en cada carga.
+	"""
+	st = os.stat(path)
+	index_path = _cache_base(path) + ".index.json"
+	try:
+		with open(index_path, "r", encoding="utf-8") as f:
+			idx = json.load(f)
+		if idx.get("size") == st.st_size and idx.get("mtime_ns") == st.st_mtime_ns:
+			return idx["sha256"]
+	except (OSError, ValueError, KeyError):
+		pass
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	digest = h.hexdigest()
+	_atomic_write(index_path, json.dumps({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}).encode())
+	return digest
+
+
+def _cache_base(path: str) -> str:
+	src_dir = os.path.dirname(os.path.abspath(path))
+	name = "." + os.path.basename(path)
+	if os.access(src_dir, os.W_OK):
+		return os.path.join(src_dir, name)
+	os.makedirs(CACHE_DIR, exist_ok=True)
+	# Prefijo por directorio para no mezclar fuentes homónimas
+	tag = hashlib.sha1(src_dir.encode()).hexdigest()[:8]
+	return os.path.join(CACHE_DIR, f"{tag}{name}")
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+	tmp = f"{path}.{os.getpid()}.tmp"
+	with open(tmp, "wb") as f:
+		f.write(data)
+	os.replace(tmp, path)
+
+
+def cached_arrays(path: str, parse: Callable[[str], Tuple[Dict[str, np.ndarray], Dict[str, Any]]],
+                  kind: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+	"""
+	Como cached_array pero con varios arrays por fuente (un .npy memory-mapped por
+	nombre, cada uno con su dtype): `parse` devuelve ({nombre: array}, metadatos).
+	"""
+	digest = source_digest(path)
+	base = _cache_base(path)
+	stem = f"{base}.{kind}.{digest[:16]}"
+	meta_path = stem + ".json"
+	meta = None
+	if os.path.exists(meta_path):
+		with open(meta_path, "r", encoding="utf-8") as f:
+			meta = json.load(f)
+		if "arrays" not in meta or not all(os.path.exists(f"{stem}.{n}.npy") for n in meta["arrays"]):
+			meta = None  # caché de un formato anterior o incompleto
+	if meta is None:
+		arrays, meta = parse(path)
+		shapes = {}
+		for name, arr in arrays.items():
+			arr = np.ascontiguousarray(arr)
+			buf = io.BytesIO()
+			np.save(buf, arr)
+			_atomic_write(f"{stem}.{name}.npy", buf.getvalue())
+			shapes[name] = {"shape": list(arr.shape), "dtype": arr.dtype.str}
+		meta = dict(meta, sha256=digest, arrays=shapes)
+		_atomic_write(meta_path, json.dumps(meta).encode())
+		# Limpiar cachés de versiones (o formatos) anteriores de la misma fuente
+		keep = {meta_path, *(f"{stem}.{n}.npy" for n in shapes)}
+		for old in glob.glob(f"{glob.escape(base)}.{kind}.*"):
+			if old not in keep:
+				try:
+					os.remove(old)
+				except OSError:
+					pass
+	return {n: np.load(f"{stem}.{n}.npy", mmap_mode="r") for n in meta["arrays"]}, meta
+
+
+def cached_array(path: str, parse: Parser, kind: str = "f32") -> Tuple[np.ndarray, Dict[str, Any]]:
+	"""
+	Devuelve (array float32 read-only memory-mapped, metadatos) de `path`,
+	convirtiéndolo con `parse` sólo si no existe un caché para el hash actual de la fuente.
+	"""
+	def _parse(p: str):
+		arr, meta = parse(p)
+		return {"data": np.asarray(arr, dtype=np.float32)}, meta
+
+	arrays, meta = cached_arrays(path, _parse, kind)
+	return arrays["data"], meta
+
+
+# --- ECG5000 ---
+def _parse_ecg_csv_zip(path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+	with zipfile.ZipFile(path) as zf:
+		name = next(n for n in zf.namelist() if n.endswith(".csv"))
+		with zf.open(name) as fh:
+			return np.loadtxt(io.TextIOWrapper(fh), delimiter=",", dtype=np.float32), {"source": name}
+
+
+# ECG5000 trae cada latido interpolado a 140 puntos y no conserva la frecuencia de
+# muestreo original: no hay una fs real. Los modelos que la piden reciben este valor
+# NOMINAL (1 latido = 1 s a ~60 lpm); latencias y filtros no son cifras de tiempo real.
+ECG5000_NOMINAL_FS = 140.0
+
+
+def load_ecg5000(path: str = ECG5000_PATH) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	Carga ECG5000 (4998 latidos x 140 muestras + etiqueta; 1 = normal, 0 = anormal).
+	Retorna (X [n, 140] float32 memory-mapped, y [n] int8).
+	"""
+	data, _ = cached_array(path, _parse_ecg_csv_zip)
+	return data[:, :-1], data[:, -1].astype(np.int8)
+
+
+# --- CSV genérico (registros tipo timestamp_utc,raw,voltage_mV,...) ---
+# float32 representa exactos los enteros sólo hasta 2**24: epochs, contadores de
+# muestras o segundos desde t0 de registros largos pierden resolución (a 500 Hz
+# durante 3 h la separación de 2 ms se redondea y la fs estimada sale 512)
+F32_EXACT_MAX = float(2 ** 24)
+
+
+def _csv_parser(usecols: Optional[Sequence[str]] = None, nrows: Optional[int] = None):
+	def parse(path: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+		import pandas as pd
+		df = pd.read_csv(path, usecols=usecols, nrows=nrows)
+		f32, f64 = ([], []), ([], [])
+		time_cols = {}
+		for c in df.columns:
+			s = df[c]
+			if pd.api.types.is_numeric_dtype(s):
+				v = s.to_numpy(dtype=np.float64, na_value=np.nan)
+				finite = v[np.isfinite(v)]
+				wide = finite.size and float(np.abs(finite).max()) >= F32_EXACT_MAX
+				dst = f64 if wide else f32
+				dst[0].append(str(c))
+				dst[1].append(v)
+				continue
+			# Columnas de tiempo: segundos float64 relativos a t0 (precisión de µs en años de registro)
+			if str(c).lower().startswith("time") or "date" in str(c).lower():
+				t = pd.to_datetime(s, errors="coerce", utc=True)
+				if t.notna().any():
+					t0 = t.dropna().iloc[0]
+					f64[0].append(str(c))
+					f64[1].append((t - t0).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan))
+					time_cols[str(c)] = t0.isoformat()
+		n = len(df)
+		arrays = {
+			"f32": np.column_stack(f32[1]).astype(np.float32) if f32[1] else np.empty((n, 0), dtype=np.float32),
+			"f64": np.column_stack(f64[1]) if f64[1] else np.empty((n, 0), dtype=np.float64),
+		}
+		return arrays, {"columns": f32[0], "f64_columns": f64[0], "time_columns": time_cols}
+	return parse
+
+
+def load_csv(path: str, usecols: Optional[Sequence[str]] = None, nrows: Optional[int] = None) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+	"""
+	Columnas de un CSV como matrices memory-mapped: {"f32": [n, k] señales,
+	"f64": [n, m] tiempos (segundos desde t0) y numéricas fuera del rango exacto de float32}.
+	meta trae 'columns' (de f32), 'f64_columns' y 'time_columns' {col: t0 ISO}.
+	"""
+	kind = "csv"
+	if usecols or nrows:
+		sel = json.dumps([list(usecols or []), nrows])
+		kind = "csv-" + hashlib.sha1(sel.encode()).hexdigest()[:8]
+	return cached_arrays(path, _csv_parser(usecols, nrows), kind=kind)
+
+
+def load_csv_frame(path: str, usecols: Optional[Sequence[str]] = None, nrows: Optional[int] = None):
+	"""Como load_csv pero devuelve un DataFrame (las columnas de tiempo se reconstruyen)."""
+	import pandas as pd
+	arrays, meta = load_csv(path, usecols=usecols, nrows=nrows)
+	data = {}
+	for i, c in enumerate(meta["f64_columns"]):
+		col = arrays["f64"][:, i]
+		if c in meta["time_columns"]:
+			t0 = pd.Timestamp(meta["time_columns"][c])
+			data[c] = t0 + pd.to_timedelta(np.asarray(col), unit="s")
+		else:
+			data[c] = col
+	for i, c in enumerate(meta["columns"]):
+		data[c] = arrays["f32"][:, i]
+	# Orden original de las columnas del CSV
+	order = [c for c in pd.read_csv(path, nrows=0, usecols=usecols).columns if c in data]
+	return pd.DataFrame({c: data[c] for c in order}, copy=False)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+
+
+# Orden fijo del vector de características. Si se agrega/quita una columna hay
+# que incrementar FEATURE_VERSION para no mezclar vectores incompatibles.
+FEATURE_NAMES = [
+	"hr_mean_bpm",
+	"hr_std_bpm",
+	"rr_mean_ms",
+	"sdnn_ms",
+	"rmssd_ms",
+	"pnn50",
+	"lf",
+	"hf",
+	"lf_hf",
+	"sd1_ms",
+	"sd2_ms",
+	"snr_db",
+	"artifact_ratio",
+	"sig_var",
+	"sig_mean_abs",
+	"sig_skew",
+	"sig_kurtosis",
+	"r_per_min",
+	"p_per_r",
+	"t_per_r",
+	"pr_mean_ms",
+	"pr_std_ms",
+	"pr_long_ratio",
+]
+FEATURE_VERSION = 1
+FEATURE_DIM = len(FEATURE_NAMES)
+
+
+def _get(d: Optional[dict], *keys: str) -> float:
+	cur: Any = d or {}
+	for k in keys:
+		if not isinstance(cur, dict):
+			return float("nan")
+		cur = cur.get(k)
+	try:
+		return float(cur)
+	except (TypeError, ValueError):
+		return float("nan")
+
+
+def extract_features(
+	signal: np.ndarray,
+	fs: float,
+	rr_ms: np.ndarray,
+	hrv: Dict[str, Any],
+	quality: Dict[str, Any],
+	n_p_peaks: int = 0,
+	n_t_peaks: int = 0,
+	pr_intervals_ms: Sequence[float] | None = None,
+) -> np.ndarray:
+	"""
+	Construye el vector de características de longitud fija (float32) de un análisis.
+
+	Reutiliza lo que el pipeline ya calculó (HRV, calidad, conteos de ondas) para
+	no re-derivar nada; los valores no disponibles (NaN/inf) se guardan como 0.
+	"""
+	x = np.asarray(signal, dtype=float)
+	rr = np.asarray(rr_ms, dtype=float)
+	n_r = int(rr.size + 1) if rr.size else 0
+	duration_min = (x.size / fs / 60.0) if fs > 0 and x.size else float("nan")
+
+	if rr.size:
+		hr = 60000.0 / rr
+		hr_mean, hr_std, rr_mean = float(np.mean(hr)), float(np.std(hr)), float(np.mean(rr))
+	else:
+		hr_mean = hr_std = rr_mean = float("nan")
+
+	if x.size > 1:
+		mu = float(np.mean(x))
+		sd = float(np.std(x))
+		z = (x - mu) / sd if sd > 0 else np.zeros_like(x)
+		skew = float(np.mean(z ** 3))
+		kurt = float(np.mean(z ** 4) - 3.0)
+		var, mean_abs = sd * sd, float(np.mean(np.abs(x)))
+	else:
+		var = mean_abs = skew = kurt = float("nan")
+
+	pr = np.asarray(pr_intervals_ms or [], dtype=float)
+	pr_mean = float(np.mean(pr)) if pr.size else float("nan")
+	pr_std = float(np.std(pr)) if pr.size else float("nan")
+	pr_long = float(np.mean(pr > 200)) if pr.size else float("nan")
+
+	vec = np.array([
+		hr_mean,
+		hr_std,
+		rr_mean,
+		_get(hrv, "time", "SDNN"),
+		_get(hrv, "time", "RMSSD"),
+		_get(hrv, "time", "pNN50"),
+		_get(hrv, "freq", "LF"),
+		_get(hrv, "freq", "HF"),
+		_get(hrv, "freq", "LF_HF"),
+		_get(hrv, "poincare", "SD1"),
+		_get(hrv, "poincare", "SD2"),
+		_get(quality, "snr_db"),
+		_get(quality, "artifact_ratio"),
+		var,
+		mean_abs,
+		skew,
+		kurt,
+		(n_r / duration_min) if duration_min and duration_min > 0 else float("nan"),
+		(n_p_peaks / n_r) if n_r else float("nan"),
+		(n_t_peaks / n_r) if n_r else float("nan"),
+		pr_mean,
+		pr_std,
+		pr_long,
+	], dtype=np.float64)
+	return np.nan_to_num(vec, nan=0.0, posinf=0.0, neginf=0.0).astype(np.float32)
+
+
+def to_blob(vec: np.ndarray) -> bytes:
+	"""Serializa un vector como float32 little-endian contiguo."""
+	return np.ascontiguousarray(vec, dtype="<f4").tobytes()
+
+
+def from_blobs(blobs: Sequence[bytes], dim: int = FEATURE_DIM) -> np.ndarray:
+	"""Decodifica muchos blobs de una vez: un solo join + frombuffer, sin bucles por elemento."""
+	if not blobs:
+		return np.empty((0, dim), dtype=np.float32)
+	return np.frombuffer(b"".join(blobs), dtype="<f4").reshape(-1, dim)
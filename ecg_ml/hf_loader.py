@@ -2,8 +2,6 @@ from __future__ import annotations
 
 from typing import Any, Optional
 import os
-from huggingface_hub import hf_hub_download
-import joblib
 
 
 def load_ecg2hrv(repo_id: str = "hubii-world/ECG2HRV", filename: str = "ECG2HRV.joblib", token: str | None = None) -> Any:
@@ -16,6 +14,10 @@ def load_ecg2hrv(repo_id: str = "hubii-world/ECG2HRV", filename: str = "ECG2HRV.
 
     Retorna el objeto cargado por joblib.load.
     """
+    # Importes diferidos: joblib/huggingface_hub sólo hacen falta al cargar el modelo
+    from huggingface_hub import hf_hub_download
+    import joblib
+
     if token is None:
         token = os.getenv("HUGGINGFACE_HUB_TOKEN")
     path = hf_hub_download(repo_id=repo_id, filename=filename, token=token)
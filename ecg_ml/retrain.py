@@ -0,0 +1,90 @@
+"""
+Re-entrenamiento incremental del clasificador a partir del feedback médico.
+
+Lee en bloque los vectores etiquetados de `analysis_features` (blobs float32) y
+aplica `partial_fit`; sólo consume filas etiquetadas después del último
+entrenamiento salvo que se pida `full=True`. Se entrena una copia leída del
+disco, nunca el singleton de get_classifier() que /analysis usa para predecir;
+al guardarla, get_classifier() la recarga por mtime.
+
+Uso:
+	python -m ecg_ml.retrain [--full] [--epochs 3] [--batch-size 8192]
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import threading
+import time
+from typing import Any, Dict
+
+from ecg_ml.classifier import ECGClassifier, MODEL_PATH
+
+
+# Dos re-entrenamientos simultáneos partirían del mismo trained_until y consumirían dos veces el feedback
+_retrain_lock = threading.Lock()
+
+
+def retrain(
+	clf: ECGClassifier | None = None,
+	full: bool = False,
+	epochs: int = 1,
+	batch_size: int = 8192,
+	path: str = MODEL_PATH,
+) -> Dict[str, Any]:
+	with _retrain_lock:
+		if clf is None:
+			clf = ECGClassifier()
+			if not full:
+				try:
+					clf.load(path)
+				except Exception:
+					# Igual que get_classifier(): un archivo corrupto se descarta
+					clf.reset()
+		return _retrain(clf, full, epochs, batch_size, path)
+
+
+def _retrain(clf: ECGClassifier, full: bool, epochs: int, batch_size: int, path: str) -> Dict[str, Any]:
+	from ecg_storage.feature_store import iter_labelled
+
+	if full:
+		clf.reset()
+	since = datetime.datetime.fromisoformat(clf.trained_until) if clf.trained_until else None
+
+	t0 = time.perf_counter()
+	used = skipped = 0
+	last_ts = since
+	for X, labels, ts in iter_labelled(batch_size=batch_size, since=since):
+		stats = clf.partial_fit(X, labels, epochs=epochs)
+		used += stats["used"]
+		skipped += stats["skipped"]
+		last_ts = ts if last_ts is None else max(last_ts, ts)
+	elapsed = time.perf_counter() - t0
+
+	if used or full:
+		clf.trained_until = last_ts.isoformat() if last_ts else None
+		clf.save(path)
+	return {
+		"used": used,
+		"skipped": skipped,
+		"seconds": round(elapsed, 4),
+		"rows_per_s": round(used / elapsed, 1) if elapsed > 0 else None,
+		"trained_until": clf.trained_until,
+		"n_seen": clf.n_seen,
+	}
+
+
+def main() -> None:
+	ap = argparse.ArgumentParser(description="Incremental retraining from doctor feedback")
+	ap.add_argument("--full", action="store_true", help="Descartar pesos y re-entrenar con todo")
+	ap.add_argument("--epochs", type=int, default=1)
+	ap.add_argument("--batch-size", type=int, default=8192)
+	ap.add_argument("--model", default=MODEL_PATH)
+	args = ap.parse_args()
+	print(json.dumps(retrain(full=args.full, epochs=args.epochs, batch_size=args.batch_size, path=args.model), indent=2))
+
+
+if __name__ == "__main__":
+	main()
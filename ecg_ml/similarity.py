@@ -0,0 +1,407 @@
+"""
+Índice de similitud morfológica de latidos (k vecinos más cercanos).
+
+Cada latido se remuestrea a 140 muestras (formato ECG5000), se z-normaliza y se
+comprime con PCA. Los embeddings viven en una matriz float32 contigua que se
+siembra con ecg.csv.zip y crece con cada análisis persistido. Al cargarlo se
+indexa el latido mediano guardado (extras.median_beat) de los análisis que
+faltan: los previos al índice o los perdidos entre el último guardado y un corte.
+De esos sólo existe el mediano (la señal no se guarda): se marcan con beat = -1 y
+no admiten búsqueda por latido individual.
+
+Backends:
+  - "brute": distancias L2 con un único producto matriz-vector (BLAS)
+  - "ivf": particiona con k-means y sólo revisa las `nprobe` celdas más cercanas;
+            cada celda mantiene su lista de filas y las altas se agregan al final
+
+Configuración por entorno:
+  ECG_SIMILARITY_DIR      directorio de persistencia (default: similarity_index)
+  ECG_SIMILARITY_BACKEND  brute | ivf (default: brute)
+  ECG_SIMILARITY_SAVE_EVERY / ECG_SIMILARITY_SAVE_S
+                          filas nuevas o segundos con cambios antes de escribir a disco
+                          (en un hilo aparte, sobre una instantánea: las búsquedas no esperan)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+log = logging.getLogger("ecg_ml.similarity")
+
+BEAT_LEN = 140
+N_COMPONENTS = int(os.getenv("ECG_SIMILARITY_COMPONENTS", "16"))
+INDEX_DIR = os.getenv("ECG_SIMILARITY_DIR", "similarity_index")
+BACKEND = os.getenv("ECG_SIMILARITY_BACKEND", "brute")
+SAVE_EVERY = int(os.getenv("ECG_SIMILARITY_SAVE_EVERY", "500"))
+SAVE_INTERVAL_S = float(os.getenv("ECG_SIMILARITY_SAVE_S", "60"))
+
+BACKENDS = ("brute", "ivf")
+
+# Valores de `source` en el índice
+SRC_REFERENCE = 0
+SRC_ANALYSIS = 1
+# `beat` de un análisis del que sólo se indexó el latido mediano (backfill)
+BEAT_MEDIAN = -1
+
+
+def resample_beats(beats: np.ndarray, length: int = BEAT_LEN) -> np.ndarray:
+	"""Interpolación lineal de todas las filas a `length` muestras (vectorizado)."""
+	B = np.atleast_2d(np.asarray(beats, dtype=np.float32))
+	L = B.shape[1]
+	if L == length:
+		return B
+	pos = np.linspace(0.0, L - 1, length)
+	i0 = np.minimum(pos.astype(np.int64), L - 2)
+	w = (pos - i0).astype(np.float32)
+	return B[:, i0] * (1.0 - w) + B[:, i0 + 1] * w
+
+
+def znorm(B: np.ndarray) -> np.ndarray:
+	mu = B.mean(axis=1, keepdims=True)
+	sd = B.std(axis=1, keepdims=True)
+	sd[sd == 0] = 1.0
+	return (B - mu) / sd
+
+
+class BeatIndex:
+	def __init__(self, n_components: int = N_COMPONENTS):
+		self.k = n_components
+		self.pca_mean = np.zeros(BEAT_LEN, dtype=np.float32)
+		self.pca_components = np.zeros((n_components, BEAT_LEN), dtype=np.float32)
+		self._emb = np.empty((0, n_components), dtype=np.float32)
+		self._sq = np.empty(0, dtype=np.float32)
+		self._ref = np.empty(0, dtype=np.int64)     # analysis_id o fila del dataset de referencia
+		self._beat = np.empty(0, dtype=np.int32)    # índice del latido dentro del análisis
+		self._src = np.empty(0, dtype=np.int8)      # SRC_REFERENCE / SRC_ANALYSIS
+		self._label = np.empty(0, dtype=np.int8)    # etiqueta de referencia (-1 si no aplica)
+		self.n = 0
+		self._spans: Dict[int, tuple[int, int]] = {}  # analysis_id -> (inicio, fin) en la matriz
+		# IVF
+		self.centroids: Optional[np.ndarray] = None
+		self._assign = np.empty(0, dtype=np.int32)
+		self._ivf_ids: List[np.ndarray] = []  # filas de cada celda (con capacidad extra)
+		self._ivf_len = np.empty(0, dtype=np.int64)
+		self._dirty_since_save = 0
+		self._saved_at = time.monotonic()
+		self._lock = threading.RLock()
+		self._save_lock = threading.Lock()
+		self._saver: Optional[threading.Thread] = None
+
+	# --- PCA ---
+	def fit_pca(self, beats: np.ndarray) -> None:
+		Z = znorm(resample_beats(beats)).astype(np.float64)
+		self.pca_mean = Z.mean(axis=0).astype(np.float32)
+		_, _, vt = np.linalg.svd(Z - self.pca_mean, full_matrices=False)
+		self.pca_components = np.ascontiguousarray(vt[: self.k], dtype=np.float32)
+
+	def embed(self, beats: np.ndarray) -> np.ndarray:
+		Z = znorm(resample_beats(beats))
+		return np.ascontiguousarray((Z - self.pca_mean) @ self.pca_components.T, dtype=np.float32)
+
+	# --- Almacenamiento contiguo con crecimiento amortizado ---
+	def _reserve(self, extra: int) -> None:
+		need = self.n + extra
+		cap = self._emb.shape[0]
+		if need <= cap:
+			return
+		new_cap = max(need, cap * 2, 1024)
+		def grow(a: np.ndarray) -> np.ndarray:
+			out = np.empty((new_cap,) + a.shape[1:], dtype=a.dtype)
+			out[: self.n] = a[: self.n]
+			return out
+		self._emb, self._sq = grow(self._emb), grow(self._sq)
+		self._ref, self._beat = grow(self._ref), grow(self._beat)
+		self._src, self._label = grow(self._src), grow(self._label)
+		self._assign = grow(self._assign)
+
+	def add_embeddings(self, emb: np.ndarray, ref: np.ndarray, beat: np.ndarray, src: int, label: Optional[np.ndarray] = None) -> None:
+		m = emb.shape[0]
+		if m == 0:
+			return
+		with self._lock:
+			self._reserve(m)
+			s, e = self.n, self.n + m
+			self._emb[s:e] = emb
+			self._sq[s:e] = np.einsum("ij,ij->i", emb, emb)
+			self._ref[s:e] = ref
+			self._beat[s:e] = beat
+			self._src[s:e] = src
+			self._label[s:e] = -1 if label is None else label
+			if self.centroids is not None:
+				self._assign[s:e] = self._nearest_centroid(emb)
+				self._ivf_append(self._assign[s:e], s)
+			self.n = e
+			self._dirty_since_save += m
+
+	def add_analysis(self, analysis_id: int, beats: np.ndarray, median_only: bool = False) -> int:
+		"""
+		Agrega los latidos segmentados de un análisis; retorna cuántos se indexaron.
+		median_only: `beats` es sólo el latido mediano (no hay latidos individuales).
+		"""
+		if beats.shape[0] == 0:
+			return 0
+		emb = self.embed(beats)
+		beat = np.full(emb.shape[0], BEAT_MEDIAN) if median_only else np.arange(emb.shape[0])
+		with self._lock:
+			start = self.n
+			self.add_embeddings(emb, np.full(emb.shape[0], analysis_id), beat, SRC_ANALYSIS)
+			self._spans[int(analysis_id)] = (start, self.n)
+		return emb.shape[0]
+
+	def has_beats(self, analysis_id: int) -> Optional[bool]:
+		"""True si el análisis tiene latidos individuales, False si sólo el mediano, None si no está."""
+		with self._lock:
+			span = self._spans.get(int(analysis_id))
+			if span is None:
+				return None
+			return bool(self._beat[span[0]] != BEAT_MEDIAN)
+
+	@property
+	def embeddings(self) -> np.ndarray:
+		return self._emb[: self.n]
+
+	# --- IVF ---
+	def _nearest_centroid(self, X: np.ndarray, chunk: int = 16384) -> np.ndarray:
+		c = self.centroids
+		csq = (c * c).sum(axis=1)[None, :]
+		out = np.empty(X.shape[0], dtype=np.int32)
+		# Por bloques para acotar la matriz de distancias (chunk x nlist)
+		for s in range(0, X.shape[0], chunk):
+			out[s:s + chunk] = (csq - 2.0 * (X[s:s + chunk] @ c.T)).argmin(axis=1)
+		return out
+
+	def train_ivf(self, nlist: Optional[int] = None, iters: int = 10, sample: int = 100_000, seed: int = 0) -> None:
+		"""k-means (Lloyd) sobre una muestra de los embeddings; asigna todas las filas."""
+		with self._lock:
+			X = self.embeddings
+			if X.shape[0] == 0:
+				return
+			nlist = nlist or max(1, int(np.sqrt(X.shape[0])))
+			rng = np.random.default_rng(seed)
+			S = X[rng.choice(X.shape[0], size=min(sample, X.shape[0]), replace=False)]
+			self.centroids = S[rng.choice(S.shape[0], size=min(nlist, S.shape[0]), replace=False)].copy()
+			for _ in range(iters):
+				a = self._nearest_centroid(S)
+				sums = np.zeros_like(self.centroids)
+				np.add.at(sums, a, S)
+				counts = np.bincount(a, minlength=self.centroids.shape[0])[:, None]
+				nz = counts[:, 0] > 0
+				self.centroids[nz] = sums[nz] / counts[nz]
+			self._assign[: self.n] = self._nearest_centroid(X)
+			self._build_ivf_lists()
+
+	def _build_ivf_lists(self) -> None:
+		"""Listas por celda desde cero (tras entrenar o cargar); luego crecen con _ivf_append."""
+		a = self._assign[: self.n]
+		order = np.argsort(a, kind="stable")
+		offsets = np.searchsorted(a[order], np.arange(self.centroids.shape[0] + 1))
+		self._ivf_ids = [order[offsets[c]:offsets[c + 1]].copy() for c in range(self.centroids.shape[0])]
+		self._ivf_len = np.diff(offsets).astype(np.int64)
+
+	def _ivf_append(self, assign: np.ndarray, start: int) -> None:
+		"""Agrega las filas start.. a sus celdas (crecimiento amortizado, sin reordenar el resto)."""
+		rows = np.arange(start, start + assign.size, dtype=np.int64)
+		order = np.argsort(assign, kind="stable")
+		cells, first, counts = np.unique(assign[order], return_index=True, return_counts=True)
+		for c, f, m in zip(cells, first, counts):
+			ids, n = self._ivf_ids[c], int(self._ivf_len[c])
+			if n + m > ids.size:
+				grown = np.empty(max(n + m, 2 * ids.size, 16), dtype=np.int64)
+				grown[:n] = ids[:n]
+				ids = self._ivf_ids[c] = grown
+			ids[n:n + m] = rows[order[f:f + m]]
+			self._ivf_len[c] = n + m
+
+	# --- Búsqueda ---
+	def effective_backend(self, backend: str = BACKEND) -> str:
+		"""Backend que usará search(): "ivf" sin centroides entrenados cae a fuerza bruta."""
+		return "ivf" if backend == "ivf" and self.centroids is not None else "brute"
+
+	def search(self, q: np.ndarray, k: int = 10, backend: str = BACKEND, nprobe: int = 8, exclude_ref: Optional[int] = None) -> List[Dict[str, Any]]:
+		q = np.asarray(q, dtype=np.float32).reshape(-1)
+		with self._lock:
+			if self.n == 0:
+				return []
+			if backend == "ivf" and self.centroids is not None:
+				c = self.centroids
+				cd = (c * c).sum(axis=1) - 2.0 * (c @ q)
+				probe = np.argsort(cd)[: min(nprobe, c.shape[0])]
+				rows = np.concatenate([self._ivf_ids[p][: self._ivf_len[p]] for p in probe])
+			else:
+				rows = None
+			emb = self._emb[: self.n] if rows is None else self._emb[rows]
+			sq = self._sq[: self.n] if rows is None else self._sq[rows]
+			d = sq - 2.0 * (emb @ q) + float(q @ q)
+			if exclude_ref is not None:
+				ids = self._ref[: self.n] if rows is None else self._ref[rows]
+				src = self._src[: self.n] if rows is None else self._src[rows]
+				d[(ids == exclude_ref) & (src == SRC_ANALYSIS)] = np.inf
+			if d.size == 0:
+				return []
+			kk = min(k, d.size)
+			top = np.argpartition(d, kk - 1)[:kk]
+			top = top[np.argsort(d[top])]
+			top = top[np.isfinite(d[top])]
+			hit = top if rows is None else rows[top]
+			return [
+				{
+					"source": "reference" if self._src[i] == SRC_REFERENCE else "analysis",
+					"analysis_id": int(self._ref[i]) if self._src[i] == SRC_ANALYSIS else None,
+					"reference_row": int(self._ref[i]) if self._src[i] == SRC_REFERENCE else None,
+					"beat": int(self._beat[i]) if self._beat[i] != BEAT_MEDIAN else None,
+					"reference_label": int(self._label[i]) if self._label[i] >= 0 else None,
+					"distance": float(np.sqrt(max(d[j], 0.0))),
+				}
+				for i, j in zip(hit, top)
+			]
+
+	def query_vector(self, analysis_id: int, beat: Optional[int] = None) -> Optional[np.ndarray]:
+		"""Embedding del latido pedido o, por defecto, el latido mediano del análisis."""
+		with self._lock:
+			# _reserve() puede reemplazar _emb mientras otro hilo agrega un análisis
+			span = self._spans.get(int(analysis_id))
+			if span is None:
+				return None
+			E = self._emb[span[0]:span[1]]
+			if beat is not None:
+				if self._beat[span[0]] == BEAT_MEDIAN or not 0 <= beat < E.shape[0]:
+					return None
+				return E[beat].copy()
+			return np.median(E, axis=0).astype(np.float32)
+
+	# --- Persistencia ---
+	def _snapshot(self) -> Dict[str, np.ndarray]:
+		"""
+		Vistas de las filas [0, n) tomadas bajo el lock. Las filas ya escritas no cambian
+		y _reserve() copia a arreglos nuevos, así que las vistas siguen válidas afuera.
+		"""
+		with self._lock:
+			spans = np.array([(a, s, e) for a, (s, e) in self._spans.items()], dtype=np.int64).reshape(-1, 3)
+			snap = dict(
+				emb=self.embeddings, ref=self._ref[: self.n], beat=self._beat[: self.n],
+				src=self._src[: self.n], label=self._label[: self.n], spans=spans,
+				pca_mean=self.pca_mean, pca_components=self.pca_components,
+				centroids=self.centroids.copy() if self.centroids is not None else np.empty((0, self.k), dtype=np.float32),
+			)
+			self._dirty_since_save = 0
+			self._saved_at = time.monotonic()
+		return snap
+
+	def save(self, path: str = INDEX_DIR) -> None:
+		"""Escribe una instantánea; el lock del índice sólo se toma para armarla."""
+		self._write(self._snapshot(), path)
+
+	def _write(self, snap: Dict[str, np.ndarray], path: str) -> None:
+		with self._save_lock:
+			os.makedirs(path, exist_ok=True)
+			tmp = os.path.join(path, "index.tmp.npz")
+			np.savez(tmp, **snap)
+			os.replace(tmp, os.path.join(path, "index.npz"))
+
+	def maybe_save(self, path: str = INDEX_DIR) -> None:
+		"""Si toca guardar, toma la instantánea y la escribe en un hilo aparte (a lo sumo uno a la vez)."""
+		if not (self._dirty_since_save >= SAVE_EVERY or (
+				self._dirty_since_save and time.monotonic() - self._saved_at >= SAVE_INTERVAL_S)):
+			return
+		with self._lock:
+			if self._saver is not None and self._saver.is_alive():
+				return
+			snap = self._snapshot()
+			self._saver = threading.Thread(target=self._write_quietly, args=(snap, path), name="similarity-save", daemon=True)
+			self._saver.start()
+
+	def _write_quietly(self, snap: Dict[str, np.ndarray], path: str) -> None:
+		try:
+			self._write(snap, path)
+		except Exception:
+			log.exception("no se pudo guardar el índice de similitud en %s", path)
+
+	def flush(self, timeout: Optional[float] = None) -> None:
+		"""Espera a que termine un guardado en curso (apagado, pruebas)."""
+		saver = self._saver
+		if saver is not None:
+			saver.join(timeout)
+
+	def backfill(self, batch_size: int = 500) -> int:
+		"""
+		Indexa el latido mediano guardado con cada AnalysisResult que no está en el
+		índice (median_only: la señal no se guarda, no hay latidos individuales);
+		retorna cuántos análisis se agregaron. Los ya indexados no se tocan.
+		"""
+		from sqlalchemy import select
+		from ecg_storage.db import AnalysisResult, SessionLocal
+
+		db = SessionLocal()
+		try:
+			ids = db.execute(select(AnalysisResult.id).order_by(AnalysisResult.id)).scalars().all()
+			with self._lock:
+				missing = [i for i in ids if i not in self._spans]
+			added = 0
+			for s in range(0, len(missing), batch_size):
+				rows = db.execute(
+					select(AnalysisResult.id, AnalysisResult.extras).where(AnalysisResult.id.in_(missing[s:s + batch_size]))
+				).all()
+				for aid, extras in rows:
+					mv = ((extras or {}).get("median_beat") or {}).get("mv")
+					if mv and len(mv) >= 2:
+						added += self.add_analysis(aid, np.asarray(mv, dtype=np.float32)[None, :], median_only=True)
+			return added
+		finally:
+			db.close()
+
+	@classmethod
+	def load(cls, path: str = INDEX_DIR) -> Optional["BeatIndex"]:
+		f = os.path.join(path, "index.npz")
+		if not os.path.exists(f):
+			return None
+		with np.load(f, allow_pickle=False) as z:
+			idx = cls(n_components=int(z["pca_components"].shape[0]))
+			idx.pca_mean, idx.pca_components = z["pca_mean"], z["pca_components"]
+			emb = z["emb"]
+			idx.add_embeddings(emb, z["ref"], z["beat"], 0, z["label"])
+			idx._src[: idx.n] = z["src"]
+			idx._spans = {int(a): (int(s), int(e)) for a, s, e in z["spans"]}
+			if z["centroids"].shape[0]:
+				idx.centroids = z["centroids"]
+				idx._assign[: idx.n] = idx._nearest_centroid(idx.embeddings)
+				idx._build_ivf_lists()
+		idx._dirty_since_save = 0
+		return idx
+
+	@classmethod
+	def from_reference(cls, path: Optional[str] = None) -> "BeatIndex":
+		"""Índice nuevo con PCA ajustado y sembrado con los latidos de ECG5000."""
+		from ecg_ml.datasets import ECG5000_PATH, load_ecg5000
+		X, y = load_ecg5000(path or ECG5000_PATH)
+		idx = cls()
+		idx.fit_pca(X)
+		idx.add_embeddings(idx.embed(X), np.arange(X.shape[0]), np.zeros(X.shape[0], dtype=np.int32), SRC_REFERENCE, np.asarray(y))
+		return idx
+
+
+_INDEX: Optional[BeatIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index() -> BeatIndex:
+	global _INDEX
+	with _INDEX_LOCK:
+		if _INDEX is None:
+			index = BeatIndex.load() or BeatIndex.from_reference()
+			try:
+				if index.backfill():
+					index.save()
+			except Exception:
+				# Sin base (herramientas offline): el índice sirve igual con lo que tenga
+				pass
+			if BACKEND == "ivf" and index.centroids is None:
+				index.train_ivf()
+			_INDEX = index
+		return _INDEX
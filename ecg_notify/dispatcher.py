@@ -0,0 +1,216 @@
+"""
+Despachador asíncrono de notificaciones.
+
+- submit() nunca bloquea: deduplica, encola en una cola acotada y retorna.
+- NOTIFY_WORKERS hilos envían con los transportes (clientes reutilizados).
+- Dedup: el mismo (canal, destino, clave) se descarta durante NOTIFY_DEDUP_S.
+- Rate limit: NOTIFY_RATE_PER_MIN mensajes por destinatario; el exceso se pliega
+  en el siguiente resumen en lugar de perderse.
+- Digest: las notificaciones con digest=True se agrupan por destinatario durante
+  NOTIFY_DIGEST_S y se envían como un solo mensaje.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .transports import Transport, build_transports
+
+
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "2"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_DEDUP_S = float(os.getenv("NOTIFY_DEDUP_S", "300"))
+NOTIFY_RATE_PER_MIN = int(os.getenv("NOTIFY_RATE_PER_MIN", "6"))
+NOTIFY_DIGEST_S = float(os.getenv("NOTIFY_DIGEST_S", "10"))
+
+Recipient = Tuple[str, str]
+
+
+@dataclass
+class Notification:
+    channel: str  # "whatsapp" | "email"
+    to: str
+    body: str
+    subject: Optional[str] = None
+    key: Optional[str] = None  # clave de deduplicación (p. ej. tipo de alerta)
+    digest: bool = False
+
+
+class Dispatcher:
+    def __init__(self, transports: Optional[Dict[str, Transport]] = None, workers: int = NOTIFY_WORKERS,
+                 queue_size: int = NOTIFY_QUEUE_SIZE, dedup_s: float = NOTIFY_DEDUP_S,
+                 rate_per_min: int = NOTIFY_RATE_PER_MIN, digest_s: float = NOTIFY_DIGEST_S):
+        self.transports = transports if transports is not None else build_transports()
+        self.workers = max(1, workers)
+        self.dedup_s = dedup_s
+        self.rate_per_min = rate_per_min
+        self.digest_s = digest_s
+        self._queue: "queue.Queue[Optional[Notification]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple[str, str, str], float] = {}
+        self._sent_at: Dict[Recipient, Deque[float]] = defaultdict(deque)
+        self._digests: Dict[Recipient, List[Notification]] = {}
+        self._digest_due: Dict[Recipient, float] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self.metrics = {"submitted": 0, "sent": 0, "failed": 0, "deduped": 0, "dropped": 0,
+                        "digested": 0, "rate_limited": 0}
+
+    # --- ciclo de vida ---
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"notify-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._digest_loop, name="notify-digest", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Vacía los resúmenes pendientes, espera la cola (hasta timeout) y cierra conexiones."""
+        if not self._threads:
+            return
+        self._flush_digests(force=True)
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(timeout=0.5)
+        self._threads = []
+        for tr in self.transports.values():
+            tr.close()
+
+    # --- API ---
+    def configured(self, channel: str) -> bool:
+        tr = self.transports.get(channel)
+        return bool(tr and tr.configured())
+
+    def submit(self, n: Notification) -> bool:
+        """Encola sin bloquear. False si se descartó (duplicado, canal sin configurar o cola llena)."""
+        if not n.to or not self.configured(n.channel):
+            return False
+        self.start()
+        now = time.monotonic()
+        with self._lock:
+            self.metrics["submitted"] += 1
+            if n.key is not None:
+                dk = (n.channel, n.to, n.key)
+                if now - self._seen.get(dk, -1e18) < self.dedup_s:
+                    self.metrics["deduped"] += 1
+                    return False
+                self._seen[dk] = now
+                if len(self._seen) > 10000:
+                    self._seen = {k: t for k, t in self._seen.items() if now - t < self.dedup_s}
+            if n.digest:
+                self._add_to_digest(n, now)
+                return True
+        return self._enqueue(n)
+
+    def send_now(self, n: Notification) -> Optional[str]:
+        """Envío síncrono (endpoints de prueba) reutilizando el cliente del transporte."""
+        return self.transports[n.channel].send(n.to, n.body, n.subject)
+
+    def stats(self) -> Dict[str, object]:
+        return {**self.metrics, "queued": self._queue.qsize(), "digests_pending": len(self._digests)}
+
+    # --- internos ---
+    def _enqueue(self, n: Notification) -> bool:
+        try:
+            self._queue.put_nowait(n)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.metrics["dropped"] += 1
+            return False
+
+    def _add_to_digest(self, n: Notification, now: float) -> None:
+        rcpt = (n.channel, n.to)
+        self._digests.setdefault(rcpt, []).append(n)
+        self._digest_due.setdefault(rcpt, now + self.digest_s)
+
+    def _rate_ok(self, rcpt: Recipient, now: float) -> bool:
+        if self.rate_per_min <= 0:
+            return True
+        sent = self._sent_at[rcpt]
+        while sent and now - sent[0] > 60.0:
+            sent.popleft()
+        if len(sent) >= self.rate_per_min:
+            return False
+        sent.append(now)
+        return True
+
+    def _flush_digests(self, force: bool = False) -> None:
+        now = time.monotonic()
+        ready: List[Notification] = []
+        with self._lock:
+            for rcpt, due in list(self._digest_due.items()):
+                if not force and due > now:
+                    continue
+                items = self._digests.pop(rcpt, [])
+                del self._digest_due[rcpt]
+                if not items:
+                    continue
+                if len(items) == 1:
+                    ready.append(Notification(items[0].channel, items[0].to, items[0].body, items[0].subject))
+                    continue
+                self.metrics["digested"] += len(items)
+                body = "\n".join(f"- {it.body}" for it in items)
+                ready.append(Notification(rcpt[0], rcpt[1], f"{len(items)} notificaciones:\n{body}",
+                                          subject=items[0].subject or "ECG - Resumen de alertas"))
+        for n in ready:
+            self._enqueue(n)
+
+    def _digest_loop(self) -> None:
+        while not self._stop.wait(0.5):
+            self._flush_digests()
+
+    def _worker(self) -> None:
+        while True:
+            n = self._queue.get()
+            try:
+                if n is None:
+                    return
+                rcpt = (n.channel, n.to)
+                with self._lock:
+                    ok = self._rate_ok(rcpt, time.monotonic())
+                    if not ok:
+                        # Sobre el límite: se pliega en el próximo resumen del destinatario
+                        self.metrics["rate_limited"] += 1
+                        self._add_to_digest(n, time.monotonic() + 60.0 / max(1, self.rate_per_min))
+                if not ok:
+                    continue
+                try:
+                    self.transports[n.channel].send(n.to, n.body, n.subject)
+                    with self._lock:
+                        self.metrics["sent"] += 1
+                except Exception:
+                    with self._lock:
+                        self.metrics["failed"] += 1
+            finally:
+                self._queue.task_done()
+
+
+_DISPATCHER: Optional[Dispatcher] = None
+
+
+def get_dispatcher() -> Dispatcher:
+    global _DISPATCHER
+    if _DISPATCHER is None:
+        _DISPATCHER = Dispatcher()
+    return _DISPATCHER
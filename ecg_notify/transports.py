@@ -0,0 +1,150 @@
+"""
+Transportes de notificación (WhatsApp vía Twilio, email vía SMTP, fake para pruebas).
+
+Cada transporte mantiene su cliente/conexión y lo reutiliza entre envíos;
+send() es thread-safe y lanza excepción si el envío falla.
+"""
+
+from __future__ import annotations
+
+import os
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+
+class Transport:
+    channel = ""
+
+    def configured(self) -> bool:
+        return True
+
+    def send(self, to: str, body: str, subject: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def normalize_whatsapp(to: str) -> str:
+    to = (to or "").strip().replace(" ", "")
+    # Twilio requiere E.164 con prefijo whatsapp:
+    return to if to.startswith("whatsapp:") else f"whatsapp:{to}"
+
+
+class WhatsAppTransport(Transport):
+    channel = "whatsapp"
+
+    def __init__(self):
+        self.from_ = os.getenv("TWILIO_WHATSAPP_FROM")
+        self.sid = os.getenv("TWILIO_SID")
+        self.token = os.getenv("TWILIO_TOKEN")
+        self.key_sid = os.getenv("TWILIO_API_KEY_SID")
+        self.key_secret = os.getenv("TWILIO_API_KEY_SECRET")
+        self._client = None
+        self._lock = threading.Lock()
+
+    def configured(self) -> bool:
+        return bool(self.from_ and ((self.key_sid and self.key_secret) or (self.sid and self.token)))
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client as TwilioClient
+                if self.key_sid and self.key_secret:
+                    self._client = TwilioClient(self.key_sid, self.key_secret)
+                else:
+                    self._client = TwilioClient(self.sid, self.token)
+            return self._client
+
+    def send(self, to: str, body: str, subject: Optional[str] = None) -> Optional[str]:
+        if not self.configured():
+            raise RuntimeError("Twilio no configurado")
+        msg = f"{subject}\n{body}" if subject else body
+        res = self._get_client().messages.create(from_=self.from_, to=normalize_whatsapp(to), body=msg)
+        return res.sid
+
+
+class SMTPTransport(Transport):
+    """Conexión SMTP persistente; se reabre si el servidor la cerró."""
+    channel = "email"
+
+    def __init__(self):
+        self.host = os.getenv("SMTP_HOST")
+        self.port = int(os.getenv("SMTP_PORT", "587"))
+        self.user = os.getenv("SMTP_USER")
+        self.pwd = os.getenv("SMTP_PASS")
+        self.sender = os.getenv("SMTP_FROM", self.user or "noreply@example.com")
+        self._server: Optional[smtplib.SMTP] = None
+        self._lock = threading.Lock()
+
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=20)
+        server.starttls()
+        if self.user and self.pwd:
+            server.login(self.user, self.pwd)
+        return server
+
+    def _get_server(self) -> smtplib.SMTP:
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self._close()
+        self._server = self._connect()
+        return self._server
+
+    def send(self, to: str, body: str, subject: Optional[str] = None) -> Optional[str]:
+        if not self.configured():
+            raise RuntimeError("SMTP_HOST no configurado")
+        msg = MIMEText(body)
+        msg["Subject"] = subject or "ECG - Notificación"
+        msg["From"] = self.sender
+        msg["To"] = to
+        with self._lock:
+            try:
+                self._get_server().sendmail(self.sender, [to], msg.as_string())
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # Reintento único con conexión nueva
+                self._close()
+                self._get_server().sendmail(self.sender, [to], msg.as_string())
+        return None
+
+    def _close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class FakeTransport(Transport):
+    """Registra los mensajes en memoria (ECG_NOTIFY_TRANSPORT=fake)."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.sent: List[Dict[str, object]] = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str, subject: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            self.sent.append({"to": to, "subject": subject, "body": body, "ts": time.time()})
+            return f"fake-{self.channel}-{len(self.sent)}"
+
+
+def build_transports() -> Dict[str, Transport]:
+    if os.getenv("ECG_NOTIFY_TRANSPORT", "").lower() == "fake":
+        return {"whatsapp": FakeTransport("whatsapp"), "email": FakeTransport("email")}
+    return {"whatsapp": WhatsAppTransport(), "email": SMTPTransport()}
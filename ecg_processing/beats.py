@@ -0,0 +1,60 @@
+import numpy as np
+
+
+def segment_beats(signal, r_peaks, fs, pre_s=0.25, post_s=0.45):
+    """
+    Recorta una ventana fija alrededor de cada pico R en una sola operación
+    (indexado vectorizado, sin bucle por latido).
+    Retorna (beats [n, L], keep) donde keep son los índices de r_peaks usados
+    (se descartan los latidos cuya ventana sale de la señal).
+    """
+    x = np.asarray(signal, dtype=float)
+    r = np.asarray(r_peaks, dtype=np.int64)
+    pre = int(round(pre_s * fs))
+    post = int(round(post_s * fs))
+    keep = np.flatnonzero((r - pre >= 0) & (r + post <= x.size))
+    if keep.size == 0:
+        return np.empty((0, pre + post)), keep
+    idx = r[keep, None] + np.arange(-pre, post)[None, :]
+    return x[idx], keep
+
+
+def classify_beats(clf, signal, r_peaks, fs, pre_s=0.25, post_s=0.45):
+    """
+    Clasifica cada latido con una única llamada batch al clasificador.
+    Retorna conteos por clase, carga (%) por clase y los índices de latidos anormales.
+    """
+    beats, keep = segment_beats(signal, r_peaks, fs, pre_s, post_s)
+    labels = list(clf.labels)
+    if beats.shape[0] == 0:
+        return {"n_beats": 0, "counts": {}, "burden_pct": {}, "abnormal_indices": [], "abnormal_samples": [], "abnormal_labels": []}
+    # Centrar cada latido en su línea de base para que la deriva no domine la puntuación
+    beats = beats - np.median(beats, axis=1, keepdims=True)
+    top = clf.predict_batch(beats, fs)["top"]
+    counts = np.bincount(top, minlength=len(labels))
+    n = int(top.size)
+    normal_idx = labels.index("normal") if "normal" in labels else -1
+    abn = np.flatnonzero(top != normal_idx)
+    r = np.asarray(r_peaks, dtype=np.int64)
+    return {
+        "n_beats": n,
+        "counts": {lab: int(counts[i]) for i, lab in enumerate(labels)},
+        "burden_pct": {lab: float(counts[i] * 100.0 / n) for i, lab in enumerate(labels)},
+        # índices en la secuencia de picos R (r_peaks) y posición en muestras
+        "abnormal_indices": keep[abn].tolist(),
+        "abnormal_samples": r[keep[abn]].tolist(),
+        "abnormal_labels": [labels[i] for i in top[abn]],
+    }
+
+
+def median_beat(beats, fs, pre_s=0.25, max_points=175):
+    """
+    Latido mediano (plantilla robusta a latidos aislados ruidosos), submuestreado a
+    lo sumo a max_points para guardarlo junto al análisis. None si no hay latidos.
+    """
+    B = np.asarray(beats, dtype=float)
+    if B.ndim != 2 or B.shape[0] == 0:
+        return None
+    tmpl = np.median(B - np.median(B, axis=1, keepdims=True), axis=0)
+    step = max(1, int(np.ceil(tmpl.size / max_points)))
+    return {"fs": float(fs) / step, "pre_s": float(pre_s), "mv": np.round(tmpl[::step], 4).tolist()}
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Índices del mínimo y máximo de cada bucket (en orden temporal), vectorizado.
+    Conserva los picos R aunque se reduzca mucho la cantidad de puntos.
+    Retorna un array ordenado de hasta 2*n_buckets índices.
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return np.arange(n)
+    size = n // n_buckets
+    m = size * n_buckets
+    blocks = y[:m].reshape(n_buckets, size)
+    base = np.arange(n_buckets) * size
+    imin = base + blocks.argmin(axis=1)
+    imax = base + blocks.argmax(axis=1)
+    idx = np.concatenate([imin, imax])
+    if m < n:
+        tail = y[m:]
+        idx = np.concatenate([idx, [m + tail.argmin(), m + tail.argmax()]])
+    return np.unique(idx)
+
+
+def lttb_indices(y, n_out, x=None):
+    """
+    Largest-Triangle-Three-Buckets: elige n_out puntos que preservan la forma visual.
+    El bucle es por bucket (n_out iteraciones), cada una vectorizada sobre su bucket.
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < edges.size else n
+        nhi = max(nhi, nlo + 1)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def decimate(y, n_points, method="minmax"):
+    """Índices a graficar para mostrar `y` con ~n_points puntos."""
+    if method == "lttb":
+        return lttb_indices(y, int(n_points))
+    return minmax_indices(y, max(1, int(n_points) // 2))
+
+
+def target_points(n_samples, fs, points_per_second=None, width=None, window_s=None):
+    """
+    Puntos objetivo a partir de puntos/segundo o del ancho en píxeles de la vista.
+    Retorna None si no hay que decimar.
+    """
+    duration = n_samples / float(fs) if fs else 0.0
+    if width:
+        # ~2 puntos por píxel (min y max) sobre la ventana visible
+        span = float(window_s) if window_s else duration
+        points_per_second = 2.0 * float(width) / span if span > 0 else None
+    if not points_per_second or points_per_second >= fs:
+        return None
+    return max(2, int(np.ceil(duration * points_per_second)))
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import datetime
+import io
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Table
+from sqlalchemy.orm import Session
+
+from .db import Alert, Event
+
+
+DEFAULT_CHUNK = 5000
+
+
+def _chunks(rows: Sequence[Dict[str, Any]], size: int) -> Iterable[Sequence[Dict[str, Any]]]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _copy_field(v: Any, is_json: bool = False) -> str:
+    """
+    Un campo CSV para COPY con NULL '\\N': None va sin comillas como \\N y todo lo
+    demás entre comillas, así '' llega como cadena vacía y no como NULL.
+    """
+    if v is None:
+        return "\\N"
+    if is_json:
+        v = json.dumps(v)
+    elif isinstance(v, (bool, np.bool_)):
+        v = "true" if v else "false"
+    elif isinstance(v, (datetime.datetime, datetime.date, datetime.time)):
+        v = v.isoformat()
+    elif isinstance(v, (bytes, bytearray, memoryview)):
+        v = "\\x" + bytes(v).hex()
+    elif isinstance(v, (float, np.floating)):
+        v = repr(float(v))
+    else:
+        v = str(v)
+    return '"' + v.replace('"', '""') + '"'
+
+
+def _copy_buffer(table: Table, cols: List[str], chunk: Sequence[Dict[str, Any]]) -> io.StringIO:
+    json_cols = {c.name for c in table.columns if c.type.__class__.__name__ == "JSON"}
+    flags = [c in json_cols for c in cols]
+    buf = io.StringIO()
+    for r in chunk:
+        buf.write(",".join(_copy_field(r.get(c), j) for c, j in zip(cols, flags)))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+def _copy_chunk(db: Session, table: Table, cols: List[str], chunk: Sequence[Dict[str, Any]]) -> None:
+    """COPY ... FROM STDIN (CSV) por la conexión psycopg2 de la sesión."""
+    buf = _copy_buffer(table, cols, chunk)
+    raw = db.connection().connection
+    with raw.cursor() as cur:
+        cur.copy_expert(f"COPY {table.name} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+
+
+def bulk_insert(db: Session, model, rows: Sequence[Dict[str, Any]], chunk_size: int = DEFAULT_CHUNK, commit: bool = True) -> Dict[str, Any]:
+    """
+    Inserta `rows` (dicts con columnas de `model`) en bloques de `chunk_size`.
+    PostgreSQL + psycopg2 usa COPY; el resto, insert() de Core con executemany.
+    Con commit=True confirma cada bloque (cargas largas no retienen una sola transacción).
+    Retorna {"rows", "seconds", "rows_per_s", "method"}.
+    """
+    table: Table = model.__table__
+    n = len(rows)
+    if n == 0:
+        return {"rows": 0, "seconds": 0.0, "rows_per_s": 0.0, "method": None}
+    bind = db.get_bind()
+    use_copy = bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+    cols = [c.name for c in table.columns if not c.primary_key]
+    t0 = time.perf_counter()
+    for chunk in _chunks(rows, max(1, chunk_size)):
+        if use_copy:
+            _copy_chunk(db, table, cols, chunk)
+        else:
+            db.execute(table.insert(), list(chunk))
+        if commit:
+            db.commit()
+    dt = time.perf_counter() - t0
+    return {"rows": n, "seconds": dt, "rows_per_s": n / dt if dt > 0 else None, "method": "copy" if use_copy else "executemany"}
+
+
+def beat_times(r_peaks: np.ndarray, fs: float, start_time: Optional[datetime.datetime] = None, n_samples: Optional[int] = None) -> List[datetime.datetime]:
+    """
+    Timestamp UTC (naive) de cada pico R: start_time + r/fs. Sin start_time se
+    asume que la señal terminó ahora (start = now - n_samples/fs).
+    """
+    r = np.asarray(r_peaks, dtype=np.int64)
+    if start_time is None:
+        span = (n_samples if n_samples is not None else (int(r[-1]) + 1 if r.size else 0)) / float(fs)
+        start_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=span)
+    elif start_time.tzinfo is not None:
+        start_time = start_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    offsets = np.rint(r * (1e6 / float(fs))).astype("timedelta64[us]")
+    return (np.datetime64(start_time, "us") + offsets).astype(object).tolist()
+
+
+def event_rows(rr_ms: np.ndarray, r_peaks: np.ndarray, fs: float, start_time: Optional[datetime.datetime] = None,
+               n_samples: Optional[int] = None, source: str = "analysis") -> List[Dict[str, Any]]:
+    """Una fila Event por intervalo RR, fechada en el pico R que lo cierra."""
+    rr = np.asarray(rr_ms, dtype=float)
+    times = beat_times(r_peaks, fs, start_time, n_samples)[1:rr.size + 1]
+    hr = (60000.0 / rr).tolist()
+    return [
+        {"timestamp": t, "rr_ms": v, "hr_bpm": h, "source": source, "extras": None}
+        for t, v, h in zip(times, rr.tolist(), hr)
+    ]
+
+
+def insert_events(db: Session, rows: Sequence[Dict[str, Any]], **kw) -> Dict[str, Any]:
+    return bulk_insert(db, Event, rows, **kw)
+
+
+def insert_alerts(db: Session, rows: Sequence[Dict[str, Any]], **kw) -> Dict[str, Any]:
+    return bulk_insert(db, Alert, rows, **kw)
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import math
 import os
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, JSON, text, UniqueConstraint
+from sqlalchemy import create_engine, BigInteger, Column, Integer, Float, String, DateTime, JSON, LargeBinary, ForeignKey, Index, inspect, select, text, UniqueConstraint
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 
@@ -30,8 +31,36 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _async_database_url(url: str) -> str:
+	# Mismo destino con driver asyncio: asyncpg (PostgreSQL) o aiosqlite (SQLite)
+	explicit = os.getenv("ASYNC_DATABASE_URL")
+	if explicit:
+		return explicit
+	scheme, sep, rest = url.partition("://")
+	base = scheme.split("+", 1)[0]
+	if base in ("postgresql", "postgres"):
+		return f"postgresql+asyncpg{sep}{rest}"
+	if base == "sqlite":
+		return f"sqlite+aiosqlite{sep}{rest}"
+	return url
+
+
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+
+# Motor async creado en el primer uso: asyncpg/aiosqlite sólo se importan si alguna ruta async toca la base
+_async_engine = None
+_async_sessionmaker = None
+# Callbacks (p. ej. métricas) aplicados al motor async cuando se crea
+_async_engine_hooks: list = []
+
+
 class Event(Base):
 	__tablename__ = "events"
+	__table_args__ = (
+		# Paginación por cursor (timestamp, id) y filtros por fuente
+		Index("ix_events_timestamp_id", "timestamp", "id"),
+		Index("ix_events_source_timestamp", "source", "timestamp"),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	timestamp = Column(DateTime, index=True, nullable=False)
@@ -43,6 +72,10 @@ class Event(Base):
 
 class Alert(Base):
 	__tablename__ = "alerts"
+	__table_args__ = (
+		Index("ix_alerts_timestamp_id", "timestamp", "id"),
+		Index("ix_alerts_type_timestamp", "type", "timestamp"),
+	)
 
 	id = Column(Integer, primary_key=True, index=True)
 	timestamp = Column(DateTime, index=True, nullable=False)
@@ -77,6 +110,73 @@ class AnalysisResult(Base):
 	extras = Column(JSON, nullable=True)  # pr_intervals, counts, etc.
 	# Feedback from doctor
 	feedback = Column(JSON, nullable=True)  # {label, notes, by_uid}
+	# Copias denormalizadas de métricas clave (filtros de /doctor/analyses sin parsear JSON)
+	sdnn = Column(Float, index=True, nullable=True)
+	rmssd = Column(Float, index=True, nullable=True)
+	pnn50 = Column(Float, index=True, nullable=True)
+	lf_hf = Column(Float, index=True, nullable=True)
+	snr_db = Column(Float, index=True, nullable=True)
+	top_label = Column(String(32), index=True, nullable=True)
+
+
+# Nombre de métrica (API) -> columna de AnalysisResult
+METRIC_COLUMNS = {"SDNN": "sdnn", "RMSSD": "rmssd", "pNN50": "pnn50", "LF_HF": "lf_hf", "SNR": "snr_db"}
+
+
+def _finite(v: Any) -> Optional[float]:
+	try:
+		v = float(v)
+	except (TypeError, ValueError):
+		return None
+	return v if math.isfinite(v) else None
+
+
+def analysis_metrics(hrv: Optional[dict], ml: Optional[dict] = None, quality: Optional[dict] = None) -> Dict[str, Any]:
+	"""Valores de las columnas denormalizadas a partir de los JSON del análisis (NaN/inf -> NULL)."""
+	t = (hrv or {}).get("time") or {}
+	f = (hrv or {}).get("freq") or {}
+	label = (ml or {}).get("top_label")
+	return {
+		"sdnn": _finite(t.get("SDNN")),
+		"rmssd": _finite(t.get("RMSSD")),
+		"pnn50": _finite(t.get("pNN50")),
+		"lf_hf": _finite(f.get("LF_HF")),
+		"snr_db": _finite((quality or {}).get("snr_db")),
+		"top_label": str(label)[:32] if label is not None else None,
+	}
+
+
+class AnalysisFeature(Base):
+	"""Fixed-length feature vector per analysis (float32 blob), used for retraining."""
+	__tablename__ = "analysis_features"
+
+	analysis_id = Column(Integer, ForeignKey("analysis_results.id", ondelete="CASCADE"), primary_key=True)
+	version = Column(Integer, nullable=False)
+	dim = Column(Integer, nullable=False)
+	vector = Column(LargeBinary, nullable=False)  # little-endian float32 * dim
+	# Copia denormalizada del veredicto del médico para leer en bloque sin parsear JSON
+	label = Column(String(32), index=True, nullable=True)
+	labelled_at = Column(DateTime, index=True, nullable=True)
+
+
+class SampleChunk(Base):
+	"""Bloque de muestras crudas recibido de un dispositivo (una fila por trama, sin expandir)."""
+	__tablename__ = "sample_chunks"
+	__table_args__ = (
+		# Idempotencia de reintentos/QoS 1; t0 distingue un reinicio del dispositivo (seq vuelve a 0)
+		UniqueConstraint("device_id", "t0", "seq", name="uq_sample_chunks_device_t0_seq"),
+	)
+
+	id = Column(Integer, primary_key=True)
+	device_id = Column(String(64), nullable=False)
+	seq = Column(BigInteger, nullable=False)
+	t0 = Column(Float, nullable=False)  # epoch s (UTC) de la primera muestra
+	fs = Column(Float, nullable=False)
+	n = Column(Integer, nullable=False)
+	dtype = Column(String(8), nullable=False)  # int16 | float32 (little-endian)
+	scale = Column(Float, nullable=False)  # mV por unidad
+	data = Column(LargeBinary, nullable=False)
+	received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 
 class NotificationConfig(Base):
@@ -89,8 +189,87 @@ class NotificationConfig(Base):
 	updated_by = Column(Integer, nullable=True)  # uid del usuario que actualizó
 
 
+def _missing_columns() -> list:
+	"""Columnas de los modelos que faltan en tablas ya existentes."""
+	insp = inspect(engine)
+	missing = []
+	for table in Base.metadata.sorted_tables:
+		if not insp.has_table(table.name):
+			continue
+		existing = {c["name"] for c in insp.get_columns(table.name)}
+		missing.extend(col for col in table.columns if col.name not in existing)
+	return missing
+
+
+def _add_missing_columns() -> list:
+	"""ALTER TABLE ADD COLUMN para columnas nulables nuevas en tablas existentes (sin migraciones)."""
+	added = []
+	with engine.begin() as conn:
+		for col in _missing_columns():
+			if not col.nullable:
+				continue
+			ddl = col.type.compile(dialect=engine.dialect)
+			conn.execute(text(f'ALTER TABLE {col.table.name} ADD COLUMN {col.name} {ddl}'))
+			added.append(f"{col.table.name}.{col.name}")
+	return added
+
+
+def backfill_analysis_metrics(batch_size: int = 500) -> int:
+	"""Rellena las columnas de métricas de análisis previos (filas con todas ellas en NULL)."""
+	cols = [getattr(AnalysisResult, c) for c in (*METRIC_COLUMNS.values(), "top_label")]
+	table = AnalysisResult.__table__
+	done, last_id = 0, 0
+	while True:
+		with engine.begin() as conn:
+			rows = conn.execute(
+				select(table.c.id, table.c.hrv, table.c.ml, table.c.quality)
+				.where(table.c.id > last_id, table.c.hrv.isnot(None), *[c.is_(None) for c in cols])
+				.order_by(table.c.id).limit(batch_size)
+			).all()
+			if not rows:
+				return done
+			for r in rows:
+				conn.execute(table.update().where(table.c.id == r.id).values(**analysis_metrics(r.hrv, r.ml, r.quality)))
+			last_id = rows[-1].id
+			done += len(rows)
+
+
 def init_db() -> None:
+	"""
+	Crea las tablas que faltan. Columnas/índices nuevos y el backfill de métricas
+	se aplican con migrate() (`python -m ecg_storage.migrate`), una vez y antes de
+	levantar los servicios. Se corre aquí con ECG_DB_MIGRATE=1 y, salvo
+	ECG_DB_MIGRATE=0, sobre SQLite (base local de un solo proceso, p. ej. ecg.db).
+	En otro caso, si al esquema le faltan columnas falla con un mensaje claro en
+	vez de devolver 500 en cada consulta que las use.
+	"""
+	Base.metadata.create_all(bind=engine)
+	flag = os.getenv("ECG_DB_MIGRATE")
+	if flag == "1" or (flag != "0" and engine.dialect.name == "sqlite"):
+		migrate()
+		return
+	missing = _missing_columns()
+	if missing:
+		cols = ", ".join(f"{c.table.name}.{c.name}" for c in missing)
+		raise RuntimeError(f"Database schema is out of date (missing {cols}); run `python -m ecg_storage.migrate` first")
+
+
+def migrate(backfill: Optional[bool] = None, batch_size: int = 500) -> Dict[str, Any]:
+	"""
+	Lleva el esquema existente al de los modelos: tablas nuevas, columnas nulables
+	faltantes (ALTER TABLE ADD COLUMN) e índices nuevos; luego rellena las métricas
+	de análisis previos si se agregaron esas columnas (backfill=None) o si se pide.
+	"""
 	Base.metadata.create_all(bind=engine)
+	added = _add_missing_columns()
+	# create_all no agrega índices nuevos a tablas existentes
+	for table in Base.metadata.sorted_tables:
+		for idx in table.indexes:
+			idx.create(bind=engine, checkfirst=True)
+	if backfill is None:
+		backfill = any(a.startswith("analysis_results.") for a in added) or os.getenv("ECG_BACKFILL_METRICS") == "1"
+	filled = backfill_analysis_metrics(batch_size) if backfill else 0
+	return {"added_columns": added, "backfilled": filled}
 
 
 def get_session():
@@ -100,3 +279,40 @@ def get_session():
 	finally:
 		db.close()
 
+
+def get_async_engine():
+	"""AsyncEngine sobre ASYNC_DATABASE_URL (ImportError si falta el driver)."""
+	global _async_engine, _async_sessionmaker
+	if _async_engine is None:
+		from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+		eng = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+		# expire_on_commit=False: tras commit no hay carga implícita (no existe en async)
+		_async_sessionmaker = async_sessionmaker(eng, autoflush=False, expire_on_commit=False)
+		_async_engine = eng
+		for hook in _async_engine_hooks:
+			hook(eng)
+	return _async_engine
+
+
+def on_async_engine(hook) -> None:
+	"""Registra hook(engine) para el motor async: al crearlo, o ya mismo si existe (no lo crea)."""
+	_async_engine_hooks.append(hook)
+	if _async_engine is not None:
+		hook(_async_engine)
+
+
+async def get_async_session():
+	"""
+	Dependencia AsyncSession para rutas `async def`: la consulta espera en el event
+	loop en lugar de ocupar un hilo del threadpool durante todo el viaje a la base.
+	"""
+	get_async_engine()
+	async with _async_sessionmaker() as db:
+		yield db
+
+
+async def dispose_async_engine() -> None:
+	global _async_engine
+	if _async_engine is not None:
+		await _async_engine.dispose()
+		_async_engine = None
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import datetime
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ecg_ml.features import FEATURE_DIM, FEATURE_VERSION, to_blob, from_blobs
+from .db import AnalysisFeature, engine
+
+
+def save_features(db: Session, analysis_id: int, vec: np.ndarray) -> AnalysisFeature:
+	"""Adds (without committing) the feature row for an analysis."""
+	row = AnalysisFeature(
+		analysis_id=analysis_id,
+		version=FEATURE_VERSION,
+		dim=int(vec.size),
+		vector=to_blob(vec),
+	)
+	db.merge(row)
+	return row
+
+
+def set_label(db: Session, analysis_id: int, label: Optional[str]) -> bool:
+	"""Copies the doctor's verdict onto the feature row (without committing)."""
+	row = db.get(AnalysisFeature, analysis_id)
+	if row is None:
+		return False
+	row.label = (label or "").strip().lower() or None
+	row.labelled_at = datetime.datetime.utcnow() if row.label else None
+	db.add(row)
+	return True
+
+
+def iter_labelled(
+	batch_size: int = 8192,
+	since: Optional[datetime.datetime] = None,
+	bind=None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, datetime.datetime]]:
+	"""
+	Yields (X float32 [n, dim], labels [n], max labelled_at) in bulk batches.
+
+	Only the blob/label columns are selected through a server-side cursor, so
+	memory stays bounded by batch_size and no JSON is parsed.
+	"""
+	stmt = (
+		select(AnalysisFeature.vector, AnalysisFeature.label, AnalysisFeature.labelled_at)
+		.where(AnalysisFeature.label.is_not(None))
+		.where(AnalysisFeature.version == FEATURE_VERSION)
+		.order_by(AnalysisFeature.labelled_at.asc())
+	)
+	if since is not None:
+		stmt = stmt.where(AnalysisFeature.labelled_at > since)
+	with (bind or engine).connect() as conn:
+		result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+		for part in result.partitions(batch_size):
+			blobs, labels, stamps = zip(*part)
+			yield from_blobs(blobs, FEATURE_DIM), np.asarray(labels), max(stamps)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import base64
+import csv
+import datetime
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from .db import Alert, Event, engine
+
+
+# Columnas expuestas por /events y /alerts (mismo orden en CSV)
+COLUMNS = {
+    Event: ["id", "timestamp", "rr_ms", "hr_bpm", "source", "extras"],
+    Alert: ["id", "timestamp", "type", "severity", "details"],
+}
+FILTERS = {
+    Event: ["source"],
+    Alert: ["type", "severity"],
+}
+
+
+def encode_cursor(ts: datetime.datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """Inverso de encode_cursor; ValueError si el cursor no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_query(model, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+                cursor: Optional[str] = None, order: str = "desc", **filters: Any):
+    """
+    SELECT de las columnas expuestas con filtros de rango [since, until), igualdad
+    (source / type / severity) y keyset sobre (timestamp, id) en el orden pedido.
+    """
+    cols = [getattr(model, c) for c in COLUMNS[model]]
+    stmt = select(*cols)
+    if since is not None:
+        stmt = stmt.where(model.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(model.timestamp < until)
+    for name in FILTERS[model]:
+        value = filters.get(name)
+        if value is not None:
+            stmt = stmt.where(getattr(model, name) == value)
+    desc = order != "asc"
+    if cursor:
+        cts, cid = decode_cursor(cursor)
+        if desc:
+            stmt = stmt.where(or_(model.timestamp < cts, and_(model.timestamp == cts, model.id < cid)))
+        else:
+            stmt = stmt.where(or_(model.timestamp > cts, and_(model.timestamp == cts, model.id > cid)))
+    if desc:
+        stmt = stmt.order_by(model.timestamp.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(model.timestamp.asc(), model.id.asc())
+    return stmt
+
+
+def _to_dict(model, row) -> Dict[str, Any]:
+    d = dict(zip(COLUMNS[model], row))
+    d["timestamp"] = d["timestamp"].isoformat() if d["timestamp"] else None
+    return d
+
+
+def page(db: Session, model, limit: int = 200, **kw) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Una página de filas y el cursor de la siguiente (None si no hay más)."""
+    limit = max(1, min(int(limit), 10000))
+    rows = db.execute(build_query(model, **kw).limit(limit + 1)).all()
+    return _page(model, rows, limit)
+
+
+async def page_async(db, model, limit: int = 200, **kw) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """page() sobre una AsyncSession."""
+    limit = max(1, min(int(limit), 10000))
+    rows = (await db.execute(build_query(model, **kw).limit(limit + 1))).all()
+    return _page(model, rows, limit)
+
+
+def _page(model, rows, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if more and rows else None
+    return [_to_dict(model, r) for r in rows], next_cursor
+
+
+def stream(model, fmt: str = "ndjson", limit: Optional[int] = None, batch_size: int = 2000, bind=None, **kw) -> Iterator[str]:
+    """
+    Exporta filas como NDJSON o CSV leyendo con un cursor del servidor
+    (stream_results/yield_per): la memoria queda acotada por batch_size.
+    """
+    stmt = build_query(model, **kw)
+    if limit:
+        stmt = stmt.limit(int(limit))
+    cols = COLUMNS[model]
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerow(cols)
+        yield buf.getvalue()
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for part in result.partitions(batch_size):
+            if fmt == "csv":
+                buf = io.StringIO()
+                w = csv.writer(buf)
+                for r in part:
+                    d = _to_dict(model, r)
+                    w.writerow([json.dumps(v) if isinstance(v, (dict, list)) else ("" if v is None else v) for v in d.values()])
+                yield buf.getvalue()
+            else:
+                yield "".join(json.dumps(_to_dict(model, r), default=str) + "\n" for r in part)
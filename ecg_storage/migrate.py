@@ -0,0 +1,38 @@
+"""
+Migración explícita del esquema (al arrancar, la API y el gateway sólo la corren
+sobre SQLite o con ECG_DB_MIGRATE=1; en otro caso fallan si falta una columna).
+
+    python -m ecg_storage.migrate                  columnas/índices nuevos + backfill si hace falta
+    python -m ecg_storage.migrate --backfill       fuerza el backfill de métricas de análisis
+    python -m ecg_storage.migrate --no-backfill    sólo DDL (backfill después, en otra ventana)
+
+Correr una sola vez por despliegue, antes de levantar web e ingest (en
+docker-compose: servicio `migrate`). Repetirla no hace nada si el esquema ya
+está al día.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from typing import List, Optional
+
+from . import models  # noqa: F401  registra los modelos en Base
+from .db import migrate
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    g = ap.add_mutually_exclusive_group()
+    g.add_argument("--backfill", dest="backfill", action="store_const", const=True, default=None,
+                   help="rellenar métricas de análisis aunque no se hayan agregado columnas")
+    g.add_argument("--no-backfill", dest="backfill", action="store_const", const=False,
+                   help="sólo columnas e índices")
+    ap.add_argument("--batch-size", type=int, default=500, help="filas por transacción del backfill")
+    args = ap.parse_args(argv)
+    print(json.dumps(migrate(backfill=args.backfill, batch_size=args.batch_size)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, JSON, Text
 from sqlalchemy.orm import relationship
 
 from .db import Base
@@ -46,6 +46,11 @@ class Patient(Base):
 
 class DoctorAnalysisLink(Base):
     __tablename__ = "doctor_analysis_link"
+    __table_args__ = (
+        # Listados por médico (y paciente) ordenados por análisis, resueltos desde el índice
+        Index("ix_dal_doctor_patient_analysis", "doctor_id", "patient_id", "analysis_id"),
+        Index("ix_dal_doctor_analysis", "doctor_id", "analysis_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False, index=True)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from .db import SampleChunk
+
+
+# Claves por consulta de existencia (3 parámetros cada una; SQLite admite ~32k)
+LOOKUP_CHUNK = 1000
+# Una trama dura como mucho 65535 muestras (262 s a 250 Hz): cota para buscar por t0
+READ_LOOKBACK_S = 300.0
+DTYPES = {"int16": np.dtype("<i2"), "float32": np.dtype("<f4")}
+
+
+def chunk_row(device_id: str, seq: int, t0: float, fs: float, dtype: str, scale: float, data: bytes, n: int) -> Dict[str, Any]:
+    return {
+        "device_id": device_id, "seq": int(seq), "t0": float(t0), "fs": float(fs), "n": int(n),
+        "dtype": dtype, "scale": float(scale), "data": bytes(data), "received_at": datetime.datetime.utcnow(),
+    }
+
+
+def _insert_ignore(db: Session):
+    """INSERT que ignora filas ya existentes (device_id, t0, seq), según el dialecto."""
+    name = db.get_bind().dialect.name
+    table = SampleChunk.__table__
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing(constraint="uq_sample_chunks_device_t0_seq")
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing(index_elements=["device_id", "t0", "seq"])
+    return None
+
+
+def insert_chunks(db: Session, rows: Sequence[Dict[str, Any]], commit: bool = True) -> int:
+    """
+    Inserta tramas en una sola sentencia (executemany) ignorando duplicados.
+    Retorna cuántas filas eran nuevas.
+    """
+    if not rows:
+        return 0
+    table = SampleChunk.__table__
+    keys = [(r["device_id"], r["t0"], r["seq"]) for r in rows]
+    key_cols = tuple_(table.c.device_id, table.c.t0, table.c.seq)
+    seen = set()
+    for i in range(0, len(keys), LOOKUP_CHUNK):
+        seen.update(tuple(k) for k in db.execute(
+            table.select().with_only_columns(table.c.device_id, table.c.t0, table.c.seq)
+            .where(key_cols.in_(keys[i:i + LOOKUP_CHUNK]))
+        ).all())
+    fresh: List[Dict[str, Any]] = []
+    for r, k in zip(rows, keys):
+        if k not in seen:
+            seen.add(k)
+            fresh.append(r)
+    if fresh:
+        stmt = _insert_ignore(db)
+        # La consulta previa deja fuera lo ya guardado; ON CONFLICT cubre la carrera con otro escritor
+        db.execute(stmt if stmt is not None else insert(table), fresh)
+    if commit:
+        db.commit()
+    return len(fresh)
+
+
+def read_segments(db: Session, device_id: str, since: float, until: float) -> List[Tuple[float, float, np.ndarray]]:
+    """
+    Muestras (mV) de un dispositivo en [since, until) como tramos continuos
+    (t0, fs, valores): las tramas contiguas se unen y un hueco o cambio de fs
+    abre un tramo nuevo. Las tramas reenviadas que se solapan se recortan.
+    """
+    table = SampleChunk.__table__
+    rows = db.execute(
+        select(table.c.t0, table.c.fs, table.c.n, table.c.dtype, table.c.scale, table.c.data)
+        .where(table.c.device_id == device_id, table.c.t0 < until, table.c.t0 >= since - READ_LOOKBACK_S)
+        .order_by(table.c.t0, table.c.seq)
+    ).all()
+    segments: List[Tuple[float, float, List[np.ndarray]]] = []
+    end = None
+    for t0, fs, n, dtype, scale, data in rows:
+        if t0 + n / fs <= since:
+            continue
+        x = np.frombuffer(data, dtype=DTYPES[dtype]).astype(np.float64) * scale
+        if segments and fs == segments[-1][1] and end is not None and t0 - end <= 1.5 / fs:
+            skip = max(0, int(round((end - t0) * fs)))
+            if skip < x.size:
+                segments[-1][2].append(x[skip:])
+                end = t0 + n / fs
+            continue
+        segments.append((t0, fs, [x]))
+        end = t0 + n / fs
+    out = []
+    for t0, fs, parts in segments:
+        x = np.concatenate(parts)
+        lo = max(0, int(np.ceil((since - t0) * fs)))
+        hi = min(x.size, int(np.ceil((until - t0) * fs)))
+        if hi > lo:
+            out.append((t0 + lo / fs, fs, x[lo:hi]))
+    return out
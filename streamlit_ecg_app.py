@@ -7,6 +7,8 @@ from scipy.signal import find_peaks, butter, filtfilt
 import wfdb
 import os
 import requests
+from ecg_ml.datasets import load_csv_frame, CACHE_DIR
+from ecg_processing.decimate import minmax_indices
 
 API_BASE = os.getenv("API_BASE", "http://localhost:8000")
 LOGIN_URL = os.getenv("LOGIN_URL", "http://localhost:3000/login")
@@ -299,8 +301,26 @@ full_df = None
 
 if source == "CSV file":
     uploaded_file = st.sidebar.file_uploader("Sube un archivo CSV (formato timestamp_utc,raw,voltage_mV,filtered_mV,...)")
+    if uploaded_file is not None:
+        # Guardar la subida por hash de contenido para reutilizar la caché memory-mapped
+        try:
+            import hashlib
+            data = uploaded_file.getvalue()
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            up_path = os.path.join(CACHE_DIR, f"upload_{hashlib.sha256(data).hexdigest()[:16]}.csv")
+            if not os.path.exists(up_path):
+                with open(up_path, "wb") as f:
+                    f.write(data)
+            full_df = load_csv_frame(up_path)
+        except Exception as e:
+            st.error(f"Error leyendo CSV: {e}")
 elif source == "Local path":
     file_path = st.sidebar.text_input("Ruta local al CSV", value="ecg_log.csv")
+    if file_path and os.path.exists(file_path):
+        try:
+            full_df = load_csv_frame(file_path)
+        except Exception as e:
+            st.error(f"Error leyendo CSV: {e}")
 elif source == "SQLite DB (table)":
     db_path = st.sidebar.text_input("Ruta al archivo SQLite (.db)")
     table_name = st.sidebar.text_input("Nombre de la tabla (ej: ecg)", value="ecg")
@@ -332,8 +352,8 @@ elif source == "mHealth CSV":
     nrows = st.sidebar.number_input("Filas a mostrar (para vista rápida)", min_value=100, max_value=100000, value=5000, step=1000)
     if st.sidebar.button("Cargar mHealth CSV"):
         try:
-            # Lee solo las primeras nrows filas para no saturar memoria
-            df_mh = pd.read_csv(mhealth_path, nrows=nrows)
+            # Lee solo las primeras nrows filas para no saturar memoria (caché memory-mapped)
+            df_mh = load_csv_frame(mhealth_path, nrows=int(nrows))
             st.session_state.mhealth_df = df_mh
             st.success(f"Archivo {mhealth_path} cargado ({len(df_mh)} filas)")
         except Exception as e:
@@ -581,8 +601,12 @@ def main_stream_loop():
             label_color = 'white'
         else:
             label_color = 'black'
-        ax.plot(rel_t, sig, label='raw', alpha=0.5, color='#AED9FB' if st.session_state.get('theme_dark', False) else None)
-        ax.plot(rel_t, sig_f, label='filtered', color='#7ABBE6' if st.session_state.get('theme_dark', False) else None)
+        # Decimación min/max al ancho del gráfico (~1000 px): los picos R siguen visibles
+        # y el costo de render depende del tamaño de pantalla, no de fs
+        px = int(fig.get_size_inches()[0] * fig.dpi)
+        di = minmax_indices(sig_f, px)
+        ax.plot(rel_t[di], sig[di], label='raw', alpha=0.5, color='#AED9FB' if st.session_state.get('theme_dark', False) else None)
+        ax.plot(rel_t[di], sig_f[di], label='filtered', color='#7ABBE6' if st.session_state.get('theme_dark', False) else None)
         ax.scatter(peak_times, sig_f[peaks], color='#FFB3B3' if st.session_state.get('theme_dark', False) else 'red', label='R peaks')
         ax.set_xlabel('Time (s)', color=label_color)
         ax.set_ylabel('mV', color=label_color)
@@ -613,6 +637,8 @@ st.header("Análisis avanzado (beta)")
 col_btn, col_info = st.columns([1,3])
 with col_btn:
     do_analyze = st.button("Analizar ventana actual")
+with col_info:
+    per_beat = st.checkbox("Clasificar cada latido", value=False, help="Cuenta latidos por clase y la carga (%) de latidos anormales")
 
 analysis_out = st.session_state.get('last_analysis')
 token = st.session_state.get('auth_token')
@@ -625,11 +651,27 @@ if do_analyze:
     else:
         try:
             headers = {"Authorization": f"Bearer {token}"} if token else {}
-            payload = {"signal": sig_list, "fs": fs_val, "persist": True}
-            r = requests.post(f"{API_BASE}/analysis", json=payload, headers=headers, timeout=15)
-            if r.status_code == 200:
-                analysis_out = r.json()
-                st.session_state.last_analysis = analysis_out
+            # float32 crudo (4 B/muestra) en vez de JSON: sin parseo por elemento en el backend
+            headers["Content-Type"] = "application/octet-stream"
+            params = {"fs": fs_val, "dtype": "float32", "persist": "true", "per_beat": str(per_beat).lower()}
+            body = np.asarray(sig_list, dtype="<f4").tobytes()
+            # Job asíncrono: los registros largos no agotan el timeout de la petición
+            r = requests.post(f"{API_BASE}/analysis/jobs", data=body, params=params, headers=headers, timeout=15)
+            if r.status_code == 202:
+                job_url = f"{API_BASE}/analysis/jobs/{r.json()['job_id']}"
+                job = {"status": "queued"}
+                with st.spinner("Analizando señal..."):
+                    deadline = time.time() + 600
+                    while job.get("status") in ("queued", "running") and time.time() < deadline:
+                        time.sleep(0.5)
+                        job = requests.get(job_url, headers=headers, timeout=10).json()
+                if job.get("status") == "done":
+                    analysis_out = job["result"]
+                    st.session_state.last_analysis = analysis_out
+                else:
+                    st.error(f"El análisis no terminó: {job.get('error') or job.get('status')}")
+            elif r.status_code == 503:
+                st.warning(f"Servidor ocupado; reintenta en {r.headers.get('Retry-After', 'unos')} s.")
             else:
                 st.error(f"Error del backend: {r.status_code} {r.text}")
         except Exception as e:
@@ -720,6 +762,16 @@ if analysis_out:
     else:
         st.write("Sin puntuaciones")
 
+    beats = analysis_out.get('beats')
+    if beats and beats.get('n_beats'):
+        st.subheader("Clasificación por latido")
+        st.write(f"Latidos clasificados: {beats['n_beats']}")
+        st.dataframe(pd.DataFrame({"latidos": beats.get('counts', {}), "carga (%)": beats.get('burden_pct', {})}))
+        if beats.get('abnormal_indices'):
+            st.write("Latidos anormales (índice de latido → clase): " + ", ".join(
+                f"{i}→{lab}" for i, lab in zip(beats['abnormal_indices'][:50], beats.get('abnormal_labels', [])[:50])
+            ))
+
     st.subheader("Modelo ECG2HRV (Hugging Face)")
     hf_model = analysis_out.get('hf_model') or {}
     if hf_model.get('ok') is True:
@@ -3,22 +3,33 @@ import websocket
 import threading
 import json
 import os
+from ecg_api.streaming import decode_frame
 
 st.title("ECG en tiempo real (WebSocket)")
 
 data_points = st.session_state.get("data_points", [])
 
 def on_message(ws, message):
-    data = json.loads(message)
-    data_points.append(data["voltage_mV"])
+    if isinstance(message, bytes):
+        # Trama binaria: N muestras por mensaje
+        _, samples = decode_frame(message)
+        data_points.extend(samples.tolist())
+    else:
+        data = json.loads(message)
+        if "voltage_mV" not in data:
+            return  # mensaje 'hello' con la descripción del formato
+        data_points.append(data["voltage_mV"])
     st.session_state.data_points = data_points[-250:]  # Mantén los últimos 10s si fs=25Hz
 
 def run_ws():
     ws_url = os.getenv("WS_URL", "ws://localhost:8000/ws/ecg")
+    # Pedir tramas binarias int16 (una trama cada ~200 ms en lugar de un JSON por muestra)
+    sep = "&" if "?" in ws_url else "?"
+    ws_url = f"{ws_url}{sep}format=binary&dtype=int16&batch=50&interval_ms=200"
     ws = websocket.WebSocketApp(ws_url, on_message=on_message)
     ws.run_forever()
 
 if st.button("Iniciar stream"):
     threading.Thread(target=run_ws, daemon=True).start()
 
-st.line_chart(st.session_state.get("data_points", []))
\ No newline at end of file
+st.line_chart(st.session_state.get("data_points", []))
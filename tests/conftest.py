@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+
+# Base, modelo, índice y caché en un directorio temporal: nada del árbol ni de ecg.db.
+# Debe correr antes de importar ecg_storage/ecg_api (leen el entorno al importarse).
+_TMP = tempfile.mkdtemp(prefix="ecg-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TMP}/test.db")
+os.environ.setdefault("ECG_CLASSIFIER_PATH", os.path.join(_TMP, "ecg_classifier.npz"))
+os.environ.setdefault("ECG_SIMILARITY_DIR", os.path.join(_TMP, "similarity_index"))
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("ECG_WARMUP", "")
+os.environ.setdefault("STREAMS_LIVE", "1")
+
+import jwt  # noqa: E402
+import pytest  # noqa: E402
+
+
+def make_token(sub: str = "doc", uid=1, role: str = "doctor") -> str:
+    from ecg_api.auth import AUTH_ALGO, AUTH_SECRET
+    return jwt.encode({"sub": sub, "uid": uid, "role": role, "exp": int(time.time()) + 600}, AUTH_SECRET, algorithm=AUTH_ALGO)
+
+
+def auth(sub: str = "doc", uid=1, role: str = "doctor") -> dict:
+    return {"Authorization": f"Bearer {make_token(sub, uid, role)}"}
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from ecg_api.main import app
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    import ecg_storage.models  # noqa: F401
+    from ecg_storage.db import SessionLocal, init_db
+    init_db()
+    s = SessionLocal()
+    try:
+        yield s
+    finally:
+        s.close()
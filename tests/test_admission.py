@@ -0,0 +1,161 @@
+import asyncio
+import re
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from ecg_api.admission import AdmissionController, AdmissionMiddleware, Gate
+
+
+def _app(gate: Gate, release: asyncio.Event = None):
+    async def heavy(request):
+        if release is not None:
+            await release.wait()
+        return JSONResponse({"ok": True})
+
+    async def stream(ws):
+        await ws.accept()
+        await ws.receive_text()
+        await ws.close()
+
+    app = Starlette(routes=[Route("/heavy", heavy, methods=["POST"]), WebSocketRoute("/ws", stream)])
+    kind = "websocket" if gate.name == "stream" else "http"
+    pattern = "/ws" if kind == "websocket" else "POST /heavy"
+    return AdmissionMiddleware(app, AdmissionController([(gate, kind, [re.compile(f"^{pattern}$")])]))
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def _until(cond):
+    for _ in range(200):
+        if cond():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+def test_queue_full_is_503_with_retry_after():
+    async def run():
+        gate, release = Gate("analysis", limit=1, queue=1, wait_s=5.0), asyncio.Event()
+        async with _client(_app(gate, release)) as c:
+            first = asyncio.create_task(c.post("/heavy"))
+            await _until(lambda: gate.active == 1)
+            queued = asyncio.create_task(c.post("/heavy"))
+            await _until(lambda: gate.waiting == 1)
+            shed = await c.post("/heavy")
+            release.set()
+            assert [(await t).status_code for t in (first, queued)] == [200, 200]
+        return gate, shed
+
+    gate, shed = asyncio.run(run())
+    assert shed.status_code == 503
+    assert int(shed.headers["Retry-After"]) >= 1
+    assert shed.headers["X-Shed-Reason"] == "queue_full" and shed.json()["route_class"] == "analysis"
+    assert (gate.active, gate.waiting, gate.admitted, gate.shed["queue_full"]) == (0, 0, 2, 1)
+
+
+def test_wait_past_deadline_is_503_timeout():
+    async def run():
+        gate, release = Gate("analysis", limit=1, queue=4, wait_s=0.05), asyncio.Event()
+        async with _client(_app(gate, release)) as c:
+            first = asyncio.create_task(c.post("/heavy"))
+            await _until(lambda: gate.active == 1)
+            late = await c.post("/heavy")
+            release.set()
+            assert (await first).status_code == 200
+        return gate, late
+
+    gate, late = asyncio.run(run())
+    assert late.status_code == 503 and late.headers["X-Shed-Reason"] == "timeout"
+    assert "Retry-After" in late.headers
+    assert (gate.active, gate.waiting, gate.shed["timeout"]) == (0, 0, 1)
+
+
+def test_waiter_cancelled_after_handoff_does_not_leak_the_slot():
+    async def run():
+        gate = Gate("analysis", limit=1, queue=4, wait_s=5.0)
+        assert await gate.acquire() is None
+        a = asyncio.create_task(gate.acquire())
+        b = asyncio.create_task(gate.acquire())
+        await _until(lambda: gate.waiting == 2)
+        # release() entrega el cupo a `a` (active no baja) y `a` se cancela antes de correr
+        gate.release(0.1)
+        a.cancel()
+        try:
+            got = await a
+        except asyncio.CancelledError:
+            pass  # devolvió el cupo que no usó: pasa a `b`
+        else:
+            # wait_for de 3.11 prefiere el resultado ya listo a la cancelación: `a` tiene el cupo
+            assert got is None
+            gate.release(0.1)
+        assert await b is None
+        assert gate.active == 1
+        gate.release(0.1)
+        return gate
+
+    gate = asyncio.run(run())
+    assert (gate.active, gate.waiting) == (0, 0)
+
+
+def test_cancellation_racing_the_handoff_passes_the_slot_on(monkeypatch):
+    async def handed_then_cancelled(fut, timeout):
+        # La cancelación llega justo después de que release() resolvió el futuro
+        await fut
+        raise asyncio.CancelledError
+
+    async def run():
+        gate = Gate("analysis", limit=1, queue=4, wait_s=5.0)
+        assert await gate.acquire() is None
+        real_wait_for = asyncio.wait_for
+        monkeypatch.setattr(asyncio, "wait_for", handed_then_cancelled)
+        a = asyncio.create_task(gate.acquire())
+        await _until(lambda: gate.waiting == 1)
+        monkeypatch.setattr(asyncio, "wait_for", real_wait_for)
+        b = asyncio.create_task(gate.acquire())
+        await _until(lambda: gate.waiting == 2)
+        gate.release(0.1)
+        with pytest.raises(asyncio.CancelledError):
+            await a
+        assert await b is None
+        assert (gate.active, gate.waiting) == (1, 0)
+        gate.release(0.1)
+        return gate
+
+    assert asyncio.run(run()).active == 0
+
+
+def test_waiter_cancelled_while_queued_leaves_the_queue():
+    async def run():
+        gate = Gate("analysis", limit=1, queue=4, wait_s=5.0)
+        assert await gate.acquire() is None
+        a = asyncio.create_task(gate.acquire())
+        await _until(lambda: gate.waiting == 1)
+        a.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await a
+        assert gate.waiting == 0
+        gate.release(0.1)
+        return gate
+
+    gate = asyncio.run(run())
+    assert (gate.active, gate.waiting) == (0, 0)
+
+
+def test_websocket_over_limit_is_closed_with_1013():
+    gate = Gate("stream", limit=1)
+    with TestClient(_app(gate)) as c:
+        with c.websocket_connect("/ws") as held:
+            with c.websocket_connect("/ws") as ws:
+                with pytest.raises(WebSocketDisconnect) as e:
+                    ws.receive_text()
+            assert e.value.code == 1013 and "retry after" in e.value.reason
+            held.send_text("bye")
+    assert gate.active == 0 and gate.shed["queue_full"] == 1
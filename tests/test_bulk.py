@@ -0,0 +1,53 @@
+import datetime
+
+import numpy as np
+
+from ecg_storage.bulk import _copy_buffer, beat_times, event_rows, insert_events
+from ecg_storage.db import Event
+
+
+def test_copy_buffer_keeps_empty_strings_apart_from_null():
+    table = Event.__table__
+    cols = ["timestamp", "rr_ms", "source", "extras"]
+    rows = [
+        {"timestamp": datetime.datetime(2024, 1, 2, 3, 4, 5, 600000), "rr_ms": 812.5, "source": "", "extras": {"a": 'say "x"'}},
+        {"timestamp": None, "rr_ms": np.float64("nan"), "source": None, "extras": None},
+        {"timestamp": datetime.datetime(2024, 1, 2), "rr_ms": 1, "source": "a,b\\N", "extras": [True]},
+    ]
+    assert _copy_buffer(table, cols, rows).getvalue() == (
+        '"2024-01-02T03:04:05.600000","812.5","","{""a"": ""say \\""x\\""""}"\n'
+        '\\N,"nan",\\N,\\N\n'
+        # Un texto que contiene \N va entre comillas: COPY no lo toma como NULL
+        '"2024-01-02T00:00:00","1","a,b\\N","[true]"\n'
+    )
+
+
+def test_copy_buffer_formats_bools_and_bytes():
+    from sqlalchemy import Boolean, Column, Integer, LargeBinary, MetaData, Table
+    t = Table("t", MetaData(), Column("id", Integer, primary_key=True), Column("ok", Boolean), Column("blob", LargeBinary))
+    assert _copy_buffer(t, ["ok", "blob"], [{"ok": np.bool_(True), "blob": b"\x01\xff"}, {"ok": False}]).getvalue() == \
+        '"true","\\x01ff"\n"false",\\N\n'
+
+
+def test_executemany_path_round_trips(db):
+    rows = event_rows(np.array([800.0, 750.0]), np.array([0, 200, 388]), 250, datetime.datetime(2024, 5, 1), source="bulk-test")
+    rows[0]["source"] = ""
+    stats = insert_events(db, rows, chunk_size=1)
+    assert stats["rows"] == 2 and stats["method"] == "executemany"
+    got = db.query(Event).filter(Event.timestamp >= datetime.datetime(2024, 5, 1), Event.timestamp < datetime.datetime(2024, 5, 2)).order_by(Event.timestamp).all()
+    assert [(e.source, e.rr_ms, e.timestamp) for e in got] == [
+        ("", 800.0, datetime.datetime(2024, 5, 1, 0, 0, 0, 800000)),
+        ("bulk-test", 750.0, datetime.datetime(2024, 5, 1, 0, 0, 1, 552000)),
+    ]
+    assert insert_events(db, [])["rows"] == 0
+
+
+def test_beat_times():
+    start = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=-3)))
+    assert beat_times(np.array([0, 125]), 250, start) == [datetime.datetime(2024, 1, 1, 15, 0), datetime.datetime(2024, 1, 1, 15, 0, 0, 500000)]
+    before = datetime.datetime.utcnow()
+    times = beat_times(np.array([0, 2500]), 250, n_samples=5000)
+    # Sin start_time la señal termina "ahora": el primer pico fue hace 20 s
+    assert abs((before - times[0]).total_seconds() - 20) < 1
+    assert (times[1] - times[0]) == datetime.timedelta(seconds=10)
+    assert beat_times(np.array([], dtype=int), 250) == []
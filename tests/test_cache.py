@@ -0,0 +1,72 @@
+import datetime
+
+import numpy as np
+
+from conftest import auth
+from ecg_api.cache import AnalysisCache
+
+
+def _ecg(fs=250, seconds=10, hr=72):
+    t = np.arange(int(fs * seconds)) / fs
+    phase = (t * hr / 60.0) % 1.0
+    return (np.exp(-((phase - 0.5) ** 2) / 0.0004) + 0.01 * np.sin(2 * np.pi * 0.3 * t)).astype(np.float32)
+
+
+def _out(n=1):
+    return {"result": {"hr": n}, "features": np.zeros(8, dtype=np.float32), "r_peaks": np.arange(n, dtype=np.int64)}
+
+
+def test_key_depends_on_samples_fs_and_per_beat():
+    x = _ecg()
+    k = AnalysisCache.key(x.astype(np.float64), 250, False)
+    assert k == AnalysisCache.key(x.astype(np.float64), 250.0, False)
+    assert k != AnalysisCache.key(x.astype(np.float64), 360, False)
+    assert k != AnalysisCache.key(x.astype(np.float64), 250, True)
+
+
+def test_persist_scope_separates_owner_and_start_time():
+    t = datetime.datetime(2024, 1, 1, 8, 0)
+    assert AnalysisCache.persist_scope(1, None) == AnalysisCache.persist_scope(1, None)
+    assert AnalysisCache.persist_scope(1, None) != AnalysisCache.persist_scope(2, None)
+    assert AnalysisCache.persist_scope(1, t) != AnalysisCache.persist_scope(1, None)
+    assert AnalysisCache.persist_scope(1, t) != AnalysisCache.persist_scope(1, t + datetime.timedelta(seconds=1))
+
+
+def test_analysis_ids_survive_the_disk_tier(tmp_path):
+    c = AnalysisCache(max_mb=1, disk_dir=str(tmp_path))
+    c.put("k", _out())
+    scope = c.persist_scope(1, None)
+    c.set_analysis_id("k", scope, 42)
+    cold = AnalysisCache(max_mb=1, disk_dir=str(tmp_path))
+    out = cold.get("k")
+    assert c.analysis_id(out, scope) == 42
+    assert c.analysis_id(out, c.persist_scope(2, None)) is None
+
+
+def test_memory_tier_evicts_oldest(monkeypatch):
+    c = AnalysisCache(max_mb=0, disk_dir=None)
+    c.put("a", _out())
+    assert c.get("a") is None
+    monkeypatch.setattr("ecg_api.cache._entry_size", lambda out: 300 * 1024)
+    c = AnalysisCache(max_mb=1, disk_dir=None)
+    for k in "abc":
+        c.put(k, _out())
+    c.get("a")
+    c.put("d", _out())
+    assert c.get("b") is None and c.get("a") is not None
+    assert c.stats()["evictions"] >= 1
+
+
+def test_resubmitting_a_window_reuses_the_persisted_analysis(client):
+    body = _ecg().tobytes()
+    params = {"fs": 250, "dtype": "float32", "persist": "true"}
+    headers = {**auth(uid=11), "Content-Type": "application/octet-stream"}
+    first = client.post("/analysis", content=body, params=params, headers=headers)
+    assert first.status_code == 200, first.text
+    again = client.post("/analysis", content=body, params=params, headers=headers)
+    assert again.headers["X-Analysis-Cache"] == "hit"
+    assert again.json()["analysis_id"] == first.json()["analysis_id"]
+    # Otro médico con la misma señal tiene su propio análisis
+    other = client.post("/analysis", content=body, params=params,
+                        headers={**auth(uid=12), "Content-Type": "application/octet-stream"})
+    assert other.json()["analysis_id"] != first.json()["analysis_id"]
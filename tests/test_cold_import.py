@@ -0,0 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+
+from ecg_api import startup_profile
+
+# Presupuesto de `import ecg_api.main` en frío (mediana); ~0.9 s en un núcleo.
+# ECG_IMPORT_BUDGET_MS lo ajusta para máquinas más lentas.
+BUDGET_MS = os.getenv("ECG_IMPORT_BUDGET_MS", "2000")
+
+# Dependencias pesadas que sólo deben cargarse en el primer uso
+HEAVY = ("scipy", "passlib", "twilio", "reportlab", "huggingface_hub", "joblib")
+
+
+def test_cold_import_within_budget():
+    assert startup_profile.main(["--budget-ms", BUDGET_MS, "--repeat", "3", "--top", "0"]) == 0
+
+
+def test_cold_import_defers_heavy_dependencies():
+    code = f"import json, sys, ecg_api.main; print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          env={**os.environ, "HF_HUB_OFFLINE": "1"}, check=True)
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from ecg_ml.datasets import load_csv, load_csv_frame
+
+
+def test_long_recording_keeps_sample_timing(tmp_path):
+    # 1 h a 500 Hz: en float32 los segundos desde t0 (> 2048 s) se redondean a múltiplos de 244 µs
+    fs, n = 500.0, 3600 * 500
+    t0 = pd.Timestamp("2024-01-01T00:00:00Z")
+    ts = t0 + pd.to_timedelta(np.arange(n) / fs, unit="s")
+    epoch = t0.timestamp() + np.arange(n) / fs
+    v = np.sin(np.arange(n) / 50.0)
+    path = tmp_path / "long.csv"
+    pd.DataFrame({
+        "timestamp_utc": ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "epoch_s": epoch,
+        "voltage_mV": v,
+    }).to_csv(path, index=False)
+
+    arrays, meta = load_csv(str(path))
+    assert meta["columns"] == ["voltage_mV"]
+    assert set(meta["f64_columns"]) == {"timestamp_utc", "epoch_s"}
+
+    df = load_csv_frame(str(path))
+    assert list(df.columns) == ["timestamp_utc", "epoch_s", "voltage_mV"]
+    dt = df["timestamp_utc"].diff().dt.total_seconds().to_numpy()[1:]
+    assert abs(1.0 / np.median(dt) - fs) < 1e-6
+    assert np.allclose(dt[-1000:], 1.0 / fs, rtol=0, atol=1e-6)
+    # float64 resuelve ~0.24 µs en un epoch actual
+    assert abs(1.0 / np.median(np.diff(df["epoch_s"].to_numpy())) - fs) < 0.1
+    assert np.unique(df["epoch_s"].to_numpy()).size == n
+
+    # Segunda carga: desde el caché memory-mapped, mismos valores
+    again, _ = load_csv(str(path))
+    assert isinstance(again["f64"], np.memmap)
+    np.testing.assert_array_equal(again["f64"], arrays["f64"])
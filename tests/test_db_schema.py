@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+# El motor se crea al importar ecg_storage.db: cada caso corre en su propio proceso
+CHECK = """
+import ecg_storage.models
+from ecg_storage import db
+try:
+    db.init_db()
+    print("ok", len(db._missing_columns()))
+except RuntimeError as e:
+    print("error", e)
+"""
+
+
+def _old_db(path):
+    # analysis_results de antes de las columnas de métricas
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE analysis_results (id INTEGER NOT NULL PRIMARY KEY, timestamp DATETIME NOT NULL, "
+                     "source VARCHAR(64), hrv JSON, ml JSON, quality JSON, extras JSON, feedback JSON)")
+        conn.execute("INSERT INTO analysis_results (timestamp, source, hrv) VALUES ('2024-01-01 00:00:00', 'old', '{\"time\": {\"SDNN\": 50.0}}')")
+
+
+def _init(path, migrate):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "ECG_DB_MIGRATE": migrate}
+    out = subprocess.run([sys.executable, "-c", CHECK], env=env, capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def test_sqlite_is_migrated_at_startup(tmp_path):
+    path = tmp_path / "old.db"
+    _old_db(path)
+    assert _init(path, "") == "ok 0"
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT sdnn FROM analysis_results").fetchone() == (50.0,)
+
+
+def test_outdated_schema_fails_with_migrate_hint(tmp_path):
+    path = tmp_path / "old.db"
+    _old_db(path)
+    line = _init(path, "0")
+    assert line.startswith("error") and "analysis_results.sdnn" in line and "ecg_storage.migrate" in line
@@ -0,0 +1,82 @@
+import datetime
+
+import numpy as np
+
+from ecg_ml.classifier import ECGClassifier
+from ecg_ml.features import FEATURE_DIM, from_blobs, to_blob
+
+
+def _separable(n, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.where(np.arange(n) % 2 == 0, "normal", "afib")
+    X = rng.normal(size=(n, FEATURE_DIM)).astype(np.float32)
+    X[:, 0] += np.where(y == "afib", 4.0, -4.0)
+    return X, y
+
+
+def test_blob_round_trip():
+    X = np.random.default_rng(1).normal(size=(5, FEATURE_DIM)).astype(np.float32)
+    blobs = [to_blob(v) for v in X]
+    assert all(len(b) == 4 * FEATURE_DIM for b in blobs)
+    np.testing.assert_array_equal(from_blobs(blobs), X)
+    assert from_blobs([]).shape == (0, FEATURE_DIM)
+
+
+def test_partial_fit_learns_and_skips_unknown_labels():
+    X, y = _separable(400)
+    clf = ECGClassifier()
+    assert not clf.is_trained
+    stats = clf.partial_fit(X, y, epochs=5)
+    assert stats == {"used": 400, "skipped": 0}
+    assert clf.is_trained
+    pred = np.asarray(clf.labels)[clf.predict_proba_features(X).argmax(axis=1)]
+    assert (pred == y).mean() > 0.95
+    assert clf.partial_fit(X[:3], ["bogus"] * 3) == {"used": 0, "skipped": 3}
+
+
+def test_save_load_keeps_weights(tmp_path):
+    X, y = _separable(100)
+    clf = ECGClassifier()
+    clf.partial_fit(X, y)
+    clf.trained_until = "2024-01-01T00:00:00"
+    path = str(tmp_path / "clf.npz")
+    clf.save(path)
+    other = ECGClassifier()
+    other.load(path)
+    np.testing.assert_allclose(other.predict_proba_features(X), clf.predict_proba_features(X))
+    assert other.trained_until == clf.trained_until and other.n_seen == clf.n_seen
+
+
+def test_retrain_consumes_feedback_incrementally(db, tmp_path):
+    from ecg_ml import classifier
+    from ecg_ml.retrain import retrain
+    from ecg_storage.db import AnalysisFeature, AnalysisResult
+    from ecg_storage.feature_store import save_features, set_label
+
+    db.query(AnalysisFeature).delete()
+    db.commit()
+    X, y = _separable(40)
+    base = datetime.datetime(2024, 1, 1)
+    for v, lab in zip(X, y):
+        row = AnalysisResult(source="test")
+        db.add(row)
+        db.flush()
+        save_features(db, row.id, v)
+        db.flush()
+        assert set_label(db, row.id, lab.upper())
+    db.commit()
+    for i, f in enumerate(db.query(AnalysisFeature).order_by(AnalysisFeature.analysis_id)):
+        f.labelled_at = base + datetime.timedelta(minutes=i)
+    db.commit()
+
+    live = classifier.get_classifier()
+    seen = live.n_seen
+    path = str(tmp_path / "retrained.npz")
+    first = retrain(full=True, epochs=3, path=path)
+    assert first["used"] == 40
+    assert first["trained_until"] == (base + datetime.timedelta(minutes=39)).isoformat()
+    # El singleton que usa /analysis no se toca: se entrena una copia
+    assert live.n_seen == seen
+
+    # Sin feedback nuevo no hay nada que consumir
+    assert retrain(path=path)["used"] == 0
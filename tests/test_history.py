@@ -0,0 +1,75 @@
+import datetime
+import json
+
+import numpy as np
+import pytest
+
+from conftest import auth
+from ecg_storage import history
+from ecg_storage.bulk import event_rows, insert_events
+from ecg_storage.db import Event
+
+START = datetime.datetime(2023, 3, 1)
+
+
+@pytest.fixture
+def events(db):
+    db.query(Event).filter(Event.source == "history-test").delete()
+    db.commit()
+    # 7 eventos; dos comparten timestamp (el id desempata)
+    rows = event_rows(np.full(6, 800.0), np.arange(7) * 200, 250, START, source="history-test")
+    rows.append(dict(rows[1], rr_ms=801.0))
+    insert_events(db, rows)
+    return 7
+
+
+def _pages(client, **params):
+    ids, cursor = [], None
+    while True:
+        r = client.get("/events", params={**params, **({"cursor": cursor} if cursor else {})}, headers=auth())
+        assert r.status_code == 200, r.text
+        ids.append([e["id"] for e in r.json()])
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_cursor_pages_cover_every_row_once(client, events):
+    for order in ("desc", "asc"):
+        pages = _pages(client, source="history-test", limit=3, order=order)
+        flat = [i for p in pages for i in p]
+        assert [len(p) for p in pages] == [3, 3, 1]
+        assert len(flat) == len(set(flat)) == events
+
+
+def test_keyset_order_breaks_timestamp_ties_by_id(client, events):
+    rows = client.get("/events", params={"source": "history-test", "order": "asc", "limit": 50}, headers=auth()).json()
+    keys = [(r["timestamp"], r["id"]) for r in rows]
+    assert keys == sorted(keys)
+    assert len({r["timestamp"] for r in rows}) == events - 1
+
+
+def test_range_is_half_open(client, events):
+    until = (START + datetime.timedelta(seconds=2.4)).isoformat()
+    rows = client.get("/events", params={"source": "history-test", "since": START.isoformat(), "until": until, "limit": 50},
+                      headers=auth()).json()
+    # Picos en 0.8, 1.6, 1.6, 2.4 s: 2.4 queda afuera
+    assert len(rows) == 3
+
+
+def test_ndjson_export_matches_json(client, events):
+    r = client.get("/events", params={"source": "history-test", "format": "ndjson", "order": "asc"}, headers=auth())
+    assert r.status_code == 200
+    lines = [json.loads(x) for x in r.text.splitlines() if x]
+    assert len(lines) == events
+
+
+def test_invalid_cursor_and_order_are_400(client):
+    assert client.get("/events", params={"cursor": "not-a-cursor"}, headers=auth()).status_code == 400
+    assert client.get("/events", params={"cursor": "!!", "format": "csv"}, headers=auth()).status_code == 400
+    assert client.get("/events", params={"order": "up"}, headers=auth()).status_code == 400
+
+
+def test_cursor_round_trip():
+    ts = datetime.datetime(2024, 1, 2, 3, 4, 5, 6)
+    assert history.decode_cursor(history.encode_cursor(ts, 42)) == (ts, 42)
@@ -0,0 +1,71 @@
+import datetime
+import time
+
+import numpy as np
+
+from conftest import auth
+from ecg_api.streaming import FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION
+
+FS = 250.0
+N = 250
+T0 = 1_700_000_000.0
+
+
+def _frame(seq, t0=None, n=N, fs=FS):
+    t0 = T0 + seq * n / fs if t0 is None else t0
+    counts = (np.sin(np.arange(seq * n, (seq + 1) * n) / 10.0) * 1000).astype("<i2")
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 1, n, seq, t0, fs, 0.001) + counts.tobytes()
+
+
+def _post(client, device, body, token_device=None):
+    headers = {**auth(sub=token_device or device, uid=None, role="device"), "Content-Type": "application/octet-stream"}
+    return client.post(f"/ingest/{device}", content=body, headers=headers)
+
+
+def test_retrying_the_same_body_stores_nothing_twice(client):
+    body = b"".join(_frame(s) for s in range(3))
+    first = _post(client, "dev-retry", body)
+    assert first.status_code == 200, first.text
+    assert (first.json()["frames"], first.json()["stored"], first.json()["duplicates"]) == (3, 3, 0)
+    again = _post(client, "dev-retry", body).json()
+    assert again["duplicates"] == again["frames"] == 3 and again["stored"] == 0
+    assert again["t_end"] == T0 + 3 * N / FS
+
+    since = datetime.datetime.fromtimestamp(T0, datetime.timezone.utc)
+    r = client.get("/ingest/dev-retry/samples", params={"since": since.isoformat(), "until": (since + datetime.timedelta(seconds=10)).isoformat()},
+                   headers=auth())
+    segs = r.json()["segments"]
+    assert len(segs) == 1 and segs[0]["n_raw"] == 3 * N
+
+
+def test_partially_overlapping_body_stores_only_new_frames(client):
+    assert _post(client, "dev-overlap", b"".join(_frame(s) for s in range(3))).json()["stored"] == 3
+    out = _post(client, "dev-overlap", b"".join(_frame(s) for s in range(1, 5))).json()
+    assert (out["frames"], out["stored"], out["duplicates"], out["last_seq"]) == (4, 2, 2, 4)
+
+
+def test_same_seq_and_t0_on_another_device_is_not_a_duplicate(client):
+    body = _frame(0)
+    assert _post(client, "dev-a", body).json()["stored"] == 1
+    assert _post(client, "dev-b", body).json()["stored"] == 1
+
+
+def test_frames_without_t0_are_rejected(client):
+    r = _post(client, "dev-clockless", _frame(0) + _frame(1, t0=0.0))
+    assert r.status_code == 422
+    assert "t0" in r.json()["detail"]
+    r = client.post("/ingest/dev-clockless", json=[{"seq": 1, "fs": FS, "v": [1.0, 2.0]}], headers=auth(sub="dev-clockless", role="device"))
+    assert r.status_code == 422
+
+
+def test_device_token_cannot_post_for_another_device(client):
+    assert _post(client, "dev-victim", _frame(0), token_device="dev-attacker").status_code == 403
+    # Un médico no es un dispositivo; admin sí puede enviar por cualquiera
+    assert client.post("/ingest/dev-victim", content=_frame(0), headers=auth()).status_code == 403
+    r = client.post("/ingest/dev-victim", content=_frame(0, t0=time.time()), headers={**auth(sub="root", role="admin"), "Content-Type": "application/octet-stream"})
+    assert r.status_code == 200
+
+
+def test_malformed_bodies_are_400(client):
+    assert _post(client, "dev-bad", _frame(0)[:-3]).status_code == 400
+    assert _post(client, "dev-bad", b"nope").status_code == 400
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from conftest import auth, make_token
+from ecg_api.jobs import analysis_jobs
+
+
+def _ecg(fs=250, seconds=8, hr=66):
+    t = np.arange(int(fs * seconds)) / fs
+    return np.exp(-((((t * hr / 60.0) % 1.0) - 0.5) ** 2) / 0.0004).astype("<f4")
+
+
+def _wait(client, job_id, uid):
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        job = client.get(f"/analysis/jobs/{job_id}", headers=auth(uid=uid)).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError("job did not finish")
+
+
+def test_jobs_are_visible_only_to_their_owner(client):
+    r = client.post("/analysis/jobs", content=_ecg().tobytes(), params={"fs": 250, "dtype": "float32"},
+                    headers={**auth(uid=31), "Content-Type": "application/octet-stream"})
+    assert r.status_code == 202, r.text
+    job_id = r.json()["job_id"]
+    assert client.get(f"/analysis/jobs/{job_id}", headers=auth(uid=32)).status_code == 404
+    assert client.get(f"/analysis/jobs/{job_id}", headers=auth(sub="root", uid=99, role="admin")).status_code == 200
+    job = _wait(client, job_id, 31)
+    assert job["status"] == "done" and "hrv" in job["result"]
+
+
+def test_cache_hit_jobs_keep_the_owner(client):
+    body = _ecg(hr=70).tobytes()
+    params = {"fs": 250, "dtype": "float32"}
+    headers = {**auth(uid=33), "Content-Type": "application/octet-stream"}
+    _wait(client, client.post("/analysis/jobs", content=body, params=params, headers=headers).json()["job_id"], 33)
+    hit = client.post("/analysis/jobs", content=body, params=params, headers=headers).json()
+    assert hit["cache"] == "hit"
+    assert client.get(f"/analysis/jobs/{hit['job_id']}", headers=auth(uid=34)).status_code == 404
+    assert client.get(f"/analysis/jobs/{hit['job_id']}", headers=auth(uid=33)).json()["status"] == "done"
+
+
+def test_job_websocket_checks_the_owner(client):
+    job = analysis_jobs.completed({"ok": True}, owner=35)
+    with client.websocket_connect(f"/ws/analysis/jobs/{job.id}?token={make_token(uid=36)}") as ws:
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 4404
+    with client.websocket_connect(f"/ws/analysis/jobs/{job.id}?token={make_token(uid=35)}") as ws:
+        assert ws.receive_json()["result"] == {"ok": True}
+    with client.websocket_connect(f"/ws/analysis/jobs/{job.id}") as ws:
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 4401
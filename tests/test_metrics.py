@@ -0,0 +1,30 @@
+from ecg_api import metrics
+
+
+def _families(text):
+    return {line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")}
+
+
+def test_model_family_is_scraped_once_the_classifier_loads(client):
+    from ecg_ml.classifier import get_classifier
+    get_classifier()
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert "ecg_model_classifier_loaded 1" in r.text
+    assert "ecg_model_classifier_trained" in _families(r.text)
+    assert 'ecg_metrics_collector_errors_total{collector="ecg_model"}' not in r.text
+
+
+def test_failing_collector_is_logged_and_counted(caplog):
+    reg = metrics.Registry()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    metrics.StatsCollector("ecg_test_broken", broken, registry=reg)
+    metrics.StatsCollector("ecg_test_ok", lambda: {"n": 2, "flag": True}, registry=reg)
+    text = reg.render()
+    assert "ecg_test_ok_n 2" in text and "ecg_test_ok_flag 1" in text
+    assert "ecg_test_broken" not in text
+    assert any("ecg_test_broken" in r.getMessage() for r in caplog.records)
+    assert 'ecg_metrics_collector_errors_total{collector="ecg_test_broken"} 1' in metrics.REGISTRY.render()
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from ecg_notify.dispatcher import Dispatcher, Notification
+from ecg_notify.transports import FakeTransport
+
+
+@pytest.fixture
+def dispatcher():
+    d = Dispatcher({"whatsapp": FakeTransport("whatsapp"), "email": FakeTransport("email")},
+                   workers=1, dedup_s=60, rate_per_min=100, digest_s=60)
+    yield d
+    d.stop()
+
+
+def _sent(d, channel="whatsapp"):
+    return d.transports[channel].sent
+
+
+def _drain(d):
+    deadline = time.monotonic() + 5
+    while d._queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_same_key_is_deduplicated_per_recipient_and_channel(dispatcher):
+    n = Notification("whatsapp", "+5491100000000", "FA detectada", key="alert:afib")
+    assert dispatcher.submit(n)
+    assert not dispatcher.submit(Notification("whatsapp", "+5491100000000", "FA otra vez", key="alert:afib"))
+    assert dispatcher.submit(Notification("whatsapp", "+5491199999999", "FA detectada", key="alert:afib"))
+    assert dispatcher.submit(Notification("email", "doc@example.com", "FA detectada", key="alert:afib"))
+    assert dispatcher.submit(Notification("whatsapp", "+5491100000000", "Taquicardia", key="alert:tachy"))
+    # Sin clave no se deduplica
+    assert dispatcher.submit(Notification("whatsapp", "+5491100000000", "sin clave"))
+    assert dispatcher.submit(Notification("whatsapp", "+5491100000000", "sin clave"))
+    _drain(dispatcher)
+    assert dispatcher.metrics["deduped"] == 1
+    assert len(_sent(dispatcher)) == 5 and len(_sent(dispatcher, "email")) == 1
+
+
+def test_dedup_window_expires(dispatcher):
+    dispatcher.dedup_s = 0.05
+    n = Notification("whatsapp", "+5491100000000", "x", key="k")
+    assert dispatcher.submit(n) and not dispatcher.submit(n)
+    time.sleep(0.06)
+    assert dispatcher.submit(n)
+
+
+def test_digest_groups_per_recipient(dispatcher):
+    for i in range(3):
+        dispatcher.submit(Notification("whatsapp", "+5491100000000", f"evento {i}", digest=True))
+    dispatcher.submit(Notification("whatsapp", "+5491199999999", "solo", digest=True))
+    assert _sent(dispatcher) == []
+    dispatcher._flush_digests(force=True)
+    _drain(dispatcher)
+    bodies = {m["to"]: m["body"] for m in _sent(dispatcher)}
+    assert bodies["+5491100000000"].startswith("3 notificaciones") and "- evento 2" in bodies["+5491100000000"]
+    assert bodies["+5491199999999"] == "solo"
+    assert dispatcher.metrics["digested"] == 3
+
+
+def test_over_rate_limit_folds_into_digest(dispatcher):
+    dispatcher.rate_per_min = 2
+    for i in range(4):
+        dispatcher.submit(Notification("whatsapp", "+5491100000000", f"m{i}"))
+    _drain(dispatcher)
+    assert len(_sent(dispatcher)) == 2 and dispatcher.metrics["rate_limited"] == 2
+    assert len(dispatcher._digests[("whatsapp", "+5491100000000")]) == 2
+
+
+def test_unconfigured_channel_is_not_queued():
+    d = Dispatcher({"whatsapp": FakeTransport("whatsapp")}, workers=1)
+    assert not d.submit(Notification("email", "doc@example.com", "x"))
+    assert not d.submit(Notification("whatsapp", "", "x"))
+    assert d.metrics["submitted"] == 0
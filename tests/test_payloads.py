@@ -0,0 +1,36 @@
+import gzip
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from conftest import auth
+from ecg_api.payloads import _decompress, decode_signal
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b"3", b'"signal"', b"null"])
+def test_json_that_is_not_an_object_is_422(client, body):
+    r = client.post("/analysis", content=body, headers={**auth(), "Content-Type": "application/json"})
+    assert r.status_code == 422
+    assert r.json()["detail"][0]["loc"] == ["body"]
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"\xff\xfe{}"])
+def test_malformed_json_is_400(client, body):
+    r = client.post("/analysis", content=body, headers={**auth(), "Content-Type": "application/json"})
+    assert r.status_code == 400
+
+
+def test_missing_fields_are_422(client):
+    r = client.post("/analysis", json={"fs": 360}, headers=auth())
+    assert r.status_code == 422
+    assert ["body", "signal"] in [e["loc"] for e in r.json()["detail"]]
+
+
+def test_binary_bodies_decode():
+    x = np.arange(10, dtype="<i2")
+    np.testing.assert_array_equal(decode_signal(x.tobytes(), "application/octet-stream", "int16", 0.5), x * 0.5)
+    assert decode_signal(_decompress(gzip.compress(x.astype("<f4").tobytes()), "gzip"), "application/octet-stream").size == 10
+    with pytest.raises(HTTPException) as e:
+        decode_signal(b"\x00" * 3, "application/octet-stream", "float32")
+    assert e.value.status_code == 400
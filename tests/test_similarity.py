@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+
+from ecg_ml import similarity
+from ecg_ml.similarity import BEAT_LEN, BeatIndex
+
+
+def _beats(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, BEAT_LEN)
+    shift = rng.uniform(0.2, 0.8, size=(n, 1))
+    return (np.exp(-((t - shift) ** 2) / 0.002) + 0.05 * rng.normal(size=(n, BEAT_LEN))).astype(np.float32)
+
+
+def _index(n=400):
+    idx = BeatIndex(n_components=8)
+    X = _beats(n)
+    idx.fit_pca(X)
+    idx.add_embeddings(idx.embed(X), np.arange(n), np.zeros(n, dtype=np.int32), similarity.SRC_REFERENCE)
+    return idx
+
+
+def test_ivf_lists_grow_on_add_and_match_rebuild():
+    idx = _index()
+    idx.train_ivf(nlist=8)
+    for aid in range(1, 6):
+        idx.add_analysis(aid, _beats(30, seed=aid))
+    grown = [np.sort(idx._ivf_ids[c][: idx._ivf_len[c]]) for c in range(8)]
+    idx._build_ivf_lists()
+    assert all(np.array_equal(g, np.sort(idx._ivf_ids[c][: idx._ivf_len[c]])) for c, g in enumerate(grown))
+    assert int(idx._ivf_len.sum()) == idx.n
+
+    q = idx.query_vector(3, beat=0)
+    hits = idx.search(q, k=1, backend="ivf", nprobe=8)
+    assert (hits[0]["analysis_id"], hits[0]["beat"]) == (3, 0)
+
+
+def test_median_only_analyses_reject_beat():
+    idx = _index()
+    idx.add_analysis(7, _beats(1), median_only=True)
+    idx.add_analysis(8, _beats(4, seed=8))
+    assert idx.has_beats(7) is False and idx.has_beats(8) is True and idx.has_beats(9) is None
+    assert idx.query_vector(7, beat=0) is None
+    assert idx.query_vector(7) is not None
+    hit = idx.search(idx.query_vector(7), k=1)[0]
+    assert hit["analysis_id"] == 7 and hit["beat"] is None
+
+
+def test_maybe_save_writes_in_background(tmp_path, monkeypatch):
+    idx = _index()
+    monkeypatch.setattr(similarity, "SAVE_EVERY", 1)
+    release = threading.Event()
+    real_savez = np.savez
+
+    def slow_savez(*a, **kw):
+        release.wait(5)
+        return real_savez(*a, **kw)
+
+    monkeypatch.setattr(similarity.np, "savez", slow_savez)
+    idx.add_analysis(1, _beats(3))
+    idx.maybe_save(str(tmp_path))
+    # El guardado está bloqueado en disco: agregar y buscar no esperan
+    idx.add_analysis(2, _beats(3, seed=2))
+    assert len(idx.search(idx.query_vector(2), k=5)) == 5
+    release.set()
+    idx.flush(5)
+    loaded = BeatIndex.load(str(tmp_path))
+    # La instantánea se tomó antes de agregar el análisis 2
+    assert 1 in loaded._spans and 2 not in loaded._spans
+    assert idx._dirty_since_save == 3
+
+
+def test_similar_rejects_unknown_backend(client):
+    from conftest import auth
+    r = client.get("/doctor/similar/1", params={"backend": "faiss"}, headers=auth())
+    assert r.status_code == 422